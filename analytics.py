@@ -0,0 +1,200 @@
+# analytics.py - Buffered event tracking for funnel analytics, written to an append-only log
+import collections
+import functools
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+ACTIVE_LOG = 'events.jsonl'
+
+
+class EventTracker:
+    """
+    Collects events in an in-memory ring buffer; a background thread appends
+    them to `directory`/events.jsonl in batches every `flush_interval`
+    seconds. Once the log passes `rotate_bytes` it is renamed to a
+    timestamped segment and a new one is started. Segments are never
+    rewritten, only read.
+
+    emit() only appends a tuple to the buffer, so the handlers never wait on
+    disk. If the writer falls behind by more than `buffer_size` events the
+    oldest ones are dropped and counted rather than blocking the bot.
+
+    `state_names` maps conversation state values to the names written to the log.
+    """
+
+    def __init__(self, directory, state_names=None, buffer_size=10000, flush_interval=5.0, rotate_bytes=10 * 1024 * 1024):
+        self.directory = directory
+        self.state_names = state_names or {}
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.buffer = collections.deque(maxlen=buffer_size)
+        self.dropped = 0
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def emit(self, event, user_id=None, state=None):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append((time.time(), event, user_id, state))
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='analytics', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Analytics flush failed: {e}")
+
+    def flush(self):
+        """Appends everything buffered so far to the active log."""
+        with self._flush_lock:
+            lines = []
+            while self.buffer:
+                ts, event, user_id, state = self.buffer.popleft()
+                lines.append(json.dumps({'ts': round(ts, 3), 'event': event, 'user': user_id, 'state': state}) + '\n')
+            if self.dropped:
+                logger.warning(f"Analytics buffer overflowed, dropped {self.dropped} events")
+                self.dropped = 0
+            if not lines:
+                return
+            path = os.path.join(self.directory, ACTIVE_LOG)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+            if os.path.getsize(path) >= self.rotate_bytes:
+                segment = f"events-{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}.jsonl"
+                os.replace(path, os.path.join(self.directory, segment))
+                logger.info(f"Rotated analytics log to {segment}")
+
+    def stop(self):
+        """Stops the writer thread and flushes what is left in the buffer."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 1)
+            self._thread = None
+        if os.path.isdir(self.directory):
+            self.flush()
+
+
+def track(tracker, event):
+    """
+    Decorates a handler so each call emits `event` with the user's id and the
+    conversation state the handler moved to (None for plain commands).
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            try:
+                result = await handler(update, context)
+            except Exception:
+                tracker.emit(event, update.effective_user.id if update.effective_user else None, 'ERROR')
+                raise
+            tracker.emit(
+                event,
+                update.effective_user.id if update.effective_user else None,
+                tracker.state_names.get(result, result) if result is not None else None,
+            )
+            return result
+        return wrapper
+    return decorator
+
+
+# --- Funnel reader ---
+
+# Report flow steps, and the state each step's handler is answering. A step
+# counts as completed when its handler moved the conversation past that
+# state (e.g. an out-of-zone location returns LOCATION and does not count).
+FUNNEL_STEPS = [
+    ('start', None),
+    ('location', 'LOCATION'),
+    ('photo', 'PHOTO'),
+    ('description', 'DESCRIPTION'),
+    ('crash_time_delta', 'CRASH_TIME_DELTA'),
+    ('submit', 'CONFIRMATION'),
+]
+
+
+def read_events(directory, since=None):
+    """Yields logged events oldest first: rotated segments, then the active log."""
+    paths = sorted(glob.glob(os.path.join(directory, 'events-*.jsonl')))
+    paths.append(os.path.join(directory, ACTIVE_LOG))
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                if since is None or event['ts'] >= since:
+                    yield event
+
+
+def funnel(events):
+    """
+    Groups events into report sessions (each 'start' opens a new one for that
+    user) and counts how many sessions completed each step, plus how many
+    were canceled.
+    """
+    step_states = dict(FUNNEL_STEPS)
+    reached = {step: 0 for step, _ in FUNNEL_STEPS}
+    canceled = 0
+    sessions = {}
+    for event in events:
+        name, user = event['event'], event['user']
+        if name == 'start':
+            sessions[user] = {'start'}
+            reached['start'] += 1
+        elif name == 'cancel' and user in sessions:
+            canceled += 1
+            del sessions[user]
+        elif name in step_states and user in sessions:
+            session = sessions[user]
+            if name not in session and event['state'] not in (step_states[name], 'ERROR'):
+                session.add(name)
+                reached[name] += 1
+            if name == 'submit':
+                del sessions[user]
+    return reached, canceled
+
+
+def format_funnel(reached, canceled):
+    lines = []
+    previous = None
+    total = reached['start']
+    for step, _ in FUNNEL_STEPS:
+        count = reached[step]
+        of_total = f"{100 * count / total:5.1f}%" if total else "    -"
+        step_rate = f"{100 * count / previous:5.1f}%" if previous else "    -"
+        lines.append(f"{step:<18}{count:>8}  {of_total} of starts  {step_rate} of previous step")
+        previous = count
+    lines.append(f"{'canceled':<18}{canceled:>8}")
+    return "\n".join(lines)
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python analytics.py <analytics_dir> [since YYYY-MM-DD]")
+        sys.exit(1)
+    since = datetime.fromisoformat(sys.argv[2]).timestamp() if len(sys.argv) == 3 else None
+    reached, canceled = funnel(read_events(sys.argv[1], since))
+    print(format_funnel(reached, canceled))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# antiflood.py - Drops updates from users (or everyone) sending faster than allowed
+import logging
+import time
+from collections import OrderedDict, deque
+from telegram.ext import ApplicationHandlerStop
+from claims import ExpiringSet
+from metrics import updates_dropped
+from localization import STRINGS
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindowLimiter:
+    """
+    Allows at most `limit` hits per `window` seconds for each key, counted
+    over the exact last `window` seconds (a log of the last `limit` hit
+    times per key, so memory per key is bounded). Keys idle for a whole
+    window hold nothing worth keeping and are evicted, oldest first, as
+    are the least recently seen keys beyond `max_keys`.
+    """
+
+    def __init__(self, limit, window, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits = OrderedDict()  # key -> deque of hit times, least recently hit first
+
+    def allow(self, key, now=None):
+        """Records a hit for `key` and returns True, or returns False if it is over the limit."""
+        now = time.monotonic() if now is None else now
+        hits = self._hits.get(key)
+        if hits is None:
+            hits = self._hits[key] = deque(maxlen=self.limit)
+        if len(hits) == self.limit and hits[0] > now - self.window:
+            return False
+        hits.append(now)
+        self._hits.move_to_end(key)
+        self._evict(now)
+        return True
+
+    def _evict(self, now):
+        while self._hits:
+            key, hits = next(iter(self._hits.items()))
+            if len(self._hits) <= self.max_keys and hits and hits[-1] > now - self.window:
+                return
+            del self._hits[key]
+
+    def __len__(self):
+        return len(self._hits)
+
+
+class FloodGuard:
+    """
+    Update-level middleware, registered as a TypeHandler in the first handler
+    group. An update over the per-user or global limit is dropped before any
+    handler (or the database) sees it, by raising ApplicationHandlerStop.
+    A user is told once per window that they are being throttled. Admins and
+    updates without a user are never limited.
+    """
+
+    def __init__(self, user_limit, user_window, global_limit, global_window, exempt_ids=(), max_users=100000):
+        self.users = SlidingWindowLimiter(user_limit, user_window, max_users)
+        self.everyone = SlidingWindowLimiter(global_limit, global_window, 1)
+        self.exempt_ids = set(exempt_ids)
+        self._warned = ExpiringSet(user_window, max_users)
+
+    async def __call__(self, update, context):
+        user = update.effective_user
+        if user is None or user.id in self.exempt_ids:
+            return
+        if not self.users.allow(user.id):
+            updates_dropped.inc(reason='user')
+            if self._warned.add(user.id) and update.effective_chat:
+                logger.warning(f"Throttling user {user.id}: more than {self.users.limit} updates in {self.users.window}s")
+                await context.bot.send_message(chat_id=update.effective_chat.id, text=STRINGS['flood_warning'])
+            raise ApplicationHandlerStop
+        if not self.everyone.allow(None):
+            updates_dropped.inc(reason='global')
+            raise ApplicationHandlerStop
@@ -0,0 +1,109 @@
+# archive.py - Compressed cold store for finalized reports, one file per month
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+
+# One lock per archive directory, shared by every ReportArchive on it (the bot's and backup.py's)
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(directory):
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(directory), threading.Lock())
+
+
+def partition_of(report):
+    """Month the report was submitted in, e.g. '2024-03'."""
+    return (report.get('submitted_at') or '')[:7] or 'unknown'
+
+
+class ReportArchive:
+    """
+    Reports moved out of the hot table live in `directory`/reports-YYYY-MM.jsonl.gz,
+    one JSON document per line. Each archival run appends a new gzip member
+    to the month's file, so existing data is never rewritten. The storage
+    backend records which partition each archived report went to, so a
+    lookup only decompresses that one month.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = _lock_for(directory)
+
+    def _path(self, partition):
+        return os.path.join(self.directory, f"reports-{partition}.jsonl.gz")
+
+    def append(self, reports):
+        """Writes reports to their month's file and fsyncs it. Returns {report_id: partition}."""
+        by_partition = {}
+        for report in reports:
+            by_partition.setdefault(partition_of(report), []).append(report)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            for partition, items in by_partition.items():
+                with open(self._path(partition), 'ab') as raw:
+                    with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                        for report in items:
+                            f.write((json.dumps(report, ensure_ascii=False) + '\n').encode('utf-8'))
+                    raw.flush()
+                    os.fsync(raw.fileno())
+        return {report['report_id']: partition for partition, items in by_partition.items() for report in items}
+
+    def get(self, report_id, partition):
+        """Reads one report back from its partition, or None if it is not there."""
+        path = self._path(partition)
+        if not os.path.exists(path):
+            logger.error(f"Archive partition {partition} for report {report_id} is missing")
+            return None
+        found = None
+        needle = f'"report_id": "{report_id}"'
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                # Cheap substring check before parsing; a later copy (re-archived after a crash) wins
+                if needle in line:
+                    report = json.loads(line)
+                    if report.get('report_id') == report_id:
+                        found = report
+        return found
+
+    def sizes(self):
+        """
+        {file name: size} of every partition file. No append is in progress
+        while they are read, so each size ends on a complete gzip member, and
+        the bytes below it never change.
+        """
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                return {}
+            return {
+                name: os.path.getsize(os.path.join(self.directory, name))
+                for name in sorted(os.listdir(self.directory))
+                if name.startswith('reports-') and name.endswith('.jsonl.gz')
+            }
+
+    def iter_reports(self, since=None):
+        """
+        Yields every archived report, month by month (used to rebuild
+        aggregates and for full exports); with `since`, only the months from
+        that timestamp's on. Each file is read up to its size when the call
+        started, so an archival run appending meanwhile is not seen half-written.
+        """
+        for name, size in self.sizes().items():
+            if since and name[len('reports-'):-len('.jsonl.gz')] < since[:7]:
+                continue
+            with open(os.path.join(self.directory, name), 'rb') as raw:
+                data = raw.read(size)
+            seen = {}
+            with gzip.open(io.BytesIO(data), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    report = json.loads(line)
+                    seen[report['report_id']] = report
+            yield from seen.values()
@@ -0,0 +1,137 @@
+# async_database.py - Awaitable wrappers around database.py for the handlers
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import database
+from database import InsufficientBalanceError
+from metrics import gauge, db_queue_seconds
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+# A single writer thread keeps writes in submission order and is the only thread
+# that touches the in-memory index; reads that go to storage run in parallel
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+_readers = ThreadPoolExecutor(max_workers=4, thread_name_prefix='db-reader')
+
+_queue_wait = {_writer: db_queue_seconds.labels(pool='writer'), _readers: db_queue_seconds.labels(pool='reader')}
+gauge('kazabot_db_writer_backlog', "Database writes waiting for the writer thread", lambda: _writer._work_queue.qsize())
+gauge('kazabot_db_reader_backlog', "Database reads waiting for a reader thread", lambda: _readers._work_queue.qsize())
+
+
+async def _run(executor, func, *args):
+    loop = asyncio.get_running_loop()
+    queued = time.perf_counter()
+
+    def call():
+        # How long the call sat behind others; the call itself is timed in database.py
+        _queue_wait[executor].observe(time.perf_counter() - queued)
+        return func(*args)
+
+    return await loop.run_in_executor(executor, call)
+
+# --- Writes (ordered) ---
+
+async def save_report(user_id, report_data):
+    return await _run(_writer, database.save_report, user_id, report_data)
+
+async def get_or_create_user(user_id, username):
+    # May insert a new profile, so it goes through the writer
+    return await _run(_writer, database.get_or_create_user, user_id, username)
+
+async def update_user_balance(user_id, amount_to_add, kind='credit', ref=None):
+    return await _run(_writer, database.update_user_balance, user_id, amount_to_add, kind, ref)
+
+async def debit_user_balance(user_id, amount, kind='payout', ref=None):
+    return await _run(_writer, database.debit_user_balance, user_id, amount, kind, ref)
+
+async def create_payout_run(threshold):
+    return await _run(_writer, database.create_payout_run, threshold)
+
+async def apply_payout_run(run, batch_size=500):
+    return await _run(_writer, database.apply_payout_run, run, batch_size)
+
+async def update_user_profile(user_id, data_to_update):
+    return await _run(_writer, database.update_user_profile, user_id, data_to_update)
+
+async def update_report_status(report_id, new_status, admin_id):
+    return await _run(_writer, database.update_report_status, report_id, new_status, admin_id)
+
+async def save_admin_messages(report_id, messages):
+    return await _run(_writer, database.save_admin_messages, report_id, messages)
+
+async def review_reports(report_ids, new_status, admin_id, reward_amount=0):
+    return await _run(_writer, database.review_reports, report_ids, new_status, admin_id, reward_amount)
+
+async def archive_reports(older_than_days, statuses, batch_size=1000):
+    return await _run(_writer, database.archive_reports, older_than_days, statuses, batch_size)
+
+# --- Reads from the in-memory index (writer thread) ---
+# These take microseconds; running them between the writes means they never
+# see an index (or the stats) halfway through an update.
+
+async def get_user_report_count_today(user_id):
+    return await _run(_writer, database.get_user_report_count_today, user_id)
+
+async def get_report_by_id(report_id):
+    report = await _run(_writer, database.get_report_by_id, report_id, False)
+    if report is None:
+        # Not hot: the archive lookup reads files, so it runs with the other storage reads
+        report = await _run(_readers, database.get_archived_report, report_id)
+    return report
+
+async def get_pending_reports(after_id=None, before_id=None, limit=10):
+    return await _run(_writer, database.get_pending_reports, after_id, before_id, limit)
+
+async def get_user_by_id(user_id):
+    return await _run(_writer, database.get_user_by_id, user_id)
+
+async def get_user_balance(user_id):
+    return await _run(_writer, database.get_user_balance, user_id)
+
+async def get_stats(days=7):
+    return await _run(_writer, database.get_stats, days)
+
+# --- Reads from storage (concurrent) ---
+
+async def get_user_ledger(user_id):
+    return await _run(_readers, database.get_user_ledger, user_id)
+
+async def export_reports(path, since=None, fmt='csv'):
+    return await _run(_readers, database.export_reports, path, since, fmt)
+
+# --- Outbound message queue ---
+
+async def save_outbox_message(entry):
+    return await _run(_writer, database.save_outbox_message, entry)
+
+async def update_outbox_message(outbox_id, fields):
+    return await _run(_writer, database.update_outbox_message, outbox_id, fields)
+
+async def delete_outbox_message(outbox_id):
+    return await _run(_writer, database.delete_outbox_message, outbox_id)
+
+async def get_outbox_messages():
+    return await _run(_writer, database.get_outbox_messages)
+
+# --- Key/value namespaces ---
+
+async def put_state(namespace, key, value):
+    return await _run(_writer, database.put_state, namespace, key, value)
+
+async def delete_state(namespace, key):
+    return await _run(_writer, database.delete_state, namespace, key)
+
+async def get_state(namespace):
+    return await _run(_writer, database.get_state, namespace)
+
+async def flush():
+    return await _run(_writer, database.writes.flush)
+
+
+def shutdown():
+    """Drains queued reads/writes, then flushes and closes the database."""
+    _readers.shutdown(wait=True)
+    _writer.shutdown(wait=True)
+    database.close_database()
@@ -0,0 +1,364 @@
+# backup.py - Online snapshots, incremental backups and point-in-time restore for SQLite
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from storage import SQLiteStorage
+from archive import ReportArchive
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+
+# Aggregates are derived data; database.py rebuilds them from the restored records
+SKIPPED_NAMESPACES = ('stats',)
+
+
+def _positions(conn):
+    """Highest row rev and ledger entry_id visible to this connection."""
+    rev = max(conn.execute(f"SELECT COALESCE(MAX(rev), 0) FROM {table}").fetchone()[0] for table in SQLiteStorage.REV_TABLES)
+    ledger_id = conn.execute("SELECT COALESCE(MAX(entry_id), 0) FROM ledger").fetchone()[0]
+    return rev, ledger_id
+
+
+def _state_rows(conn):
+    """
+    The kv and outbox tables (conversation state, payout runs, export
+    watermarks, undelivered messages). Their rows carry no rev and can be
+    deleted, so each delta holds a full copy; they are small.
+    """
+    placeholders = ', '.join('?' for _ in SKIPPED_NAMESPACES)
+    query = f"SELECT namespace, key, doc FROM kv WHERE namespace NOT IN ({placeholders}) ORDER BY namespace, key"
+    rows = [
+        {'table': 'kv', 'doc': {'namespace': namespace, 'key': key, 'value': json.loads(doc)}}
+        for namespace, key, doc in conn.execute(query, SKIPPED_NAMESPACES)
+    ]
+    rows += [{'table': 'outbox', 'doc': json.loads(doc)} for (doc,) in conn.execute("SELECT doc FROM outbox ORDER BY outbox_id")]
+    return rows
+
+
+def _digest(rows):
+    return hashlib.sha256(json.dumps(rows, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def load_manifest(backup_dir):
+    path = os.path.join(backup_dir, MANIFEST)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class BackupManager:
+    """
+    Backs up the live SQLite database, and the monthly report archive
+    (archive.py) in `archive_dir`, without pausing the bot.
+
+    Snapshots run VACUUM INTO on a separate connection. Under WAL that reads
+    a single committed version of the database while the bot keeps writing,
+    and the copy is gzipped. Deltas read, in one read transaction, every
+    user/report row whose `rev` is above the last backup's, the ledger
+    entries after its last entry_id and a full copy of the kv and outbox
+    tables, and write them as gzipped JSON lines.
+
+    Archive files are only ever appended to: a snapshot copies them whole,
+    a delta copies what was appended since the last backup. Both go to a
+    directory named after the backup, and are read after the database, so
+    every archived report the backup refers to is in it.
+
+    manifest.json lists the backups in order with the position each one
+    reaches, so restore() can replay a snapshot and the deltas after it up
+    to any point in time.
+    """
+
+    def __init__(self, db_path, backup_dir, snapshot_interval=86400, keep_snapshots=7, archive_dir=None):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.snapshot_interval = snapshot_interval
+        self.keep_snapshots = keep_snapshots
+        self.archive = ReportArchive(archive_dir) if archive_dir else None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Autocommit mode, so BEGIN/ROLLBACK below are the only transaction boundaries
+        return sqlite3.connect(self.db_path, isolation_level=None)
+
+    def _save_manifest(self, manifest):
+        path = os.path.join(self.backup_dir, MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _copy_archive(self, stamp, since):
+        """
+        Copies what was appended to each archive file after the sizes in
+        `since` into archive-<stamp>/. Returns the sizes copied up to.
+        """
+        if self.archive is None:
+            return {}
+        sizes = self.archive.sizes()
+        changed = {name: size for name, size in sizes.items() if size > since.get(name, 0)}
+        if changed:
+            target = os.path.join(self.backup_dir, f"archive-{stamp}")
+            os.makedirs(target, exist_ok=True)
+            for name, size in changed.items():
+                with open(os.path.join(self.archive.directory, name), 'rb') as src, open(os.path.join(target, name), 'wb') as dst:
+                    src.seek(since.get(name, 0))
+                    dst.write(src.read(size - since.get(name, 0)))
+                    dst.flush()
+                    os.fsync(dst.fileno())
+        return sizes
+
+    def run(self):
+        """Scheduled entry point: a snapshot when the last one is old enough, otherwise a delta."""
+        manifest = load_manifest(self.backup_dir)
+        snapshots = [entry for entry in manifest if entry['kind'] == 'snapshot']
+        if not snapshots or datetime.utcnow() - datetime.fromisoformat(snapshots[-1]['created_at']) >= timedelta(seconds=self.snapshot_interval):
+            return self.snapshot()
+        return self.delta()
+
+    def snapshot(self):
+        """Takes a full, consistent copy of the database. Returns its manifest entry."""
+        with self._lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            created_at = datetime.utcnow()
+            stamp = created_at.strftime('%Y%m%dT%H%M%S%f')
+            raw_path = os.path.join(self.backup_dir, f".snapshot-{stamp}.db")
+            name = f"snapshot-{stamp}.db.gz"
+
+            conn = self._connect()
+            try:
+                conn.execute("VACUUM INTO ?", (raw_path,))
+            finally:
+                conn.close()
+            try:
+                copy = sqlite3.connect(raw_path)
+                try:
+                    rev, ledger_id = _positions(copy)
+                    state_digest = _digest(_state_rows(copy))
+                finally:
+                    copy.close()
+                with open(raw_path, 'rb') as src, gzip.open(os.path.join(self.backup_dir, name + '.tmp'), 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(os.path.join(self.backup_dir, name + '.tmp'), os.path.join(self.backup_dir, name))
+            finally:
+                os.remove(raw_path)
+            archive = self._copy_archive(stamp, {})
+
+            entry = {
+                'kind': 'snapshot', 'file': name, 'created_at': created_at.isoformat(), 'rev': rev, 'ledger_id': ledger_id,
+                'state_digest': state_digest, 'archive': archive,
+            }
+            manifest = load_manifest(self.backup_dir) + [entry]
+            self._save_manifest(self._prune(manifest))
+            logger.info(f"Backup snapshot {name} taken at rev {rev}")
+            return entry
+
+    def delta(self):
+        """
+        Writes the users/reports changed and ledger entries added since the
+        last backup, the kv/outbox tables and the archive appends. Returns
+        its manifest entry, or None if nothing changed.
+        """
+        with self._lock:
+            manifest = load_manifest(self.backup_dir)
+            if not manifest:
+                raise RuntimeError("No snapshot to build a delta on; take a snapshot first")
+            base_rev, base_ledger_id = manifest[-1]['rev'], manifest[-1]['ledger_id']
+            base_archive = manifest[-1].get('archive', {})
+            created_at = datetime.utcnow()
+            stamp = created_at.strftime('%Y%m%dT%H%M%S%f')
+            name = f"delta-{stamp}.jsonl.gz"
+            path = os.path.join(self.backup_dir, name)
+
+            rows = 0
+            conn = self._connect()
+            try:
+                # Everything below reads the same committed version of the database
+                conn.execute("BEGIN")
+                rev, ledger_id = _positions(conn)
+                state = _state_rows(conn)
+                state_digest = _digest(state)
+                archive_changed = self.archive is not None and self.archive.sizes() != base_archive
+                if (rev, ledger_id, state_digest) == (base_rev, base_ledger_id, manifest[-1].get('state_digest')) and not archive_changed:
+                    return None
+                with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as out:
+                    for item in state:
+                        out.write(json.dumps(item, ensure_ascii=False) + '\n')
+                    for table in ('users', 'reports'):
+                        for (doc,) in conn.execute(f"SELECT doc FROM {table} WHERE rev > ? AND rev <= ? ORDER BY rev", (base_rev, rev)):
+                            out.write(json.dumps({'table': table, 'doc': json.loads(doc)}, ensure_ascii=False) + '\n')
+                            rows += 1
+                    # Reports moved to the archive since the last backup leave the hot table on restore too
+                    query = "SELECT report_id, partition, photo_hash FROM archived_reports WHERE rev > ? AND rev <= ? ORDER BY rev"
+                    for report_id, partition, photo_hash in conn.execute(query, (base_rev, rev)):
+                        doc = {'report_id': report_id, 'partition': partition, 'photo_hash': photo_hash}
+                        out.write(json.dumps({'table': 'archived_reports', 'doc': doc}, ensure_ascii=False) + '\n')
+                        rows += 1
+                    columns = SQLiteStorage.LEDGER_COLUMNS
+                    query = f"SELECT {', '.join(columns)} FROM ledger WHERE entry_id > ? AND entry_id <= ? ORDER BY entry_id"
+                    for row in conn.execute(query, (base_ledger_id, ledger_id)):
+                        out.write(json.dumps({'table': 'ledger', 'doc': dict(zip(columns, row))}, ensure_ascii=False) + '\n')
+                        rows += 1
+                conn.execute("ROLLBACK")
+            finally:
+                conn.close()
+            os.replace(path + '.tmp', path)
+            archive = self._copy_archive(stamp, base_archive)
+
+            entry = {
+                'kind': 'delta', 'file': name, 'created_at': created_at.isoformat(),
+                'base_rev': base_rev, 'rev': rev, 'base_ledger_id': base_ledger_id, 'ledger_id': ledger_id, 'rows': rows,
+                'state_digest': state_digest, 'base_archive': base_archive, 'archive': archive,
+            }
+            manifest.append(entry)
+            self._save_manifest(manifest)
+            logger.info(f"Backup delta {name}: {rows} rows, rev {base_rev} -> {rev}")
+            return entry
+
+    def _prune(self, manifest):
+        """Drops backups older than the oldest snapshot we keep."""
+        snapshot_positions = [i for i, entry in enumerate(manifest) if entry['kind'] == 'snapshot']
+        if len(snapshot_positions) <= self.keep_snapshots:
+            return manifest
+        cutoff = snapshot_positions[-self.keep_snapshots]
+        for entry in manifest[:cutoff]:
+            try:
+                os.remove(os.path.join(self.backup_dir, entry['file']))
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(os.path.join(self.backup_dir, _archive_dir(entry)), ignore_errors=True)
+        return manifest[cutoff:]
+
+
+def _archive_dir(entry):
+    # Named after the backup, e.g. snapshot-<stamp>.db.gz -> archive-<stamp>
+    return 'archive-' + entry['file'].split('-', 1)[1].split('.', 1)[0]
+
+
+def _restore_archive(backup_dir, entries, archive_dir):
+    """Rebuilds the archive files from a snapshot's copy and the appends in the deltas after it."""
+    if os.path.exists(archive_dir) and os.listdir(archive_dir):
+        raise FileExistsError(f"{archive_dir} is not empty; restore the archive into a fresh directory")
+    os.makedirs(archive_dir, exist_ok=True)
+    sizes = {}
+    for entry in entries:
+        if entry.get('base_archive', {}) != sizes and entry['kind'] == 'delta':
+            raise ValueError(f"Archive backup chain is broken before {entry['file']}")
+        source = os.path.join(backup_dir, _archive_dir(entry))
+        for name in sorted(os.listdir(source)) if os.path.isdir(source) else ():
+            with open(os.path.join(source, name), 'rb') as src, open(os.path.join(archive_dir, name), 'ab') as dst:
+                shutil.copyfileobj(src, dst)
+        sizes = entry.get('archive', {})
+
+
+def restore(backup_dir, target_path, until=None, archive_dir=None):
+    """
+    Rebuilds the database as of `until` (ISO timestamp, latest if None) into
+    a new file: the last snapshot taken by then plus the deltas after it.
+    With `archive_dir`, the report archive is rebuilt there too.
+    Returns the manifest entries that were applied.
+    """
+    if os.path.exists(target_path):
+        raise FileExistsError(f"{target_path} already exists; restore into a fresh file")
+    manifest = [entry for entry in load_manifest(backup_dir) if until is None or entry['created_at'] <= until]
+    base = max((i for i, entry in enumerate(manifest) if entry['kind'] == 'snapshot'), default=None)
+    if base is None:
+        raise ValueError(f"No snapshot in {backup_dir} taken before {until}")
+
+    with gzip.open(os.path.join(backup_dir, manifest[base]['file']), 'rb') as src, open(target_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+
+    storage = SQLiteStorage(target_path)
+    applied = [manifest[base]]
+    state = None
+    try:
+        for entry in manifest[base + 1:]:
+            if entry['base_rev'] != applied[-1]['rev'] or entry['base_ledger_id'] != applied[-1]['ledger_id']:
+                raise ValueError(f"Backup chain is broken before {entry['file']}")
+            ops = []
+            if 'state_digest' in entry:
+                # Deltas from before kv/outbox were backed up leave the snapshot's copy in place
+                state = []
+            with gzip.open(os.path.join(backup_dir, entry['file']), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    item = json.loads(line)
+                    # Rows in a delta replace whatever the snapshot (or an earlier delta) had
+                    if item['table'] in ('kv', 'outbox'):
+                        state.append(item)
+                        continue
+                    if item['table'] == 'users':
+                        ops.append(('insert_user', (item['doc'], False, True)))
+                    elif item['table'] == 'reports':
+                        ops.append(('insert_report', (item['doc'], False, True)))
+                    elif item['table'] == 'archived_reports':
+                        doc = item['doc']
+                        ops.append(('archive_report', (doc['report_id'], doc['partition'], doc['photo_hash'])))
+                    else:
+                        ops.append(('insert_ledger_entry', (item['doc'], True)))
+                    if len(ops) >= 1000:
+                        storage.apply_batch(ops)
+                        ops = []
+            storage.apply_batch(ops)
+            applied.append(entry)
+        if state is not None:
+            # The last delta's copy of the kv and outbox tables replaces the snapshot's
+            ops = [('clear_state', (SKIPPED_NAMESPACES,))]
+            for item in state:
+                doc = item['doc']
+                if item['table'] == 'kv':
+                    ops.append(('put_kv', (doc['namespace'], doc['key'], doc['value'])))
+                else:
+                    ops.append(('insert_outbox', (doc,)))
+            storage.apply_batch(ops)
+        # Aggregates are derived data; database.py rebuilds them from the restored records
+        storage.apply_batch([('delete_kv', (namespace, key)) for namespace in SKIPPED_NAMESPACES for key, _ in storage.iter_kv(namespace)])
+    finally:
+        storage.close()
+    if archive_dir:
+        _restore_archive(backup_dir, applied, archive_dir)
+    logger.info(f"Restored {target_path} from {len(applied)} backups up to {applied[-1]['created_at']}")
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up or restore the bot's SQLite database.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in ('snapshot', 'delta'):
+        sub = commands.add_parser(command)
+        sub.add_argument('database')
+        sub.add_argument('backup_dir')
+        sub.add_argument('--archive-dir', help="the bot's report archive, to back up with the database")
+    sub = commands.add_parser('restore')
+    sub.add_argument('backup_dir')
+    sub.add_argument('target', help="new database file to create")
+    sub.add_argument('--until', help="ISO timestamp (UTC) to restore to; latest if omitted")
+    sub.add_argument('--archive-dir', help="new directory to rebuild the report archive in")
+    sub = commands.add_parser('list')
+    sub.add_argument('backup_dir')
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+
+    if args.command == 'snapshot':
+        print(BackupManager(args.database, args.backup_dir, archive_dir=args.archive_dir).snapshot())
+    elif args.command == 'delta':
+        print(BackupManager(args.database, args.backup_dir, archive_dir=args.archive_dir).delta())
+    elif args.command == 'restore':
+        applied = restore(args.backup_dir, args.target, args.until, args.archive_dir)
+        print(f"Restored {len(applied)} backups, up to {applied[-1]['created_at']}")
+    else:
+        for entry in load_manifest(args.backup_dir):
+            print(f"{entry['created_at']}  {entry['kind']:<8} {entry['file']}  rev {entry['rev']}")
+
+
+if __name__ == "__main__":
+    main()
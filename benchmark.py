@@ -0,0 +1,1140 @@
+# benchmark.py - Offline load test: the real handlers and database behind a fake Telegram API
+import argparse
+import asyncio
+import collections
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+import warnings
+from datetime import datetime, timedelta
+
+from telegram.request import BaseRequest
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow the bot skips photo hashing, so downloads are never requested
+    Image = None
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+BOT_ID = 1000000
+FIRST_COURIER_ID = 10000000
+FIRST_ADMIN_ID = 90000000
+
+# Central Buca, well inside the polygon in service_zones.geojson
+ZONE_BOX = ((38.35, 38.41), (27.18, 27.27))
+
+COURIER_STEPS = ('start', 'location', 'photo', 'description', 'crash_time', 'submit')
+
+
+# --- Fake Telegram transport ---
+
+def photo_bytes(content):
+    """A JPEG whose pixels depend only on `content`, so equal content gives an equal photo hash."""
+    if Image is None:
+        return b''
+    rng = random.Random(content)
+    image = Image.new('L', (16, 12))
+    image.putdata([rng.randrange(256) for _ in range(16 * 12)])
+    buffer = io.BytesIO()
+    image.resize((640, 480)).convert('RGB').save(buffer, 'JPEG', quality=80)
+    return buffer.getvalue()
+
+
+class FakeTelegram(BaseRequest):
+    """
+    Answers Bot API calls in process instead of over HTTP. Sent messages get
+    increasing message ids, getFile/downloads serve generated photos, and
+    every admin notification is kept so the benchmark can press its buttons.
+    `latency` (seconds) is added to each call to mimic the network.
+    Photos are generated up front (add_photo) so the benchmark doesn't time
+    its own JPEG encoding.
+
+    With `limits`, requests to a chat are held to Telegram's flood limits:
+    `global_rate` per second in total and `chat_rate` per second per chat
+    (bursts of `chat_burst`). A request over them gets the Bot API's 429
+    answer with retry_after, and the same request sent again later counts
+    as a retry; `delivery` keeps how long each delivery took from its
+    first attempt.
+    """
+
+    def __init__(self, admin_ids, latency=0.0, limits=False, global_rate=30, chat_rate=1, chat_burst=3):
+        self.admin_ids = set(admin_ids)
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.notifications = []  # (admin_id, report_id, message)
+        self.photos = {}
+        self._message_ids = itertools.count(1)
+        self.limits = limits
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._buckets = {}  # chat_id or None (global) -> (tokens, updated)
+        self.rejected = collections.Counter()  # 429 answers per endpoint
+        self.delivery = []  # seconds from first attempt to delivery, per delivered request
+        self._first_attempt = {}  # requests answered with 429 and not delivered yet
+
+    def _take(self, key, rate, capacity, now):
+        """Takes a token from the bucket; returns 0, or the whole seconds until one is available."""
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return max(1, math.ceil((1 - tokens) / rate))
+        self._buckets[key] = (tokens - 1, now)
+        return 0
+
+    def undelivered(self):
+        """Requests answered with 429 that were not sent again successfully (yet)."""
+        return len(self._first_attempt)
+
+    def add_photo(self, content):
+        if content not in self.photos:
+            self.photos[content] = photo_bytes(content)
+
+    @property
+    def read_timeout(self):
+        return 5
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = url.rsplit('/', 1)[-1]
+        if '/file/bot' in url:
+            self.calls['download'] += 1
+            # File paths are photos/bench-<content>-<n>.jpg, see plan_courier()
+            content = endpoint.split('-')[1]
+            return 200, self.photos[content] if content in self.photos else photo_bytes(content)
+        self.calls[endpoint] += 1
+        params = request_data.parameters if request_data else {}
+        if 'chat_id' in params:
+            now = time.monotonic()
+            key = (endpoint, json.dumps(params, sort_keys=True, default=str))
+            retry_after = self.limits and (
+                self._take(params['chat_id'], self.chat_rate, self.chat_burst, now)
+                or self._take(None, self.global_rate, self.global_rate, now)
+            )
+            if retry_after:
+                self.rejected[endpoint] += 1
+                self._first_attempt.setdefault(key, now)
+                return 429, json.dumps({
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f"Too Many Requests: retry after {retry_after}",
+                    'parameters': {'retry_after': retry_after},
+                }).encode('utf-8')
+            self.delivery.append(now - self._first_attempt.pop(key, now))
+        return 200, json.dumps({'ok': True, 'result': self._result(endpoint, params)}).encode('utf-8')
+
+    def _result(self, endpoint, params):
+        if endpoint == 'getMe':
+            return {'id': BOT_ID, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+        if endpoint == 'getFile':
+            file_id = params['file_id']
+            return {'file_id': file_id, 'file_unique_id': file_id, 'file_size': 30000, 'file_path': f"photos/{file_id}.jpg"}
+        if endpoint not in ('sendMessage', 'sendPhoto'):
+            return True
+        chat_id = int(params['chat_id'])
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Benchmark'},
+        }
+        if endpoint == 'sendMessage':
+            message['text'] = params.get('text')
+            return message
+        message['photo'] = [{'file_id': str(params.get('photo')), 'file_unique_id': 'photo', 'width': 640, 'height': 480}]
+        message['caption'] = params.get('caption')
+        buttons = (params.get('reply_markup') or {}).get('inline_keyboard') or [[]]
+        callback = buttons[0][0].get('callback_data', '') if buttons[0] else ''
+        if chat_id in self.admin_ids and callback.startswith('approve_'):
+            self.notifications.append((chat_id, callback[len('approve_'):], message))
+        return message
+
+
+# --- Synthetic updates ---
+
+def _user(user_id, name):
+    return {'id': user_id, 'is_bot': False, 'first_name': name, 'username': f"{name.lower()}{user_id}"}
+
+
+class LoadDriver:
+    """
+    Feeds updates into the application's update queue and measures how long
+    each one takes until every handler group has run, per flow step.
+    """
+
+    def __init__(self, application, timeout):
+        self.application = application
+        self.timeout = timeout
+        self.latencies = collections.defaultdict(list)
+        self.timeouts = collections.Counter()
+        self.processed_total = collections.Counter()  # across all rounds (tests/test_metrics.py checks it)
+        self._pending = {}
+        self._update_ids = itertools.count(1)
+
+    async def processed(self, update, context):
+        # Registered in the last handler group, so it runs once the bot is done with the update
+        future = self._pending.pop(update.update_id, None)
+        if future and not future.done():
+            future.set_result(time.perf_counter())
+
+    async def send(self, step, **payload):
+        from telegram import Update
+        update_id = next(self._update_ids)
+        if 'message' in payload:
+            payload['message'].setdefault('message_id', update_id)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[update_id] = future
+        started = time.perf_counter()
+        await self.application.update_queue.put(Update.de_json(dict(payload, update_id=update_id), self.application.bot))
+        try:
+            finished = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # e.g. an update some handler chose to drop; it has no latency to record
+            self._pending.pop(update_id, None)
+            self.timeouts[step] += 1
+            return False
+        self.latencies[step].append(finished - started)
+        self.processed_total[step] += 1
+        return True
+
+    async def message(self, step, user_id, **content):
+        message = {'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'}, 'from': _user(user_id, 'Kurye')}
+        message.update(content)
+        return await self.send(step, message=message)
+
+
+def plan_courier(user_id, rng, strings, zone_index, photo_reuse, earlier_photos):
+    """
+    The updates one courier sends, from /start to a submitted report, as
+    (step, message content). Returns (steps, photo content).
+    """
+    while True:
+        latitude, longitude = rng.uniform(*ZONE_BOX[0]), rng.uniform(*ZONE_BOX[1])
+        if zone_index is None or zone_index.lookup(latitude, longitude):
+            break
+    # A share of couriers send a photo someone else already sent, to exercise the reuse check
+    content = rng.choice(earlier_photos) if earlier_photos and rng.random() < photo_reuse else str(user_id)
+    file_id = f"bench-{content}-{user_id}"
+    description = rng.choice([strings['skip_button'], "Kavşakta iki araç çarpıştı", "Motosiklet devrilmiş, trafik yavaş"])
+    steps = [
+        ('start', {'text': '/start', 'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]}),
+        ('location', {'location': {'latitude': latitude, 'longitude': longitude}}),
+        ('photo', {'photo': [{'file_id': file_id, 'file_unique_id': file_id, 'width': 640, 'height': 480}]}),
+        ('description', {'text': description}),
+        ('crash_time', {'text': str(rng.randint(0, 60))}),
+        ('submit', {'text': strings['submit_report_button']}),
+    ]
+    return steps, content
+
+
+async def courier_flow(driver, user_id, steps, think_time):
+    """Sends one courier's updates in order. Returns True if every step was processed."""
+    for step, content in steps:
+        if not await driver.message(step, user_id, **content):
+            return False
+        if think_time:
+            await asyncio.sleep(think_time)
+    return True
+
+
+async def admin_review(driver, admin_id, report_id, message, approve):
+    callback = {
+        'id': f"{admin_id}-{report_id}",
+        'from': _user(admin_id, 'Admin'),
+        'chat_instance': 'benchmark',
+        'data': f"{'approve' if approve else 'reject'}_{report_id}",
+        'message': message,
+    }
+    return await driver.send('review', callback_query=callback)
+
+
+# --- Measurement ---
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def step_summary(latencies):
+    values = sorted(latencies)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2),
+    }
+
+
+def database_bytes(path):
+    """Size of the database including its WAL, which holds recent commits until a checkpoint."""
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal', '-shm') if os.path.exists(path + suffix))
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Runner ---
+
+def configure_environment(args, data_dir):
+    """config.py reads the environment at import time, so this runs before the bot is imported."""
+    os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = data_dir
+    os.environ['TELEGRAM_BOT_TOKEN'] = f"{BOT_ID}:benchmark"
+    os.environ['ADMIN_IDS'] = ','.join(str(FIRST_ADMIN_ID + i) for i in range(args.admins))
+    os.environ['BACKUP_DIR'] = ''
+    os.environ['PAYOUT_SCAN_INTERVAL'] = '0'
+    os.environ['METRICS_PORT'] = '0'
+    os.environ['WELCOME_PHOTO_FILE_ID'] = ''
+    os.environ['DATABASE_BACKEND'] = args.backend
+    if not args.real_rate_limits:
+        # Telegram's (and our own incoming) flood limits would otherwise dominate every number measured here
+        for name in ('TELEGRAM_GLOBAL_RATE', 'TELEGRAM_CHAT_RATE', 'TELEGRAM_GROUP_RATE', 'FLOOD_USER_LIMIT', 'FLOOD_GLOBAL_LIMIT'):
+            os.environ[name] = '1000000'
+
+
+async def run_round(number, couriers, args, driver, fake, rng, zone_index, first_courier):
+    import async_database
+    from config import SQLITE_DATABASE_PATH, DATABASE_PATH, DATABASE_BACKEND
+    from localization import STRINGS
+
+    db_path = SQLITE_DATABASE_PATH if DATABASE_BACKEND == 'sqlite' else DATABASE_PATH
+    await async_database.flush()
+    size_before = database_bytes(db_path)
+    reports_before = (await async_database.get_stats(days=1))['reports']
+    driver.latencies.clear()
+    driver.timeouts.clear()
+    notifications_before = len(fake.notifications)
+    deliveries_before, rejected_before = len(fake.delivery), sum(fake.rejected.values())
+
+    plans, photos = [], []
+    for user_id in range(first_courier, first_courier + couriers):
+        steps, content = plan_courier(user_id, random.Random(rng.random()), STRINGS, zone_index, args.photo_reuse, photos)
+        fake.add_photo(content)
+        plans.append((user_id, steps))
+        photos.append(content)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_courier(user_id, steps):
+        async with semaphore:
+            return await courier_flow(driver, user_id, steps, args.think_ms / 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_courier(user_id, steps) for user_id, steps in plans))
+    courier_seconds = time.perf_counter() - started
+
+    # Admin notifications go out in the background after the courier's reply
+    reports = (await async_database.get_stats(days=1))['reports'] - reports_before
+    expected = notifications_before + reports * args.admins
+    deadline = time.perf_counter() + args.timeout
+    while len(fake.notifications) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    notify_seconds = time.perf_counter() - started - courier_seconds
+
+    # Each report is decided once, by one of the admins it was sent to, taking turns
+    by_report = {}
+    for admin_id, report_id, message in fake.notifications[notifications_before:]:
+        by_report.setdefault(report_id, {})[admin_id] = message
+    reviews = []
+    for i, (report_id, messages) in enumerate(by_report.items()):
+        admin_id = sorted(messages)[i % len(messages)]
+        reviews.append((admin_id, report_id, messages[admin_id]))
+    review_started = time.perf_counter()
+    await asyncio.gather(*(
+        admin_review(driver, admin_id, report_id, message, rng.random() >= args.reject_ratio)
+        for admin_id, report_id, message in reviews
+    ))
+    review_seconds = time.perf_counter() - review_started
+
+    await async_database.flush()
+    size_after = database_bytes(db_path)
+    total_seconds = time.perf_counter() - started
+    updates = sum(len(values) for values in driver.latencies.values())
+    return {
+        'round': number,
+        'couriers': couriers,
+        'reports': reports,
+        'reviews': len(reviews),
+        'total_reports': reports_before + reports,
+        'updates': updates,
+        'timeouts': dict(driver.timeouts),
+        'seconds': round(total_seconds, 3),
+        'updates_per_s': round(updates / total_seconds, 1),
+        'reports_per_s': round(reports / courier_seconds, 1) if courier_seconds else None,
+        'notify_seconds': round(notify_seconds, 3),
+        'review_seconds': round(review_seconds, 3),
+        'steps': {step: step_summary(driver.latencies[step]) for step in COURIER_STEPS + ('review',)},
+        'db_bytes': size_after,
+        'db_growth_bytes': size_after - size_before,
+        'db_bytes_per_report': round((size_after - size_before) / reports) if reports else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'telegram': {
+            'rejected_429': sum(fake.rejected.values()) - rejected_before,
+            'delivery': step_summary(fake.delivery[deliveries_before:]),
+            'delayed': sum(1 for seconds in fake.delivery[deliveries_before:] if seconds),
+            'undelivered': fake.undelivered(),
+        },
+    }
+
+
+async def run(args):
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from telegram.warnings import PTBUserWarning
+    import bot
+    import database
+    from handlers import zone_index, photo_hasher
+
+    # Same start-up order as bot.main()
+    photo_hasher.start()
+    database.init()
+    fake = FakeTelegram([FIRST_ADMIN_ID + i for i in range(args.admins)], args.latency_ms / 1000, args.telegram_limits)
+    application = bot.build_application(request=fake)
+    driver = LoadDriver(application, args.timeout)
+    application.add_handler(TypeHandler(Update, driver.processed), group=1000)
+
+    rng = random.Random(args.seed)
+    rounds = []
+    # Same order of calls as Application.run_polling(), minus the polling. post_init
+    # starts background tasks before the application runs, as it does in production.
+    warnings.filterwarnings('ignore', message='Tasks created via `Application.create_task`', category=PTBUserWarning)
+    await application.initialize()
+    try:
+        await application.post_init(application)
+        await application.start()
+        try:
+            if args.warmup:
+                # Starts the photo hashing processes and fills caches before anything is measured
+                await run_round(0, args.warmup, args, driver, fake, rng, zone_index, FIRST_COURIER_ID - args.warmup)
+            for number in range(1, args.rounds + 1):
+                first_courier = FIRST_COURIER_ID + (number - 1) * args.couriers
+                result = await run_round(number, args.couriers, args, driver, fake, rng, zone_index, first_courier)
+                rounds.append(result)
+                print_round(result)
+        finally:
+            await application.stop()
+    finally:
+        await application.shutdown()
+        await application.post_shutdown(application)
+    return rounds, fake.calls
+
+
+# --- Micro-benchmarks ---
+# Each measures one component on generated data, outside the simulated flows:
+#   python benchmark.py --micro NAME [--size N]
+
+MICRO_BENCHMARKS = {}
+
+
+def micro(name):
+    def register(func):
+        MICRO_BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def synthetic_report(number, rng, now, statuses=('onaylandı',) * 6 + ('reddedildi',) * 2 + ('pending',), days=80):
+    """A report as database.save_report() stores it, submitted within the `days` days before `now`."""
+    submitted = now - timedelta(minutes=rng.randrange(days * 24 * 60))
+    return {
+        'report_id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'telegram_user_id': FIRST_COURIER_ID + rng.randrange(max(1, number // 20)),
+        'location_geo': [rng.uniform(*ZONE_BOX[0]), rng.uniform(*ZONE_BOX[1])],
+        'location_time': submitted.isoformat(),
+        'zone': 'Buca',
+        'photo_file_id': f"bench-{number}",
+        'photo_time': submitted.isoformat(),
+        'photo_hash': f"{rng.getrandbits(64):016x}",
+        'description': rng.choice([None, "Kavşakta iki araç çarpıştı, trafik yavaş ilerliyor"]),
+        'crash_time_delta': rng.randint(0, 60),
+        'submitted_at': submitted.isoformat(),
+        'status': rng.choice(statuses),
+        'reward_sent': False,
+    }
+
+
+def fill_storage(path, reports, seed=1, days=80):
+    """
+    A SQLite database at `path` with `reports` generated reports over the
+    last `days` days, inserted oldest first, and their couriers. Generated a
+    chunk at a time, so a million reports fit in memory.
+    """
+    from storage import SQLiteStorage
+
+    rng, now = random.Random(seed), datetime.utcnow()
+    storage = SQLiteStorage(path)
+    storage.apply_batch([
+        ('insert_user', ({'telegram_user_id': FIRST_COURIER_ID + i, 'username': f"kurye{i}", 'balance': 0},))
+        for i in range(max(1, reports // 20))
+    ])
+    ages = sorted((rng.randrange(days * 24 * 60) for _ in range(reports)), reverse=True)
+    for i in range(0, reports, 20000):
+        chunk = []
+        for minutes in ages[i:i + 20000]:
+            report = synthetic_report(reports, rng, now, days=days)
+            submitted = (now - timedelta(minutes=minutes)).isoformat()
+            report.update(location_time=submitted, photo_time=submitted, submitted_at=submitted)
+            chunk.append(('insert_report', (report,)))
+        storage.apply_batch(chunk)
+    return storage
+
+
+def traced(func):
+    """Runs func() and returns (result, seconds, MB allocated at the peak, MB still allocated afterwards)."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func()
+        seconds = time.perf_counter() - started
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, round(seconds, 3), round(peak / 2**20, 1), round(current / 2**20, 1)
+
+
+@micro('resident-memory')
+def resident_memory(args, data_dir):
+    """Start-up index load with every report in memory vs. MAX_RESIDENT_REPORTS (a quarter of them)."""
+    from indexes import RecordIndex
+    from config import ARCHIVE_STATUSES
+
+    size = args.size or 100000
+    storage = fill_storage(os.path.join(data_dir, 'resident.db'), size)
+    results = {}
+    print(f"\nIndex load of {size} reports")
+    print(f"  {'max resident':<14} {'seconds':>8} {'peak MB':>8} {'held MB':>8} {'resident':>9}")
+    for limit in (0, size // 4):
+        def load():
+            index = RecordIndex(max_reports=limit, spill_statuses=ARCHIVE_STATUSES)
+            index.load(storage)
+            return index
+        index, seconds, peak, held = traced(load)
+        results[limit or 'unlimited'] = {'seconds': seconds, 'peak_mb': peak, 'held_mb': held, 'resident': len(index.reports)}
+        print(f"  {limit or 'unlimited':<14} {seconds:>8} {peak:>8} {held:>8} {len(index.reports):>9}")
+        del index
+    storage.close()
+    return results
+
+
+def per_call_us(func, keys):
+    """Mean microseconds per func(key) over `keys`."""
+    started = time.perf_counter()
+    for key in keys:
+        func(key)
+    return round((time.perf_counter() - started) / len(keys) * 1e6, 2)
+
+
+@micro('lookups')
+def lookups(args, data_dir):
+    """User, report and 24h-count lookups in RecordIndex as it grows, next to the table scan they replaced."""
+    from indexes import RecordIndex
+
+    size = args.size or 1000000
+    rng, now = random.Random(args.seed), datetime.utcnow()
+    since = (now - timedelta(days=1)).isoformat()
+    index = RecordIndex()
+    report_ids = []
+    results = {}
+    print(f"\nLookups per table size (µs per call, 20000 calls; scan: 20 calls)")
+    print(f"  {'reports':>9} {'users':>7} {'user':>7} {'report':>7} {'24h count':>10} {'scan':>10}")
+    checkpoints = [n for n in (1000, 10000, 100000, 1000000) if n < size] + [size]
+    for number in range(size):
+        # 20 reports per courier, like the synthetic reports elsewhere in this file
+        user_id = FIRST_COURIER_ID + number // 20
+        if number % 20 == 0:
+            index.add_user({'telegram_user_id': user_id, 'balance': 0})
+        report_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        submitted = now - timedelta(minutes=rng.randrange(80 * 24 * 60))
+        index.add_report({'report_id': report_id, 'telegram_user_id': user_id, 'submitted_at': submitted.isoformat(), 'status': 'onaylandı'})
+        report_ids.append(report_id)
+        if number + 1 not in checkpoints:
+            continue
+        users = [FIRST_COURIER_ID + rng.randrange(number // 20 + 1) for _ in range(20000)]
+        reports = [rng.choice(report_ids) for _ in range(20000)]
+        result = {
+            'user_us': per_call_us(index.get_user, users),
+            'report_us': per_call_us(index.get_report, reports),
+            'count_24h_us': per_call_us(lambda user_id: index.count_user_reports_since(user_id, since), users),
+            # What a TinyDB Query() did for each of them: look at every report
+            'scan_us': per_call_us(
+                lambda report_id: next(r for r in index.reports.values() if r['report_id'] == report_id), reports[:20],
+            ),
+        }
+        results[number + 1] = result
+        print(
+            f"  {number + 1:>9} {len(index.users):>7} {result['user_us']:>7} {result['report_us']:>7} "
+            f"{result['count_24h_us']:>10} {result['scan_us']:>10}"
+        )
+    return results
+
+
+class UpdateSource(FakeTelegram):
+    """
+    A FakeTelegram that also hands out updates through getUpdates, holding
+    the request open up to its `timeout` like Telegram's long polling, and
+    records when the reply to each chat arrives.
+    """
+
+    def __init__(self):
+        super().__init__(())
+        self.updates = asyncio.Queue()
+        self.replies = {}  # chat_id -> future set when a message is sent to it
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        params = request_data.parameters if request_data else {}
+        if url.endswith('/getUpdates'):
+            self.calls['getUpdates'] += 1
+            updates = []
+            try:
+                updates.append(await asyncio.wait_for(self.updates.get(), float(params.get('timeout') or 0) or 0.001))
+            except asyncio.TimeoutError:
+                pass
+            while not self.updates.empty():
+                updates.append(self.updates.get_nowait())
+            return 200, json.dumps({'ok': True, 'result': updates}).encode('utf-8')
+        response = await super().do_request(url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout)
+        future = self.replies.pop(params.get('chat_id'), None)
+        if url.endswith('/sendMessage') and future and not future.done():
+            future.set_result(time.perf_counter())
+        return response
+
+
+async def http_post(port, path, body):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split()[1])
+
+
+async def _update_to_reply(mode, poll_interval, count, rng):
+    from telegram.ext import ApplicationBuilder, MessageHandler, filters
+    from webhook import create_webhook_app
+    import uvicorn
+
+    source = UpdateSource()
+    application = (
+        ApplicationBuilder().token(f"{BOT_ID}:benchmark").request(source).get_updates_request(source).build()
+    )
+
+    async def reply(update, context):
+        await update.message.reply_text("ok")
+
+    application.add_handler(MessageHandler(filters.TEXT, reply))
+    server = None
+    async with application:
+        await application.start()
+        if mode == 'polling':
+            await application.updater.start_polling(poll_interval=poll_interval)
+        else:
+            server = uvicorn.Server(uvicorn.Config(create_webhook_app(application, '/telegram'), host='127.0.0.1', port=0, log_level='warning'))
+            serving = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.01)
+            port = server.servers[0].sockets[0].getsockname()[1]
+        latencies = []
+        for number in range(1, count + 1):
+            # Updates arrive at random moments, not in step with the polling loop
+            await asyncio.sleep(rng.uniform(0, 0.5))
+            chat_id = FIRST_COURIER_ID + number
+            update = {
+                'update_id': number,
+                'message': {
+                    'message_id': number, 'date': int(time.time()), 'text': "merhaba",
+                    'chat': {'id': chat_id, 'type': 'private'}, 'from': _user(chat_id, 'Kurye'),
+                },
+            }
+            future = source.replies[chat_id] = asyncio.get_running_loop().create_future()
+            started = time.perf_counter()
+            if mode == 'polling':
+                await source.updates.put(update)
+            else:
+                await http_post(port, '/telegram', json.dumps(update).encode('utf-8'))
+            latencies.append(await asyncio.wait_for(future, 30) - started)
+        if mode == 'polling':
+            await application.updater.stop()
+        else:
+            server.should_exit = True
+            await serving
+        await application.stop()
+    return step_summary(latencies), source.calls['getUpdates']
+
+
+@micro('update-delivery')
+def update_delivery(args, data_dir):
+    """Update-to-reply latency with long polling (the old 2s poll interval and none) and the local webhook."""
+    count = args.size or 40
+    results = {}
+    print(f"\nUpdate to reply, {count} updates at random intervals")
+    print(f"  {'mode':<22} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'getUpdates':>11}")
+    for mode, poll_interval in (('polling', 2.0), ('polling', 0.0), ('webhook', None)):
+        summary, polls = asyncio.run(_update_to_reply(mode, poll_interval, count, random.Random(args.seed)))
+        name = mode if poll_interval is None else f"{mode} (interval {poll_interval:g}s)"
+        results[name] = dict(summary, get_updates=polls)
+        print(f"  {name:<22} {summary['p50_ms']:>9} {summary['p99_ms']:>9} {summary['max_ms']:>9} {polls:>11}")
+    return results
+
+
+@micro('duplicates')
+def duplicates(args, data_dir):
+    """Nearby-report lookups (the duplicate check at submit) among --size reports spread over İzmir."""
+    from geoindex import SpatialTemporalIndex
+    from config import DUPLICATE_RADIUS_METERS, DUPLICATE_WINDOW_MINUTES
+
+    size = args.size or 1000000
+    rng, now = random.Random(args.seed), datetime.utcnow()
+    index = SpatialTemporalIndex(DUPLICATE_RADIUS_METERS)
+    points = []
+
+    def build():
+        for number in range(size):
+            # Greater İzmir, from Çiğli to Gaziemir, over the last 80 days
+            lat, lon = rng.uniform(38.33, 38.52), rng.uniform(26.98, 27.28)
+            submitted = (now - timedelta(seconds=rng.randrange(80 * 24 * 3600))).isoformat()
+            index.add(f"r{number}", lat, lon, submitted)
+            if number % (size // 1000 or 1) == 0:
+                points.append((lat, lon, submitted))
+    _, build_seconds, peak, held = traced(build)
+
+    # Half near an existing report (50 m, 10 minutes away), half anywhere
+    queries = []
+    for lat, lon, submitted in points:
+        moved = (datetime.fromisoformat(submitted) + timedelta(minutes=10)).isoformat()
+        queries.append((lat + 50 / 111320, lon, moved))
+        queries.append((rng.uniform(38.33, 38.52), rng.uniform(26.98, 27.28), now.isoformat()))
+    latencies, matches = [], 0
+    for lat, lon, submitted in queries:
+        started = time.perf_counter()
+        matches += len(index.find_nearby(lat, lon, submitted, DUPLICATE_RADIUS_METERS, DUPLICATE_WINDOW_MINUTES))
+        latencies.append(time.perf_counter() - started)
+    summary = step_summary(latencies)
+    print(f"\nDuplicate check among {size} reports ({DUPLICATE_RADIUS_METERS} m, {DUPLICATE_WINDOW_MINUTES} minutes)")
+    print(f"  index built in {build_seconds}s, {held} MB held ({len(index.buckets)} cells)")
+    print(f"  {len(queries)} lookups: p50 {summary['p50_ms']} ms, p99 {summary['p99_ms']} ms, max {summary['max_ms']} ms, "
+          f"{matches / len(queries):.2f} matches on average")
+    return {'build_seconds': build_seconds, 'peak_mb': peak, 'held_mb': held, 'lookup': summary, 'matches': matches}
+
+
+def synthetic_districts(count, rng, size=0.05, vertices=40):
+    """`count` non-overlapping irregular districts in a grid of `size`-degree squares north of İzmir."""
+    from zones import Zone
+
+    side = math.ceil(math.sqrt(count))
+    districts = []
+    for number in range(count):
+        center_lat = 38.0 + (number // side + 0.5) * size
+        center_lon = 26.5 + (number % side + 0.5) * size
+        ring = []
+        for vertex in range(vertices):
+            angle = 2 * math.pi * vertex / vertices
+            radius = size / 2 * rng.uniform(0.6, 1.0)
+            ring.append([center_lon + radius * math.cos(angle), center_lat + radius * math.sin(angle)])
+        districts.append(Zone(f"district-{number}", [[ring]]))
+    return districts, (38.0, 38.0 + side * size), (26.5, 26.5 + side * size)
+
+
+@micro('zones')
+def zone_lookups(args, data_dir):
+    """Service-zone lookups with ZoneIndex vs. testing every district polygon in turn."""
+    from zones import ZoneIndex
+
+    rng = random.Random(args.seed)
+    results = {}
+    print(f"\nZone lookups, 20000 random points (µs per lookup)")
+    print(f"  {'districts':>9} {'build s':>8} {'cells':>8} {'index':>7} {'scan':>9} {'one dict hit':>13}")
+    for count in sorted({100, 500, args.size or 1000}):
+        districts, lats, lons = synthetic_districts(count, rng)
+        started = time.perf_counter()
+        zone_index = ZoneIndex(districts)
+        build_seconds = round(time.perf_counter() - started, 3)
+        points = [(rng.uniform(*lats), rng.uniform(*lons)) for _ in range(20000)]
+
+        def scan(point):
+            lat, lon = point
+            for zone in districts:
+                if zone.min_lat <= lat <= zone.max_lat and zone.min_lon <= lon <= zone.max_lon and zone.contains(lat, lon):
+                    return zone.name
+            return None
+
+        found = [zone_index.lookup(*point) for point in points[:1000]]
+        if found != [scan(point) for point in points[:1000]]:
+            raise AssertionError("ZoneIndex and the polygon scan disagree")
+        result = {
+            'build_seconds': build_seconds,
+            'cells': len(zone_index.inside) + len(zone_index.boundary),
+            'index_us': per_call_us(lambda point: zone_index.lookup(*point), points),
+            'scan_us': per_call_us(scan, points[:2000]),
+            'dict_hit_share': round(sum(1 for lat, lon in points if zone_index._cell_of(lat, lon) not in zone_index.boundary) / len(points), 3),
+        }
+        results[count] = result
+        print(
+            f"  {count:>9} {build_seconds:>8} {result['cells']:>8} {result['index_us']:>7} "
+            f"{result['scan_us']:>9} {result['dict_hit_share']:>13}"
+        )
+    return results
+
+
+def run_measured(command):
+    """Runs a command; returns (seconds, its own peak RSS in MB)."""
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return round(time.perf_counter() - started, 3), round(usage.ru_maxrss / 1024, 1)
+
+
+@micro('export')
+def export(args, data_dir):
+    """export.py on a database of --size reports, in a process of its own so its peak RSS is its alone."""
+    import export as export_module
+
+    size = args.size or 1000000
+    path = os.path.join(data_dir, 'export.db')
+    started = time.perf_counter()
+    fill_storage(path, size).close()
+    print(f"\nExport of {size} reports (database filled in {time.perf_counter() - started:.1f}s, {database_bytes(path)} bytes)")
+    print(f"  {'format':<8} {'seconds':>8} {'peak RSS MB':>12} {'file MB':>8}")
+    results = {}
+    formats = [fmt for fmt in export_module.FORMATS if fmt != 'parquet' or export_module.pyarrow is not None]
+    for fmt in formats:
+        out_dir = os.path.join(data_dir, f"export-{fmt}")
+        seconds, rss = run_measured([sys.executable, export_module.__file__, path, out_dir, '--format', fmt])
+        file_mb = round(os.path.getsize(os.path.join(out_dir, f"reports.{fmt}")) / 2**20, 1)
+        results[fmt] = {'seconds': seconds, 'peak_rss_mb': rss, 'file_mb': file_mb}
+        print(f"  {fmt:<8} {seconds:>8} {rss:>12} {file_mb:>8}")
+    return results
+
+
+async def _handler_lookups(args, couriers, pending):
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    import bot
+    import database
+    from handlers import photo_hasher
+
+    photo_hasher.start()
+    database.init()
+    admin_ids = [FIRST_ADMIN_ID + i for i in range(args.admins)]
+    fake = FakeTelegram(admin_ids)
+    application = bot.build_application(request=fake)
+    driver = LoadDriver(application, args.timeout)
+    application.add_handler(TypeHandler(Update, driver.processed), group=1000)
+    async with application:
+        await application.start()
+        for user_id in couriers:
+            await driver.message('bakiye', user_id, text='/bakiye', entities=[{'type': 'bot_command', 'offset': 0, 'length': 7}])
+        for i, report_id in enumerate(pending):
+            admin_id = admin_ids[i % len(admin_ids)]
+            # The admin's copy of the notification, as notify_admins would have sent it
+            message = {
+                'message_id': i + 1, 'date': int(time.time()), 'caption': "Yeni rapor",
+                'chat': {'id': admin_id, 'type': 'private'}, 'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Benchmark'},
+                'photo': [{'file_id': f"bench-{i}", 'file_unique_id': 'photo', 'width': 640, 'height': 480}],
+            }
+            await admin_review(driver, admin_id, report_id, message, True)
+        await application.stop()
+    database.close_database()
+    return {step: step_summary(driver.latencies[step]) for step in ('bakiye', 'review')}, dict(driver.timeouts)
+
+
+@micro('handler-lookups')
+def handler_lookups(args, data_dir):
+    """
+    /bakiye and review_handler on a database of about 200 MB: the lookups
+    they need through the old path (plain TinyDB, which reads and parses the
+    whole JSON file per query), then the real handlers through the fake Bot
+    API, served from the in-memory indexes.
+    """
+    import sqlite3
+    from tinydb import TinyDB, Query
+    from config import SQLITE_DATABASE_PATH
+
+    size = args.size or 240000
+    storage = fill_storage(SQLITE_DATABASE_PATH, size)
+    json_path = os.path.join(data_dir, 'kazabot_db.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'users': {str(i): user for i, user in enumerate(storage.iter_users(), 1)},
+            'reports': {str(i): report for i, report in enumerate(storage.iter_reports(), 1)},
+        }, f, indent=4, ensure_ascii=False)
+    storage.close()
+    rng = random.Random(args.seed)
+    couriers = [FIRST_COURIER_ID + rng.randrange(max(1, size // 20)) for _ in range(200)]
+    with sqlite3.connect(SQLITE_DATABASE_PATH) as conn:
+        pending = [row[0] for row in conn.execute("SELECT report_id FROM reports WHERE status = 'pending' LIMIT 200")]
+
+    def tinydb_lookups(user_id, report_id=None):
+        # What the handlers did before: a fresh plain-JSON TinyDB read per query
+        db = TinyDB(json_path)
+        if report_id:
+            report = db.table('reports').get(Query().report_id == report_id)
+            user_id = report['telegram_user_id']
+        return TinyDB(json_path).table('users').get(Query().telegram_user_id == user_id)
+
+    def seconds(*lookup):
+        started = time.perf_counter()
+        tinydb_lookups(*lookup)
+        return time.perf_counter() - started
+
+    before = {
+        'bakiye': step_summary([seconds(user_id) for user_id in couriers[:3]]),
+        'review': step_summary([seconds(None, report_id) for report_id in pending[:3]]),
+    }
+    after, timeouts = asyncio.run(_handler_lookups(args, couriers, pending))
+
+    print(f"\n/bakiye and review_handler with {size} reports "
+          f"(SQLite {database_bytes(SQLITE_DATABASE_PATH) / 2**20:.0f} MB, TinyDB JSON {os.path.getsize(json_path) / 2**20:.0f} MB)")
+    print(f"  {'':<33} {'count':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for label, results in (('before: TinyDB lookups', before), ('after: handler end to end', after)):
+        for step, summary in results.items():
+            print(f"  {label + ' ' + step:<33} {summary['count']:>6} {summary['p50_ms']:>9} {summary['p99_ms']:>9} {summary['max_ms']:>9}")
+    if timeouts:
+        print(f"  timed out: {timeouts}")
+    return {'before': before, 'after': after, 'timeouts': timeouts}
+
+
+@micro('archive')
+def archive_pass(args, data_dir):
+    """Start-up and hot-path lookups on three years of reports, before and after the archival pass."""
+    import sqlite3
+    import database
+    from config import SQLITE_DATABASE_PATH, ARCHIVE_AFTER_DAYS, ARCHIVE_STATUSES, MAX_RESIDENT_REPORTS
+
+    size = args.size or 300000
+    fill_storage(SQLITE_DATABASE_PATH, size, days=3 * 365).close()
+    rng = random.Random(args.seed)
+    cutoff = (datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+    with sqlite3.connect(SQLITE_DATABASE_PATH) as conn:
+        recent = [row[0] for row in conn.execute("SELECT report_id FROM reports WHERE submitted_at > ?", (cutoff,))]
+        old = [row[0] for row in conn.execute(
+            f"SELECT report_id FROM reports WHERE submitted_at <= ? AND status IN ({', '.join('?' * len(ARCHIVE_STATUSES))})",
+            (cutoff, *ARCHIVE_STATUSES),
+        )]
+    recent = [rng.choice(recent) for _ in range(5000)]
+    old = [rng.choice(old) for _ in range(500)]
+    users = [FIRST_COURIER_ID + rng.randrange(max(1, size // 20)) for _ in range(5000)]
+
+    def measure():
+        _, startup_seconds, _, held = traced(database.init)
+        with sqlite3.connect(SQLITE_DATABASE_PATH) as conn:
+            hot_rows = conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+        result = {
+            'startup_seconds': startup_seconds,
+            'held_mb': held,
+            'hot_reports': hot_rows,
+            'resident': len(database.index.reports),
+            'recent_report_us': per_call_us(database.get_report_by_id, recent),
+            'old_report_us': per_call_us(database.get_report_by_id, old),
+            'count_24h_us': per_call_us(database.get_user_report_count_today, users),
+            'pending_page_us': per_call_us(lambda _: database.get_pending_reports(), range(500)),
+        }
+        database.close_database()
+        return result
+
+    before = measure()
+    database.init()
+    started = time.perf_counter()
+    archived = 0
+    while True:
+        moved = database.archive_reports(ARCHIVE_AFTER_DAYS, ARCHIVE_STATUSES, batch_size=5000)
+        if not moved:
+            break
+        archived += moved
+    archive_seconds = round(time.perf_counter() - started, 3)
+    database.close_database()
+    after = measure()
+
+    print(f"\n{size} reports over three years, archiving finalized ones older than {ARCHIVE_AFTER_DAYS} days "
+          f"(at most {MAX_RESIDENT_REPORTS} kept in memory)")
+    print(f"  archival pass: {archived} reports in {archive_seconds}s")
+    print(f"  {'':<20} {'before':>10} {'after':>10}")
+    for name in before:
+        print(f"  {name:<20} {before[name]:>10} {after[name]:>10}")
+    return {'archived': archived, 'archive_seconds': archive_seconds, 'before': before, 'after': after}
+
+
+def print_round(result):
+    print(
+        f"\nRound {result['round']}: {result['couriers']} couriers, {result['reports']} reports "
+        f"({result['total_reports']} in total), {result['reviews']} reviews in {result['seconds']}s"
+    )
+    print(f"  {'step':<12} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for step, summary in result['steps'].items():
+        if summary['count']:
+            print(f"  {step:<12} {summary['count']:>7} {summary['p50_ms']:>9} {summary['p99_ms']:>9} {summary['max_ms']:>9}")
+    print(f"  throughput: {result['updates_per_s']} updates/s, {result['reports_per_s']} reports/s")
+    print(f"  admin notifications done {result['notify_seconds']}s after the last courier")
+    print(f"  database: {result['db_bytes']} bytes (+{result['db_growth_bytes']}, {result['db_bytes_per_report']} per report)")
+    print(f"  peak RSS: {result['peak_rss_mb']} MB")
+    telegram = result['telegram']
+    if telegram['rejected_429'] or telegram['undelivered']:
+        delivery = telegram['delivery']
+        print(
+            f"  Bot API: {telegram['rejected_429']} answered 429, {telegram['delayed']} messages delivered late "
+            f"(delivery p50 {delivery['p50_ms']} ms, p99 {delivery['p99_ms']} ms, max {delivery['max_ms']} ms), "
+            f"{telegram['undelivered']} not delivered yet"
+        )
+    if result['timeouts']:
+        print(f"  timed out: {result['timeouts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive the bot's real handlers and database with simulated couriers and admins, offline.",
+    )
+    parser.add_argument('--couriers', type=int, default=1000, help="couriers per round, each submitting one report")
+    parser.add_argument('--rounds', type=int, default=1, help="rounds on the same database, to see how it scales as it grows")
+    parser.add_argument('--warmup', type=int, default=20, help="couriers run before measuring, not reported")
+    parser.add_argument('--concurrency', type=int, default=200, help="couriers in the middle of a report at once")
+    parser.add_argument('--admins', type=int, default=3)
+    parser.add_argument('--reject-ratio', type=float, default=0.2)
+    parser.add_argument('--photo-reuse', type=float, default=0.05, help="share of couriers sending an already used photo")
+    parser.add_argument('--think-ms', type=float, default=0, help="pause between a courier's steps")
+    parser.add_argument('--latency-ms', type=float, default=0, help="simulated Bot API round trip")
+    parser.add_argument('--timeout', type=float, default=30, help="seconds to wait for one update to be processed")
+    parser.add_argument('--backend', choices=('sqlite', 'tinydb'), default='sqlite')
+    parser.add_argument('--real-rate-limits', action='store_true', help="keep Telegram's flood limits in the rate limiter and the incoming flood limits")
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help="make the fake Bot API answer 429 (retry_after) above 30 messages/s, or 1/s per chat after a burst of 3; "
+                             "combine with --real-rate-limits to see the rate limiter absorb them")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', help="keep the database here (default: a temporary directory, removed afterwards)")
+    parser.add_argument('--output', help="append the results as one JSON line, for comparing commits")
+    parser.add_argument('--verbose', action='store_true', help="show the bot's own INFO logs")
+    parser.add_argument('--micro', action='append', choices=sorted(MICRO_BENCHMARKS),
+                        help="run this micro-benchmark instead of the simulated flows (repeatable)")
+    parser.add_argument('--size', type=int, help="records generated for a micro-benchmark (default: its own)")
+    parser.add_argument('--sweep-updates', metavar='N,N,...', type=lambda text: [int(n) for n in text.split(',')],
+                        help="run the flows once per MAX_CONCURRENT_UPDATES value, each in a fresh process and database")
+    args = parser.parse_args()
+    if args.sweep_updates:
+        if args.data_dir or args.micro:
+            parser.error("--sweep-updates runs each value on a fresh temporary database, without --data-dir or --micro")
+        write_output(args, {'sweep': sweep_updates(args.sweep_updates)})
+        return
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO if args.verbose else logging.WARNING,
+    )
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='kazabot-benchmark-')
+    os.makedirs(data_dir, exist_ok=True)
+    configure_environment(args, data_dir)
+    if args.micro:
+        try:
+            results = {name: MICRO_BENCHMARKS[name](args, data_dir) for name in args.micro}
+        finally:
+            if not args.data_dir:
+                shutil.rmtree(data_dir, ignore_errors=True)
+        write_output(args, {'micro': results})
+        return
+    try:
+        rounds, calls = asyncio.run(run(args))
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"\nBot API calls: {dict(sorted(calls.items()))}")
+    write_output(args, {'rounds': rounds})
+
+
+def sweep_updates(values):
+    """
+    Runs this benchmark with the same arguments once per MAX_CONCURRENT_UPDATES
+    value (bot.py reads it at import time, hence a process each) and compares
+    the last round of each.
+    """
+    argv, skip = [], False
+    for arg in sys.argv[1:]:
+        if skip or arg.startswith('--sweep-updates'):
+            skip = arg == '--sweep-updates'
+            continue
+        argv.append(arg)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='kazabot-sweep-') as directory:
+        for value in values:
+            output = os.path.join(directory, f"{value}.jsonl")
+            print(f"\n=== MAX_CONCURRENT_UPDATES={value} ===", flush=True)
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *argv, '--output', output],
+                env=dict(os.environ, MAX_CONCURRENT_UPDATES=str(value)),
+            )
+            if os.path.exists(output):
+                with open(output, encoding='utf-8') as f:
+                    results[value] = json.loads(f.readlines()[-1])['rounds'][-1]
+
+    print(f"\nConcurrent updates sweep (last round of each)")
+    print(f"  {'updates':>8} {'updates/s':>10} {'reports/s':>10} {'submit p99 ms':>14} {'review p99 ms':>14} {'timeouts':>9}")
+    for value, result in results.items():
+        print(
+            f"  {value:>8} {result['updates_per_s']:>10} {result['reports_per_s']:>10} "
+            f"{result['steps']['submit']['p99_ms']:>14} {result['steps']['review']['p99_ms']:>14} "
+            f"{sum(result['timeouts'].values()):>9}"
+        )
+    return results
+
+
+def write_output(args, results):
+    if not args.output:
+        return
+    result = {
+        'commit': git_commit(),
+        'run_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': {name: value for name, value in vars(args).items() if name not in ('output', 'data_dir', 'verbose')},
+        **results,
+    }
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result) + '\n')
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
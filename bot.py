@@ -1,15 +1,54 @@
 # bot.py - Simplified version after Railway teardown fix
 import logging
 import asyncio
+from telegram import Update
 from telegram.ext import (
     Application,
+    TypeHandler,
     ConversationHandler,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     filters,
 )
-from config import TELEGRAM_BOT_TOKEN
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    LOOP_LAG_WARN_MS,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_GROUP_RATE,
+    BOT_RUN_MODE,
+    POLL_INTERVAL,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    PORT,
+    MAX_CONCURRENT_UPDATES,
+    MAX_WAITING_UPDATES_PER_CHAT,
+    DROP_PENDING_UPDATES,
+    PERSISTENCE_UPDATE_INTERVAL,
+    DATABASE_BACKEND,
+    SQLITE_DATABASE_PATH,
+    BACKUP_DIR,
+    BACKUP_INTERVAL,
+    BACKUP_SNAPSHOT_INTERVAL,
+    BACKUP_KEEP_SNAPSHOTS,
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_INTERVAL,
+    ARCHIVE_STATUSES,
+    ARCHIVE_DIR,
+    ADMIN_IDS,
+    PAYOUT_THRESHOLD,
+    PAYOUT_SCAN_INTERVAL,
+    PAYOUT_DIR,
+    PAYOUT_BATCH_SIZE,
+    FLOOD_USER_LIMIT,
+    FLOOD_USER_WINDOW,
+    FLOOD_GLOBAL_LIMIT,
+    FLOOD_GLOBAL_WINDOW,
+    METRICS_HOST,
+    METRICS_PORT,
+)
 from handlers import (
     start,
     location,
@@ -20,16 +59,35 @@ from handlers import (
     submit,
     cancel,
     review_handler,
+    pending_handler,
+    bekleyen_command,
     odeme_command,
+    istatistik_command,
+    disaaktar_command,
+    metrik_command,
     bakiye_command,
     kurallar_command,
     destek_command, # <-- ADD THIS IMPORT
+    photo_hasher,
+    tracker,
     LOCATION,
     PHOTO,
     DESCRIPTION,
     CRASH_TIME_DELTA,
     CONFIRMATION,
 )
+import database
+import async_database
+from monitoring import monitor_event_loop_lag
+from outbox import outbox
+from ratelimit import FloodControlRateLimiter
+from webhook import run_webhook
+from update_processor import PerChatUpdateProcessor
+from persistence import DatabasePersistence
+from backup import BackupManager
+from payouts import PayoutRunner
+from antiflood import FloodGuard
+from metrics import gauge, start_http_server
 from localization import STRINGS
 
 # Simple logging setup
@@ -39,18 +97,99 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def main() -> None:
-    """Run the bot - simplified version."""
-    
-    # Create the Application with minimal timeout config
+# Online backups only exist for the SQLite backend
+backups = (
+    BackupManager(SQLITE_DATABASE_PATH, BACKUP_DIR, BACKUP_SNAPSHOT_INTERVAL, BACKUP_KEEP_SNAPSHOTS, ARCHIVE_DIR)
+    if DATABASE_BACKEND == 'sqlite' and BACKUP_DIR else None
+)
+
+# Pays out couriers who reached the threshold, on the job queue (see on_startup)
+payouts = PayoutRunner(PAYOUT_THRESHOLD, PAYOUT_DIR, ADMIN_IDS, PAYOUT_BATCH_SIZE)
+
+# Serves /metrics while the bot runs (see on_startup)
+metrics_server = None
+
+async def run_backup(context) -> None:
+    """Job queue callback: snapshot or incremental backup, off the event loop."""
+    try:
+        await asyncio.to_thread(backups.run)
+    except Exception as e:
+        logger.error(f"Backup failed: {e}")
+
+async def run_archive(context) -> None:
+    """Job queue callback: moves old finalized reports to the cold store in batches."""
+    try:
+        # One batch per writer call, so queued handler writes get in between batches
+        while await async_database.archive_reports(ARCHIVE_AFTER_DAYS, ARCHIVE_STATUSES):
+            pass
+    except Exception as e:
+        logger.error(f"Report archival failed: {e}")
+
+async def run_payouts(context) -> None:
+    """Job queue callback: resumes unfinished payout runs and starts a new one."""
+    try:
+        await payouts.run(context.bot)
+    except Exception as e:
+        logger.error(f"Payout run failed: {e}")
+
+async def on_startup(application: Application) -> None:
+    """Starts background tasks once the application is initialized."""
+    application.create_task(monitor_event_loop_lag(warn_threshold_ms=LOOP_LAG_WARN_MS))
+    tracker.start()
+    await outbox.start(application.bot)
+    application.create_task(outbox.run_retries())
+    if backups:
+        application.job_queue.run_repeating(run_backup, interval=BACKUP_INTERVAL, first=60, name='backup')
+    application.job_queue.run_repeating(run_archive, interval=ARCHIVE_INTERVAL, first=300, name='archive')
+    if PAYOUT_SCAN_INTERVAL:
+        application.job_queue.run_repeating(run_payouts, interval=PAYOUT_SCAN_INTERVAL, first=120, name='payouts')
+    if METRICS_PORT:
+        global metrics_server
+        try:
+            metrics_server = await start_http_server(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            # Metrics are not worth failing the bot over
+            logger.error(f"Could not start the metrics endpoint on {METRICS_HOST}:{METRICS_PORT}: {e}")
+
+async def on_shutdown(application: Application) -> None:
+    """Stops background workers and commits queued database writes before exit."""
+    if metrics_server:
+        metrics_server.close()
+    photo_hasher.shutdown()
+    tracker.stop()
+    async_database.shutdown()
+
+def build_application(request=None) -> Application:
+    """
+    Builds the Application with all handlers registered. `request` replaces
+    the HTTP transport to the Bot API (benchmark.py passes an offline fake).
+    """
+
+    update_processor = PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES, MAX_WAITING_UPDATES_PER_CHAT, exempt_ids=ADMIN_IDS)
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN)
+    if request is None:
+        # Minimal timeout config for the real transport
+        builder = (
+            builder
+            .get_updates_read_timeout(30)
+            .get_updates_write_timeout(30)
+            .get_updates_connect_timeout(30)
+        )
+    else:
+        builder = builder.request(request).get_updates_request(request)
     application = (
-        Application.builder()
-        .token(TELEGRAM_BOT_TOKEN)
-        .get_updates_read_timeout(30)
-        .get_updates_write_timeout(30)
-        .get_updates_connect_timeout(30)
+        builder
+        .rate_limiter(FloodControlRateLimiter(TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE))
+        # Different couriers are served in parallel; each chat's updates stay in order
+        .concurrent_updates(update_processor)
+        # In-flight reports (conversation state + user_data) survive restarts
+        .persistence(DatabasePersistence(PERSISTENCE_UPDATE_INTERVAL))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
         .build()
     )
+    gauge('kazabot_update_queue', "Updates received and not yet picked up", application.update_queue.qsize)
+    gauge('kazabot_chats_in_flight', "Chats with an update running or waiting its turn", lambda: len(update_processor.chat_locks))
 
     # Add conversation handler
     conv_handler = ConversationHandler(
@@ -72,14 +211,25 @@ def main() -> None:
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
-        per_message=False
+        per_message=False,
+        name="report_conversation",
+        persistent=True
     )
 
+    # Runs before every other handler group and drops updates over the flood limits
+    flood_guard = FloodGuard(FLOOD_USER_LIMIT, FLOOD_USER_WINDOW, FLOOD_GLOBAL_LIMIT, FLOOD_GLOBAL_WINDOW, exempt_ids=ADMIN_IDS)
+    application.add_handler(TypeHandler(Update, flood_guard), group=-1)
+
     application.add_handler(conv_handler)
-    application.add_handler(CallbackQueryHandler(review_handler))
+    application.add_handler(CallbackQueryHandler(review_handler, pattern="^(approve|reject)_"))
+    application.add_handler(CallbackQueryHandler(pending_handler, pattern="^pending_"))
 
     # --- Register command handlers ---
     application.add_handler(CommandHandler("odeme", odeme_command))
+    application.add_handler(CommandHandler("bekleyen", bekleyen_command))
+    application.add_handler(CommandHandler("istatistik", istatistik_command))
+    application.add_handler(CommandHandler("disaaktar", disaaktar_command))
+    application.add_handler(CommandHandler("metrik", metrik_command))
     application.add_handler(CommandHandler("bakiye", bakiye_command))
     application.add_handler(CommandHandler("kurallar", kurallar_command))
     application.add_handler(CommandHandler("destek", destek_command))
@@ -90,12 +240,34 @@ def main() -> None:
     application.add_handler(MessageHandler(filters.Regex(f"^{STRINGS['support_button']}$"), destek_command))
 
 
-    logger.info("Starting KazaBot...")
-    
-    # Simple polling - no complex retry logic needed
+    return application
+
+def main() -> None:
+    """Run the bot in the mode selected by BOT_RUN_MODE."""
+    # Hash workers are forked first, while this process has no open files or threads
+    photo_hasher.start()
+    database.init()
+    application = build_application()
+    logger.info(f"Starting KazaBot in {BOT_RUN_MODE} mode...")
+
+    if BOT_RUN_MODE in ('webhook', 'local'):
+        # 'local' serves the webhook endpoint without registering it with Telegram,
+        # so a stand-in producer can POST updates to it
+        asyncio.run(run_webhook(
+            application,
+            port=PORT,
+            path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL if BOT_RUN_MODE == 'webhook' else None,
+            secret_token=WEBHOOK_SECRET,
+            drop_pending_updates=DROP_PENDING_UPDATES,
+        ))
+        return
+
+    # Long polling: getUpdates waits server-side, so no extra sleep is needed between polls
     application.run_polling(
-        poll_interval=2.0,
-        drop_pending_updates=True
+        poll_interval=POLL_INTERVAL,
+        allowed_updates=Update.ALL_TYPES,
+        drop_pending_updates=DROP_PENDING_UPDATES
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+# claims.py - Review leases and processed-callback memory for admin decisions
+import logging
+import time
+from collections import OrderedDict
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+
+class ExpiringSet:
+    """
+    Keys remembered for `ttl` seconds, at most `max_size` of them. Every key
+    lives equally long, so insertion order is expiry order and eviction
+    only ever looks at the oldest entries.
+    """
+
+    def __init__(self, ttl, max_size=100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expires = OrderedDict()
+
+    def _evict(self, now):
+        while self._expires and (len(self._expires) > self.max_size or next(iter(self._expires.values())) <= now):
+            self._expires.popitem(last=False)
+
+    def add(self, key):
+        """Remembers `key`. Returns False if it was already remembered."""
+        now = time.monotonic()
+        self._evict(now)
+        if key in self._expires:
+            return False
+        self._expires[key] = now + self.ttl
+        return True
+
+    def __len__(self):
+        return len(self._expires)
+
+
+class ReviewClaims:
+    """
+    The first admin to act on a report holds a lease on it for `ttl`
+    seconds; other admins' buttons are answered from memory during that
+    time instead of reaching the database. The decision itself is applied
+    once by database.review_reports(), so an expired lease (or a restart)
+    only means the next press is turned away by the database instead.
+    Used from the event loop only, so no locking is needed.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._leases = OrderedDict()  # report_id -> (admin_id, expires at)
+
+    def claim(self, report_id, admin_id):
+        """Takes or renews the lease. Returns the admin holding it (the caller if it succeeded)."""
+        now = time.monotonic()
+        while self._leases and next(iter(self._leases.values()))[1] <= now:
+            self._leases.popitem(last=False)
+        holder = self._leases.get(report_id)
+        if holder and holder[0] != admin_id:
+            return holder[0]
+        self._leases.pop(report_id, None)
+        self._leases[report_id] = (admin_id, now + self.ttl)
+        return admin_id
+
+    def release(self, report_id, admin_id):
+        """Gives the lease up early, e.g. when applying the decision failed."""
+        holder = self._leases.get(report_id)
+        if holder and holder[0] == admin_id:
+            del self._leases[report_id]
+
+    def __len__(self):
+        return len(self._leases)
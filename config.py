@@ -10,6 +10,29 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("No TELEGRAM_BOT_TOKEN found in environment variables")
 
+# How updates are received: 'polling' (default), 'webhook', or 'local'
+# ('local' serves the webhook endpoint without registering it with Telegram)
+BOT_RUN_MODE = os.getenv('BOT_RUN_MODE', 'polling').strip().lower()
+if BOT_RUN_MODE not in ('polling', 'webhook', 'local'):
+    raise ValueError(f"BOT_RUN_MODE must be 'polling', 'webhook' or 'local', got {BOT_RUN_MODE!r}")
+POLL_INTERVAL = float(os.getenv('POLL_INTERVAL', '0'))  # seconds between getUpdates calls
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # public base URL, e.g. https://<app>.up.railway.app
+WEBHOOK_PATH = '/telegram'
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+PORT = int(os.getenv('PORT', '8080'))  # Railway sets PORT for web services
+if BOT_RUN_MODE == 'webhook' and not WEBHOOK_URL:
+    raise ValueError("BOT_RUN_MODE=webhook requires WEBHOOK_URL")
+
+# Updates that arrived while the bot was down are processed on start unless this is set
+DROP_PENDING_UPDATES = os.getenv('DROP_PENDING_UPDATES', 'false').strip().lower() in ('1', 'true', 'yes')
+# Seconds between flushes of changed user_data to the database
+PERSISTENCE_UPDATE_INTERVAL = 5
+
+# Updates from different chats handled at the same time (each chat stays sequential)
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '64'))
+# Updates from one chat waiting for their turn; more than this are dropped
+MAX_WAITING_UPDATES_PER_CHAT = int(os.getenv('MAX_WAITING_UPDATES_PER_CHAT', '8'))
+
 # Welcome message photo
 WELCOME_PHOTO_FILE_ID = os.getenv('WELCOME_PHOTO_FILE_ID')
 if not WELCOME_PHOTO_FILE_ID:
@@ -18,12 +41,64 @@ if not WELCOME_PHOTO_FILE_ID:
 
 # Database configuration
 # Use Railway volume for persistent storage
-DATABASE_PATH = os.environ.get('RAILWAY_VOLUME_MOUNT_PATH', '')
-if DATABASE_PATH:
-    DATABASE_PATH = os.path.join(DATABASE_PATH, 'kazabot_db.json')
+DATA_DIR = os.environ.get('RAILWAY_VOLUME_MOUNT_PATH', '')
+if DATA_DIR:
+    DATABASE_PATH = os.path.join(DATA_DIR, 'kazabot_db.json')
+    SQLITE_DATABASE_PATH = os.path.join(DATA_DIR, 'kazabot.db')
 else:
     # Fallback for local development
     DATABASE_PATH = 'kazabot_db.json'
+    SQLITE_DATABASE_PATH = 'kazabot.db'
+
+# Storage backend: 'sqlite' (default) or 'tinydb' (legacy JSON file).
+# On first start the SQLite backend imports DATABASE_PATH if it exists.
+DATABASE_BACKEND = os.getenv('DATABASE_BACKEND', 'sqlite').strip().lower()
+
+# Write durability: 'group' commits queued writes together every
+# WRITE_BEHIND_INTERVAL seconds, 'journal' does the same but first appends
+# each write to a synced journal in WRITE_JOURNAL_DIR (replayed after a crash),
+# 'fsync' commits each write on its own.
+DB_DURABILITY = os.getenv('DB_DURABILITY', 'journal').strip().lower()
+WRITE_BEHIND_INTERVAL = float(os.getenv('WRITE_BEHIND_INTERVAL', '0.5'))  # seconds
+WRITE_BEHIND_MAX_BATCH = 500
+WRITE_JOURNAL_DIR = os.getenv('WRITE_JOURNAL_DIR', os.path.join(DATA_DIR, 'journal'))
+
+# Reports kept in memory; beyond this the oldest approved/rejected ones are
+# dropped from memory and read from the database when needed (0 = no limit).
+# A report takes roughly 1-2 KB in memory.
+MAX_RESIDENT_REPORTS = int(os.getenv('MAX_RESIDENT_REPORTS', '200000'))
+
+# Backups of the SQLite database (see backup.py); set BACKUP_DIR to '' to disable
+BACKUP_DIR = os.getenv('BACKUP_DIR', os.path.join(DATA_DIR, 'backups'))
+BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL', '900'))  # seconds between incremental backups
+BACKUP_SNAPSHOT_INTERVAL = int(os.getenv('BACKUP_SNAPSHOT_INTERVAL', '86400'))  # seconds between full snapshots
+BACKUP_KEEP_SNAPSHOTS = int(os.getenv('BACKUP_KEEP_SNAPSHOTS', '7'))
+
+# Approved/rejected reports older than ARCHIVE_AFTER_DAYS move to monthly gzip files in ARCHIVE_DIR
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(DATA_DIR, 'archive'))
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', '86400'))  # seconds between archival runs
+ARCHIVE_STATUSES = ('onaylandı', 'reddedildi')
+
+# Couriers at or above PAYOUT_THRESHOLD are paid out their balance in a scheduled
+# run every PAYOUT_SCAN_INTERVAL seconds (0 disables it); each run's list is
+# written to PAYOUT_DIR as CSV and sent to the admins
+PAYOUT_SCAN_INTERVAL = int(os.getenv('PAYOUT_SCAN_INTERVAL', '86400'))
+PAYOUT_DIR = os.getenv('PAYOUT_DIR', os.path.join(DATA_DIR, 'payouts'))
+PAYOUT_BATCH_SIZE = 500  # users debited per transaction
+
+# Funnel analytics: events are buffered in memory and appended to rotated JSONL logs
+ANALYTICS_DIR = os.getenv('ANALYTICS_DIR', os.path.join(DATA_DIR, 'analytics'))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '5'))  # seconds
+ANALYTICS_BUFFER_SIZE = 10000  # events held in memory before the oldest are dropped
+ANALYTICS_ROTATE_BYTES = 10 * 1024 * 1024
+
+# Event loop lag above this is logged as a warning
+LOOP_LAG_WARN_MS = int(os.getenv('LOOP_LAG_WARN_MS', '100'))
+
+# Prometheus metrics at http://METRICS_HOST:METRICS_PORT/metrics (port 0 disables the endpoint)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
 
 # Validation constraints
 MAX_DESCRIPTION_LENGTH = 200
@@ -32,10 +107,57 @@ MAX_CRASH_TIME = 60  # minutes
 MAX_REPORTS_PER_DAY = 3
 PAYOUT_THRESHOLD = 500  # TL
 
+# Duplicate detection: a report within this distance and time of an earlier one is flagged
+DUPLICATE_RADIUS_METERS = 200
+DUPLICATE_WINDOW_MINUTES = 30
+# When true, flagged reports are saved with status 'duplicate' instead of 'pending'
+AUTO_MARK_DUPLICATES = os.getenv('AUTO_MARK_DUPLICATES', 'false').strip().lower() in ('1', 'true', 'yes')
+
+# Photo reuse detection: perceptual hashes within this many bits (of 64) count as the same photo
+PHOTO_HASH_MAX_DISTANCE = 10
+PHOTO_HASH_WORKERS = 2
+
+# Admin notifications: how many admins are messaged at once
+ADMIN_NOTIFY_CONCURRENCY = 10
+
+# Pending reports listed per page by the admin /bekleyen command
+PENDING_PAGE_SIZE = int(os.getenv('PENDING_PAGE_SIZE', '10'))
+
+# Admin review buttons: the first admin to press one holds the report for
+# REVIEW_CLAIM_TTL seconds; callback ids are remembered for PROCESSED_CALLBACK_TTL
+# seconds so a redelivered callback is not processed twice
+REVIEW_CLAIM_TTL = 300
+PROCESSED_CALLBACK_TTL = 3600
+
+# Incoming flood limits: a user may send FLOOD_USER_LIMIT updates per
+# FLOOD_USER_WINDOW seconds, and all users together FLOOD_GLOBAL_LIMIT per
+# FLOOD_GLOBAL_WINDOW seconds; anything above is dropped (admins are exempt)
+FLOOD_USER_LIMIT = int(os.getenv('FLOOD_USER_LIMIT', '15'))
+FLOOD_USER_WINDOW = float(os.getenv('FLOOD_USER_WINDOW', '30'))
+FLOOD_GLOBAL_LIMIT = int(os.getenv('FLOOD_GLOBAL_LIMIT', '100'))
+FLOOD_GLOBAL_WINDOW = float(os.getenv('FLOOD_GLOBAL_WINDOW', '1'))
+
+# Telegram flood limits (messages per second) applied to all outgoing requests
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+TELEGRAM_GROUP_RATE = float(os.getenv('TELEGRAM_GROUP_RATE', 20 / 60))
+
+# Undelivered notifications are kept in the database and retried
+OUTBOX_RETRY_INTERVAL = 30  # seconds
+OUTBOX_MAX_ATTEMPTS = 10
+
 # --- Add these new constants for the rules ---
 REWARD_AMOUNT = 100 # TL
 SERVICE_ZONES_TEXT = "İzmir — Buca ve Gaziemir ilçeleri"
 
+# District polygons (GeoJSON, feature property 'name') that reports must fall inside
+SERVICE_ZONES_GEOJSON = os.getenv('SERVICE_ZONES_GEOJSON', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'service_zones.geojson'))
+# 'tag' (default) accepts it and warns the admins; 'reject' asks the courier for another location.
+# The polygons are drawn by hand, so a courier right on a border isn't turned away unless configured.
+OUT_OF_ZONE_ACTION = os.getenv('OUT_OF_ZONE_ACTION', 'tag').strip().lower()
+if OUT_OF_ZONE_ACTION not in ('reject', 'tag'):
+    raise ValueError(f"OUT_OF_ZONE_ACTION must be 'reject' or 'tag', got {OUT_OF_ZONE_ACTION!r}")
+
 # Conversation states
 LOCATION, PHOTO, DESCRIPTION, CRASH_TIME_DELTA, CONFIRMATION = range(5)
 
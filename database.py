@@ -1,18 +1,172 @@
 # database.py
+import os
+import copy
 import uuid
+import atexit
 import logging
+import threading
+import itertools
+import functools
 from datetime import datetime, timedelta
-from tinydb import TinyDB, Query
-from config import DATABASE_PATH
+from config import (
+    DATABASE_BACKEND,
+    DATABASE_PATH,
+    SQLITE_DATABASE_PATH,
+    DB_DURABILITY,
+    WRITE_BEHIND_INTERVAL,
+    WRITE_BEHIND_MAX_BATCH,
+    WRITE_JOURNAL_DIR,
+    MAX_RESIDENT_REPORTS,
+    DUPLICATE_RADIUS_METERS,
+    DUPLICATE_WINDOW_MINUTES,
+    AUTO_MARK_DUPLICATES,
+    PHOTO_HASH_MAX_DISTANCE,
+    ARCHIVE_DIR,
+    ARCHIVE_STATUSES,
+)
+from storage import open_storage, SQLiteStorage
+from migrate import migrate_tinydb_to_sqlite
+from indexes import RecordIndex, UNDECIDED_STATUSES
+from writebehind import WriteBehindQueue
+from stats import ReportStats
+import export
+from archive import ReportArchive
+from metrics import timed, gauge, db_seconds, db_errors
 
 # Enable logging
 logger = logging.getLogger(__name__)
 
-# Initialize the database with the path from config
-db = TinyDB(DATABASE_PATH, indent=4)
-reports_table = db.table('reports')
-users_table = db.table('users')
+# Set up by init(), which bot.main() calls once before the bot starts, so that
+# importing this module (e.g. in a worker process) opens nothing
+storage = None
+writes = None
+index = None
+archive = None
+stats = None
 
+gauge('kazabot_write_behind_pending', "Writes waiting for the next group commit", lambda: writes.pending_count() if writes else 0)
+gauge('kazabot_reports_resident', "Report documents held in memory", lambda: len(index.reports) if index else 0)
+gauge('kazabot_write_behind_stalled', "1 while queued writes fail to commit and new writes are refused", lambda: int(bool(writes and writes.stalled)))
+gauge('kazabot_reports_spilled', "Report documents above MAX_RESIDENT_REPORTS, read from storage on demand", lambda: index.spilled if index else 0)
+
+# Scheduled payout runs (see payouts.py), keyed by run_id
+PAYOUT_RUNS_NAMESPACE = 'payout_runs'
+
+# User creation and every balance change hold this lock, so check-and-apply is atomic
+_user_lock = threading.Lock()
+
+class InsufficientBalanceError(Exception):
+    """Raised when a debit would take a user's balance below zero."""
+    def __init__(self, current_balance):
+        super().__init__(f"Insufficient balance: {current_balance}")
+        self.current_balance = current_balance
+
+def init():
+    """
+    Opens the storage backend, replays the write journal and loads the
+    in-memory indexes and statistics. Safe to call twice.
+    """
+    global storage, writes, index, archive, stats
+    if storage is not None:
+        return
+
+    # Initialize the storage backend selected in config
+    storage = open_storage(DATABASE_BACKEND, DATABASE_PATH, SQLITE_DATABASE_PATH)
+
+    # First start on SQLite: import the existing TinyDB file so no data is lost
+    if isinstance(storage, SQLiteStorage) and storage.is_empty() and os.path.exists(DATABASE_PATH):
+        logger.info(f"Empty SQLite database, importing legacy data from {DATABASE_PATH}")
+        migrate_tinydb_to_sqlite(DATABASE_PATH, storage)
+
+    # Writes are queued and group-committed (or committed one by one in 'fsync' mode).
+    # In 'journal' mode this first replays writes a crash kept from being committed.
+    writes = WriteBehindQueue(storage, DB_DURABILITY, WRITE_BEHIND_INTERVAL, WRITE_BEHIND_MAX_BATCH, WRITE_JOURNAL_DIR)
+
+    # Lookups are served from in-memory indexes; every write goes to both
+    index = RecordIndex(geo_cell_meters=DUPLICATE_RADIUS_METERS, max_reports=MAX_RESIDENT_REPORTS, spill_statuses=ARCHIVE_STATUSES)
+    index.load(storage)
+
+    # Finalized old reports are moved here by archive_reports()
+    archive = ReportArchive(ARCHIVE_DIR)
+
+    # Aggregates for the admin stats command, updated in the same batch as each write
+    stats = ReportStats()
+    if not stats.load(storage):
+        hot_ids = set()
+        def _hot_reports():
+            # From storage rather than the index, which may not hold every document
+            for report in storage.iter_reports():
+                hot_ids.add(report['report_id'])
+                yield report
+        all_reports = itertools.chain(
+            _hot_reports(),
+            (report for report in archive.iter_reports() if report['report_id'] not in hot_ids),
+        )
+        writes.submit_batch(stats.rebuild(all_reports, storage.iter_ledger(), len(index.users)))
+        logger.info("Built report statistics from existing data")
+
+    atexit.register(close_database)
+    _backfill_ledger()
+
+@timed(db_seconds, db_errors)
+def close_database():
+    """Flushes queued writes and closes the storage backend. Safe to call twice; init() opens it again."""
+    global storage
+    if storage is None:
+        return
+    writes.stop()
+    storage.close()
+    storage = None
+    atexit.unregister(close_database)
+    logger.info("Database flushed and closed.")
+
+def _writes(func):
+    """
+    Refuses the call while queued writes cannot be committed. Each write
+    changes the in-memory indexes and statistics at once, which must not
+    show anything storage may never get.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        writes.check()
+        return func(*args, **kwargs)
+    return wrapper
+
+def _ledger_entry(user_id, amount, kind, ref, balance_after):
+    return {
+        'telegram_user_id': user_id,
+        'amount': amount,
+        'kind': kind,  # grant/credit/payout/opening
+        'ref': ref,
+        'balance_after': balance_after,
+        'created_at': datetime.utcnow().isoformat(),
+    }
+
+def _backfill_ledger():
+    """Gives users created before the ledger existed an opening entry for their balance."""
+    if index.ledger_entries or not index.users:
+        return
+    ops = []
+    for user_id, user in index.users.items():
+        balance = user.get('balance', 0)
+        entry = _ledger_entry(user_id, balance, 'opening', f"opening:{user_id}", balance)
+        ops.append(('insert_ledger_entry', (entry,)))
+        ops.extend(stats.ledger_added(entry))
+        index.add_ledger_entry(entry)
+    writes.submit_batch(ops)
+    logger.info(f"Backfilled opening ledger entries for {len(index.users)} users")
+
+def _get_report(report_id):
+    """A hot report from memory, or from storage if it was spilled (None if it isn't hot)."""
+    report = index.get_report(report_id)
+    if report is None and index.spilled:
+        # Storage has to be current before it is read
+        writes.flush()
+        report = storage.get_report(report_id)
+    return report
+
+@timed(db_seconds, db_errors)
+@_writes
 def save_report(user_id, report_data):
     """
     Saves a new accident report to the database.
@@ -25,23 +179,52 @@ def save_report(user_id, report_data):
         'telegram_user_id': user_id,
         'location_geo': report_data.get('location'),
         'location_time': report_data.get('location_timestamp'),
+        'zone': report_data.get('zone'),
         'photo_file_id': report_data.get('photo'),
         'photo_time': report_data.get('photo_timestamp'),
+        'photo_hash': report_data.get('photo_hash'),
         'description': report_data.get('description'),
         'crash_time_delta': report_data.get('crash_time_delta'),
         'submitted_at': submitted_at,
         'status': 'pending', # pending/verified/duplicate/rewarded
         'reward_sent': False
     }
-    reports_table.insert(report)
+
+    # Flag reports close in space and time to an earlier, non-rejected one
+    if report['location_geo']:
+        lat, lon = report['location_geo']
+        nearby = [
+            (other_id, distance)
+            for other_id, distance in index.geo.find_nearby(
+                lat, lon, submitted_at, DUPLICATE_RADIUS_METERS, DUPLICATE_WINDOW_MINUTES
+            )
+            if (_get_report(other_id) or {}).get('status') != 'reddedildi'
+        ]
+        if nearby:
+            report['duplicate_of'] = nearby[0][0]
+            report['duplicate_distance'] = round(nearby[0][1])
+            if AUTO_MARK_DUPLICATES:
+                report['status'] = 'duplicate'
+            logger.info(f"Report {report_id} looks like a duplicate of {nearby[0][0]}")
+
+    # Flag photos that are (nearly) identical to one used in an earlier report
+    if report['photo_hash']:
+        matches = index.photo_hashes.search(int(report['photo_hash'], 16), PHOTO_HASH_MAX_DISTANCE)
+        if matches:
+            report['photo_duplicate_of'] = matches[0][0]
+            report['photo_hash_distance'] = matches[0][1]
+            logger.info(f"Report {report_id} reuses the photo of report {matches[0][0]}")
+
+    writes.submit_batch([('insert_report', (report,)), *stats.report_added(report)])
+    index.add_report(report)
     return report_id
 
+@timed(db_seconds, db_errors)
 def get_or_create_user(user_id, username):
     """
     Retrieves a user profile or creates a new one with an initial balance.
     """
-    User = Query()
-    user = users_table.get(User.telegram_user_id == user_id)
+    user = index.get_user(user_id)
 
     if not user:
         user_profile = {
@@ -53,64 +236,376 @@ def get_or_create_user(user_id, username):
             'report_count': 0,
             'balance': 99  # NEW: Add initial balance of 99 Lira
         }
-        users_table.insert(user_profile)
+        writes.check()
+        with _user_lock:
+            # Another caller may have created the profile while we were building ours
+            user = index.get_user(user_id)
+            if user:
+                return user
+            grant = _ledger_entry(user_id, 99, 'grant', f"grant:{user_id}", 99)
+            writes.submit_batch([
+                ('insert_user', (user_profile,)),
+                ('insert_ledger_entry', (grant,)),
+                *stats.user_added(),
+                *stats.ledger_added(grant),
+            ])
+            index.add_user(user_profile)
+            index.add_ledger_entry(grant)
         return user_profile
     return user
 
-def update_user_balance(user_id, amount_to_add):
+def _apply_balance_change(user_id, amount, kind, ref=None, allow_negative=True):
     """
-    Increments a user's balance by a specified amount.
+    Appends a ledger entry and updates the cached balance in one atomic step.
+    An entry whose `ref` was already applied is skipped, so retries are safe.
+    Returns the new balance, or None if the user does not exist.
     """
-    User = Query()
-    user = users_table.get(User.telegram_user_id == user_id)
-    if user:
+    with _user_lock:
+        user = index.get_user(user_id)
+        if not user:
+            return None
         # Handle cases where older users might not have a balance field
-        current_balance = user.get('balance', 0) 
-        new_balance = current_balance + amount_to_add
-        users_table.update({'balance': new_balance}, User.telegram_user_id == user_id)
-        logger.info(f"Updated balance for user {user_id}. New balance: {new_balance}")
-        return new_balance
-    return None
+        current_balance = user.get('balance', 0)
+        if ref is not None and index.has_ledger_ref(ref):
+            logger.info(f"Ledger entry {ref} already applied for user {user_id}, skipping.")
+            return current_balance
+        new_balance = current_balance + amount
+        if not allow_negative and new_balance < 0:
+            raise InsufficientBalanceError(current_balance)
+        entry = _ledger_entry(user_id, amount, kind, ref, new_balance)
+        writes.submit_batch([
+            ('insert_ledger_entry', (entry,)),
+            ('update_user', (user_id, {'balance': new_balance})),
+            *stats.ledger_added(entry),
+        ])
+        index.add_ledger_entry(entry)
+        index.update_user(user_id, {'balance': new_balance})
+    logger.info(f"Updated balance for user {user_id} ({kind} {amount}). New balance: {new_balance}")
+    return new_balance
 
+@timed(db_seconds, db_errors)
+@_writes
+def update_user_balance(user_id, amount_to_add, kind='credit', ref=None):
+    """
+    Increments a user's balance by a specified amount and records it in the ledger.
+    """
+    return _apply_balance_change(user_id, amount_to_add, kind, ref)
+
+@timed(db_seconds, db_errors)
+@_writes
+def debit_user_balance(user_id, amount, kind='payout', ref=None):
+    """
+    Decrements a user's balance if it covers the amount.
+    Raises InsufficientBalanceError otherwise; returns None for unknown users.
+    """
+    return _apply_balance_change(user_id, -amount, kind, ref, allow_negative=False)
+
+@timed(db_seconds, db_errors)
+@_writes
+def create_payout_run(threshold):
+    """
+    Starts a payout run for every user whose balance is at least `threshold`,
+    each paid their whole balance. Found through the balance-ordered index,
+    so the cost grows with the number of eligible users only. Returns the
+    stored run, or None if nobody is eligible.
+    """
+    with _user_lock:
+        eligible = index.users_with_balance_at_least(threshold)
+        if not eligible:
+            return None
+        created_at = datetime.utcnow()
+        run = {
+            'run_id': created_at.strftime('%Y%m%dT%H%M%S'),
+            'created_at': created_at.isoformat(),
+            'threshold': threshold,
+            'status': 'debiting',  # debiting -> debited -> notified -> done
+            'applied': 0,
+            'items': [],
+        }
+        for balance, user_id in eligible:
+            user = index.users[user_id]
+            run['items'].append({
+                'telegram_user_id': user_id,
+                'username': user.get('username'),
+                'payment_method': user.get('payment_method'),
+                'amount': balance,
+            })
+        writes.submit('put_kv', PAYOUT_RUNS_NAMESPACE, run['run_id'], copy.deepcopy(run))
+    logger.info(f"Payout run {run['run_id']} started for {len(run['items'])} users at or above {threshold}")
+    return run
+
+@timed(db_seconds, db_errors)
+@_writes
+def apply_payout_run(run, batch_size=500):
+    """
+    Debits the next `batch_size` users of a payout run. The debits and the
+    run's progress commit in one batch, so after a restart the run carries on
+    where its last committed batch ended. A user whose balance dropped below
+    their amount since the run started is skipped. Returns the updated run.
+    """
+    run = copy.deepcopy(run)
+    start = run['applied']
+    end = min(start + batch_size, len(run['items']))
+    ops, entries, balances = [], [], {}
+    with _user_lock:
+        for item in run['items'][start:end]:
+            user_id = item['telegram_user_id']
+            ref = f"payout-run:{run['run_id']}:{user_id}"
+            if index.has_ledger_ref(ref):
+                # Debited by an earlier attempt at this batch: take the result from its ledger
+                # entry, so the courier is still notified and listed in the CSV
+                item.pop('skipped', None)
+                item['balance_after'] = _ledger_balance_after(user_id, ref)
+                continue
+            user = index.get_user(user_id)
+            balance = user.get('balance', 0) if user else 0
+            if not user or balance < item['amount']:
+                item['skipped'] = True
+                continue
+            item['balance_after'] = balance - item['amount']
+            entry = _ledger_entry(user_id, -item['amount'], 'payout', ref, item['balance_after'])
+            entries.append(entry)
+            balances[user_id] = item['balance_after']
+            ops.append(('insert_ledger_entry', (entry,)))
+            ops.append(('update_user', (user_id, {'balance': item['balance_after']})))
+            ops.extend(stats.ledger_added(entry))
+        run['applied'] = end
+        if end == len(run['items']):
+            run['status'] = 'debited'
+        ops.append(('put_kv', (PAYOUT_RUNS_NAMESPACE, run['run_id'], copy.deepcopy(run))))
+        writes.submit_batch(ops)
+        for entry in entries:
+            index.add_ledger_entry(entry)
+        for user_id, balance in balances.items():
+            index.update_user(user_id, {'balance': balance})
+    logger.info(f"Payout run {run['run_id']}: debited {len(entries)} users ({end}/{len(run['items'])})")
+    return run
+
+def _ledger_balance_after(user_id, ref):
+    writes.flush()
+    for entry in storage.iter_ledger(user_id):
+        if entry['ref'] == ref:
+            return entry['balance_after']
+    raise LookupError(f"Ledger entry {ref} is indexed but not stored")
+
+@timed(db_seconds, db_errors)
+def get_user_balance(user_id):
+    """Returns the cached balance for a user, or None if the user does not exist."""
+    user = index.users.get(user_id)
+    return user.get('balance', 0) if user else None
+
+@timed(db_seconds, db_errors)
+def get_user_ledger(user_id):
+    """Returns a user's balance history, oldest first."""
+    writes.flush()
+    return list(storage.iter_ledger(user_id))
+
+@timed(db_seconds, db_errors)
+@_writes
 def update_user_profile(user_id, data_to_update):
     """
     Updates a user's profile with new information (e.g., company, report count).
     """
-    User = Query()
-    users_table.update(data_to_update, User.telegram_user_id == user_id)
+    writes.submit('update_user', user_id, dict(data_to_update))
+    index.update_user(user_id, data_to_update)
 
+@timed(db_seconds, db_errors)
 def get_user_report_count_today(user_id):
     """
     Counts how many reports a user has submitted in the last 24 hours.
     """
-    Report = Query()
     twenty_four_hours_ago = (datetime.utcnow() - timedelta(days=1)).isoformat()
-    
-    user_reports = reports_table.search(
-        (Report.telegram_user_id == user_id) & 
-        (Report.submitted_at >= twenty_four_hours_ago)
-    )
-    return len(user_reports)
-    # database.py (add these functions)
-
-def get_report_by_id(report_id):
-    """Retrieves a single report by its unique ID."""
-    Report = Query()
-    report = reports_table.get(Report.report_id == report_id)
+    return index.count_user_reports_since(user_id, twenty_four_hours_ago)
+
+@timed(db_seconds, db_errors)
+def get_report_by_id(report_id, archived=True):
+    """Retrieves a single report by its unique ID, falling back to the archive unless `archived` is False."""
+    report = _get_report(report_id)
+    if report is None and archived:
+        report = get_archived_report(report_id)
     return report
 
+@timed(db_seconds, db_errors)
+def get_archived_report(report_id):
+    """Retrieves a report from the cold store; doesn't touch the in-memory index."""
+    partition = storage.get_archived_partition(report_id)
+    return archive.get(report_id, partition) if partition else None
+
+@timed(db_seconds, db_errors)
+@_writes
+def archive_reports(older_than_days, statuses, batch_size=1000):
+    """
+    Moves up to `batch_size` reports in one of `statuses` and older than
+    `older_than_days` to the monthly cold store. The archive file is
+    written and synced before the reports leave the hot table, so a crash
+    in between only leaves a harmless second copy. Returns how many moved.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat()
+    writes.flush()
+    reports = []
+    for candidate in storage.iter_archivable_reports(statuses, cutoff, batch_size):
+        # The index has the latest status even if the write is still queued (a
+        # spilled report has none queued: storage was just flushed)
+        report = index.get_report(candidate['report_id']) or candidate
+        if report and report.get('status') in statuses:
+            reports.append(report)
+    if not reports:
+        return 0
+    partitions = archive.append(reports)
+    writes.submit_batch([
+        ('archive_report', (report['report_id'], partitions[report['report_id']], report.get('photo_hash')))
+        for report in reports
+    ])
+    writes.flush()
+    for report in reports:
+        index.remove_report(report)
+    logger.info(f"Archived {len(reports)} reports older than {cutoff}")
+    return len(reports)
+
+@timed(db_seconds, db_errors)
+@_writes
 def update_report_status(report_id, new_status, admin_id):
     """Updates the status of a report and logs which admin did it."""
-    Report = Query()
-    reports_table.update(
-        {'status': new_status, 'reviewed_by': admin_id}, 
-        Report.report_id == report_id
-    )
+    report = _get_report(report_id)
+    if report is None and storage.get_archived_partition(report_id):
+        logger.warning(f"Report {report_id} is archived; status change to {new_status} not applied")
+        return
+    stats_ops = stats.status_changed(report, report.get('status'), new_status) if report else []
+    writes.submit_batch([('update_report', (report_id, {'status': new_status, 'reviewed_by': admin_id})), *stats_ops])
+    index.update_report(report_id, {'status': new_status, 'reviewed_by': admin_id})
+
+@timed(db_seconds, db_errors)
+@_writes
+def save_admin_messages(report_id, messages):
+    """Records the (chat_id, message_id) of each admin's notification, so a decision can update them all."""
+    fields = {'admin_messages': [list(message) for message in messages]}
+    writes.submit('update_report', report_id, fields)
+    index.update_report(report_id, fields)
+
+@timed(db_seconds, db_errors)
+def get_pending_reports(after_id=None, before_id=None, limit=10):
+    """
+    One page of undecided (pending or duplicate) reports, oldest first, for
+    the admin review queue.
+    The page starts after (or ends before) the report `after_id`/`before_id`,
+    by (submitted_at, report_id), so paging stays stable while reports are
+    decided and submitted. Returns {'reports', 'has_previous', 'has_next', 'total'}.
+    """
+    after = before = None
+    cursor = _get_report(after_id or before_id) if (after_id or before_id) else None
+    if cursor:
+        key = (cursor.get('submitted_at') or '', cursor['report_id'])
+        after, before = (key, None) if after_id else (None, key)
+    keys, has_previous, has_next = index.pending_page(after, before, limit)
+    reports = [report for report in (index.get_report(report_id) for _, report_id in keys) if report]
+    return {'reports': reports, 'has_previous': has_previous, 'has_next': has_next, 'total': len(index.pending)}
 
+@timed(db_seconds, db_errors)
+@_writes
+def review_reports(report_ids, new_status, admin_id, reward_amount=0):
+    """
+    Sets `new_status` on every report in `report_ids` that is still undecided
+    and credits `reward_amount` to each one's courier, all in one transaction.
+    A report is decided once: later calls for it change nothing, which is
+    what makes repeated or concurrent admin callbacks safe.
+    Returns [(report, new balance or None)] for the reports that changed.
+    """
+    ops, decided, balances, entries = [], [], {}, []
+    with _user_lock:
+        for report_id in report_ids:
+            report = _get_report(report_id)
+            if not report or report.get('status') not in UNDECIDED_STATUSES:
+                continue
+            ops.append(('update_report', (report_id, {'status': new_status, 'reviewed_by': admin_id})))
+            ops.extend(stats.status_changed(report, report.get('status'), new_status))
+            new_balance = None
+            user_id = report['telegram_user_id']
+            ref = f"report:{report_id}"
+            user = index.users.get(user_id)
+            if reward_amount and user and not index.has_ledger_ref(ref):
+                new_balance = balances.get(user_id, user.get('balance', 0)) + reward_amount
+                balances[user_id] = new_balance
+                entry = _ledger_entry(user_id, reward_amount, 'credit', ref, new_balance)
+                entries.append(entry)
+                ops.append(('insert_ledger_entry', (entry,)))
+                ops.extend(stats.ledger_added(entry))
+            decided.append((report, new_balance))
+        ops.extend(('update_user', (user_id, {'balance': balance})) for user_id, balance in balances.items())
+        if not ops:
+            return []
+        writes.submit_batch(ops)
+        for report, _ in decided:
+            index.update_report(report['report_id'], {'status': new_status, 'reviewed_by': admin_id})
+        for entry in entries:
+            index.add_ledger_entry(entry)
+        for user_id, balance in balances.items():
+            index.update_user(user_id, {'balance': balance})
+    logger.info(f"Admin {admin_id} set {len(decided)} reports to {new_status} in one batch")
+    return decided
+
+@timed(db_seconds, db_errors)
+def get_stats(days=7):
+    """Returns totals, the last `days` daily rollups and the top reporters."""
+    return stats.summary(datetime.utcnow().date(), days)
+
+@timed(db_seconds, db_errors)
+def export_reports(path, since=None, fmt='csv'):
+    """
+    Streams reports submitted after `since` to a file, a chunk at a time,
+    archived ones included. Returns (rows written, new watermark).
+    """
+    writes.flush()
+    return export.export_reports(storage, path, fmt, since, archive=archive)
+
+@timed(db_seconds, db_errors)
 def get_user_by_id(user_id):
     """
     Retrieves a user profile by their Telegram user ID.
     """
-    User = Query()
-    user = users_table.get(User.telegram_user_id == user_id)
-    return user
+    return index.get_user(user_id)
+
+# --- Outbound message queue ---
+
+@timed(db_seconds, db_errors)
+@_writes
+def save_outbox_message(entry):
+    """Persists an outgoing message until it has been delivered."""
+    writes.submit('insert_outbox', dict(entry))
+
+@timed(db_seconds, db_errors)
+@_writes
+def update_outbox_message(outbox_id, fields):
+    """Updates delivery bookkeeping (e.g. attempts) for a queued message."""
+    writes.submit('update_outbox', outbox_id, dict(fields))
+
+@timed(db_seconds, db_errors)
+@_writes
+def delete_outbox_message(outbox_id):
+    """Removes a message from the outbox once it is delivered or dropped."""
+    writes.submit('delete_outbox', outbox_id)
+
+@timed(db_seconds, db_errors)
+def get_outbox_messages():
+    """Returns every undelivered message, oldest first."""
+    writes.flush()
+    return list(storage.iter_outbox())
+
+# --- Key/value namespaces (conversation state, user_data, ...) ---
+
+@timed(db_seconds, db_errors)
+@_writes
+def put_state(namespace, key, value):
+    """Stores a JSON-serializable value under (namespace, key)."""
+    writes.submit('put_kv', namespace, key, value)
+
+@timed(db_seconds, db_errors)
+@_writes
+def delete_state(namespace, key):
+    """Removes the value stored under (namespace, key), if any."""
+    writes.submit('delete_kv', namespace, key)
+
+@timed(db_seconds, db_errors)
+def get_state(namespace):
+    """Returns every stored value in a namespace as a dict."""
+    writes.flush()
+    return dict(storage.iter_kv(namespace))
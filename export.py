@@ -0,0 +1,220 @@
+# export.py - Streaming export of reports and users to CSV or Parquet
+import argparse
+import csv
+import itertools
+import logging
+import os
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional; without it only CSV exports are available
+    pyarrow = None
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+REPORT_COLUMNS = [
+    ('report_id', 'string'),
+    ('telegram_user_id', 'int64'),
+    ('submitted_at', 'string'),
+    ('status', 'string'),
+    ('zone', 'string'),
+    ('latitude', 'float64'),
+    ('longitude', 'float64'),
+    ('location_time', 'string'),
+    ('photo_file_id', 'string'),
+    ('photo_time', 'string'),
+    ('photo_hash', 'string'),
+    ('description', 'string'),
+    ('crash_time_delta', 'int64'),
+    ('duplicate_of', 'string'),
+    ('duplicate_distance', 'int64'),
+    ('photo_duplicate_of', 'string'),
+    ('reviewed_by', 'int64'),
+]
+
+USER_COLUMNS = [
+    ('telegram_user_id', 'int64'),
+    ('username', 'string'),
+    ('created_at', 'string'),
+    ('courier_company', 'string'),
+    ('payment_method', 'string'),
+    ('report_count', 'int64'),
+    ('balance', 'float64'),
+]
+
+FORMATS = ('csv', 'parquet')
+
+
+def report_row(report):
+    """Flattens a report document into the REPORT_COLUMNS layout."""
+    row = {name: report.get(name) for name, _ in REPORT_COLUMNS}
+    location = report.get('location_geo')
+    row['latitude'], row['longitude'] = location if location else (None, None)
+    return row
+
+
+def user_row(user):
+    return {name: user.get(name) for name, _ in USER_COLUMNS}
+
+
+class _CSVWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=[name for name, _ in columns])
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    # One row group per chunk, so only a chunk's worth of columns is ever in memory
+    def __init__(self, path, columns):
+        self.columns = columns
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, kind)()) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, rows):
+        arrays = {name: [_coerce(row[name], kind) for row in rows] for name, kind in self.columns}
+        self.writer.write_table(pyarrow.Table.from_pydict(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def _coerce(value, kind):
+    # Older documents are not consistently typed (e.g. numbers stored as strings)
+    if value is None:
+        return None
+    try:
+        if kind == 'int64':
+            return int(value)
+        if kind == 'float64':
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+
+def _open_writer(path, fmt, columns):
+    if fmt == 'parquet':
+        if pyarrow is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        return _ParquetWriter(path, columns)
+    if fmt == 'csv':
+        return _CSVWriter(path, columns)
+    raise ValueError(f"Unknown export format: {fmt!r} (expected one of {', '.join(FORMATS)})")
+
+
+def _archived_chunks(storage, archive, since, chunk_size):
+    """
+    Archived reports submitted after `since`, a chunk at a time. A copy left
+    in the archive by an archival run that never committed belongs to a
+    report still in the hot table, which exports it; that copy is skipped.
+    """
+    chunk = []
+    for report in archive.iter_reports(since):
+        if since is not None and (report.get('submitted_at') or '') <= since:
+            continue
+        if storage.get_archived_partition(report['report_id']) is None:
+            continue
+        chunk.append(report)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_reports(storage, path, fmt='csv', since=None, chunk_size=5000, archive=None):
+    """
+    Streams reports submitted after `since` (all if None) to `path`: those
+    moved to `archive` (a ReportArchive) first, then the hot table. Without
+    `archive` only hot reports are exported.
+    Returns (rows written, watermark): the latest submitted_at exported, to
+    pass as `since` next time, or `since` itself if nothing was new.
+    """
+    writer = _open_writer(path, fmt, REPORT_COLUMNS)
+    count, watermark = 0, since
+    chunks = storage.iter_report_chunks(since, chunk_size)
+    if archive is not None:
+        chunks = itertools.chain(_archived_chunks(storage, archive, since, chunk_size), chunks)
+    try:
+        for chunk in chunks:
+            writer.write([report_row(report) for report in chunk])
+            count += len(chunk)
+            # Archived chunks are in file order, not sorted like the hot ones
+            watermark = max(filter(None, [watermark, *(report.get('submitted_at') for report in chunk)]), default=watermark)
+    finally:
+        writer.close()
+    logger.info(f"Exported {count} reports to {path}")
+    return count, watermark
+
+
+def export_users(storage, path, fmt='csv', chunk_size=5000):
+    """Streams every user profile to `path`. Returns the number of rows written."""
+    writer = _open_writer(path, fmt, USER_COLUMNS)
+    count = 0
+    try:
+        for chunk in storage.iter_user_chunks(chunk_size):
+            writer.write([user_row(user) for user in chunk])
+            count += len(chunk)
+    finally:
+        writer.close()
+    logger.info(f"Exported {count} users to {path}")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export reports and users without loading the database into memory.")
+    parser.add_argument('database', help="kazabot.db (SQLite) or kazabot_db.json (legacy TinyDB)")
+    parser.add_argument('out_dir')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--since', help="only reports submitted after this ISO timestamp")
+    parser.add_argument('--incremental', action='store_true',
+                        help="continue from the watermark saved in out_dir by the previous --incremental run")
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--archive-dir',
+                        help="the bot's ARCHIVE_DIR, whose reports are exported too (default: archive/ next to the database)")
+    parser.add_argument('--hot-only', action='store_true', help="leave archived reports out")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+
+    from archive import ReportArchive
+    from storage import SQLiteStorage, TinyDBStorage
+    storage = TinyDBStorage(args.database) if args.database.endswith('.json') else SQLiteStorage(args.database)
+    archive_dir = args.archive_dir or os.path.join(os.path.dirname(os.path.abspath(args.database)), 'archive')
+    archive = None if args.hot_only else ReportArchive(archive_dir)
+    os.makedirs(args.out_dir, exist_ok=True)
+    watermark_path = os.path.join(args.out_dir, 'reports.watermark')
+    since = args.since
+    if args.incremental and since is None and os.path.exists(watermark_path):
+        with open(watermark_path, encoding='utf-8') as f:
+            since = f.read().strip() or None
+
+    # Incremental exports get their own file each, named after where they start;
+    # one without the archived reports says so
+    suffix = f"-since-{since.replace(':', '')}" if since else ''
+    if archive is None:
+        suffix += '-hot'
+    reports_path = os.path.join(args.out_dir, f"reports{suffix}.{args.format}")
+    try:
+        count, watermark = export_reports(storage, reports_path, args.format, since, args.chunk_size, archive)
+        export_users(storage, os.path.join(args.out_dir, f"users.{args.format}"), args.format, args.chunk_size)
+    finally:
+        storage.close()
+    if not count:
+        os.remove(reports_path)
+    if args.incremental and watermark:
+        with open(watermark_path, 'w', encoding='utf-8') as f:
+            f.write(watermark)
+    print(f"{count} reports exported, watermark {watermark}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# geoindex.py - Spatial-temporal grid index for finding nearby recent reports
+import bisect
+import math
+from datetime import datetime, timedelta
+
+EARTH_RADIUS_METERS = 6371000
+METERS_PER_DEGREE_LAT = 111320
+
+
+def haversine_meters(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+
+class SpatialTemporalIndex:
+    """
+    Buckets reports into a grid of `cell_meters` squares (sized at the
+    reference latitude, İzmir by default). Each bucket keeps its reports
+    sorted by submission time, so a lookup checks the 3x3 cells around a
+    point and bisects each one to the time window.
+    """
+
+    def __init__(self, cell_meters=200, reference_lat=38.42):
+        self.cell_meters = cell_meters
+        self.cell_lat = cell_meters / METERS_PER_DEGREE_LAT
+        self.cell_lon = cell_meters / (METERS_PER_DEGREE_LAT * math.cos(math.radians(reference_lat)))
+        self.buckets = {}
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_lat)), int(math.floor(lon / self.cell_lon))
+
+    def add(self, report_id, lat, lon, submitted_at):
+        bucket = self.buckets.setdefault(self._cell(lat, lon), [])
+        bisect.insort(bucket, (submitted_at, report_id, lat, lon))
+
+    def remove(self, report_id, lat, lon, submitted_at):
+        bucket = self.buckets.get(self._cell(lat, lon))
+        if not bucket:
+            return
+        i = bisect.bisect_left(bucket, (submitted_at, report_id, lat, lon))
+        if i < len(bucket) and bucket[i][1] == report_id:
+            del bucket[i]
+            if not bucket:
+                del self.buckets[self._cell(lat, lon)]
+
+    def find_nearby(self, lat, lon, submitted_at, radius_meters, window_minutes):
+        """
+        Returns (report_id, distance_m) for reports within `radius_meters` and
+        `window_minutes` of the given point/time, closest first.
+        `radius_meters` must not exceed the cell size.
+        """
+        moment = datetime.fromisoformat(submitted_at)
+        start = (moment - timedelta(minutes=window_minutes)).isoformat()
+        end = (moment + timedelta(minutes=window_minutes)).isoformat()
+        cx, cy = self._cell(lat, lon)
+        matches = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                bucket = self.buckets.get((cx + dx, cy + dy))
+                if not bucket:
+                    continue
+                i = bisect.bisect_left(bucket, (start,))
+                while i < len(bucket) and bucket[i][0] <= end:
+                    _, report_id, other_lat, other_lon = bucket[i]
+                    distance = haversine_meters(lat, lon, other_lat, other_lon)
+                    if distance <= radius_meters:
+                        matches.append((report_id, distance))
+                    i += 1
+        matches.sort(key=lambda match: match[1])
+        return matches
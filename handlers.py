@@ -1,7 +1,11 @@
 # handlers.py
+import asyncio
 import logging
+import os
+import tempfile
 from datetime import datetime
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import TelegramError
 from telegram.ext import (
     ContextTypes,
     ConversationHandler,
@@ -10,17 +14,60 @@ from telegram.ext import (
     CallbackQueryHandler,
     filters,
 )
-from database import ( 
+from async_database import ( 
     save_report, 
     get_or_create_user, 
     update_user_profile,
     get_user_report_count_today,
     get_report_by_id, 
-    update_report_status,
-    update_user_balance,
-    get_user_by_id
+    get_pending_reports,
+    review_reports,
+    save_admin_messages,
+    debit_user_balance,
+    get_user_by_id,
+    get_stats,
+    export_reports,
+    get_state,
+    put_state,
+    InsufficientBalanceError,
+)
+from config import (
+    ADMIN_IDS,
+    PAYOUT_THRESHOLD,
+    MAX_REPORTS_PER_DAY,
+    REWARD_AMOUNT,
+    SERVICE_ZONES_TEXT,
+    WELCOME_PHOTO_FILE_ID,
+    ADMIN_NOTIFY_CONCURRENCY,
+    PENDING_PAGE_SIZE,
+    REVIEW_CLAIM_TTL,
+    PROCESSED_CALLBACK_TTL,
+    PHOTO_HASH_WORKERS,
+    SERVICE_ZONES_GEOJSON,
+    OUT_OF_ZONE_ACTION,
+    ANALYTICS_DIR,
+    ANALYTICS_FLUSH_INTERVAL,
+    ANALYTICS_BUFFER_SIZE,
+    ANALYTICS_ROTATE_BYTES,
+)
+from outbox import outbox
+from ratelimit import PRIORITY_NOTIFICATION, PRIORITY_BROADCAST
+from photohash import PhotoHasher
+from zones import load_zone_index
+from analytics import EventTracker, track
+from claims import ExpiringSet, ReviewClaims
+from metrics import (
+    timed,
+    gauge,
+    busiest,
+    gauge_value,
+    handler_seconds,
+    handler_errors,
+    db_seconds,
+    db_errors,
+    telegram_seconds,
+    telegram_errors,
 )
-from config import ADMIN_IDS, PAYOUT_THRESHOLD, REWARD_AMOUNT, SERVICE_ZONES_TEXT, WELCOME_PHOTO_FILE_ID
 from localization import STRINGS # <-- Import the localized strings
 
 # Enable logging
@@ -39,6 +86,33 @@ logger = logging.getLogger(__name__)
     COMPANY_NAME,
 ) = range(6)
 
+# Report photos are downloaded and hashed in the background while the courier continues
+photo_hasher = PhotoHasher(PHOTO_HASH_WORKERS)
+
+# Funnel events from every conversation step and command (see analytics.py)
+tracker = EventTracker(
+    ANALYTICS_DIR,
+    state_names={
+        LOCATION: 'LOCATION',
+        PHOTO: 'PHOTO',
+        DESCRIPTION: 'DESCRIPTION',
+        CRASH_TIME_DELTA: 'CRASH_TIME_DELTA',
+        CONFIRMATION: 'CONFIRMATION',
+        ConversationHandler.END: 'END',
+    },
+    buffer_size=ANALYTICS_BUFFER_SIZE,
+    flush_interval=ANALYTICS_FLUSH_INTERVAL,
+    rotate_bytes=ANALYTICS_ROTATE_BYTES,
+)
+gauge('kazabot_analytics_buffered', "Funnel events waiting to be written", lambda: len(tracker.buffer))
+
+# First decision on a report wins; see review_handler
+review_claims = ReviewClaims(REVIEW_CLAIM_TTL)
+processed_callbacks = ExpiringSet(PROCESSED_CALLBACK_TTL)
+
+# Service-zone polygons, indexed once at startup (None if no zone file is configured)
+zone_index = load_zone_index(SERVICE_ZONES_GEOJSON)
+
 # Reusable keyboard with localized buttons
 NEW_REPORT_KEYBOARD = ReplyKeyboardMarkup(
     [
@@ -50,12 +124,22 @@ NEW_REPORT_KEYBOARD = ReplyKeyboardMarkup(
 
 # --- Start & Cancel ---
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starts the conversation with a localized welcome message."""
     user = update.message.from_user
     logger.info("User %s started the conversation.", user.first_name)
+
+    # Checked before anything is written; the count comes from the in-memory index
+    if await get_user_report_count_today(user.id) >= MAX_REPORTS_PER_DAY:
+        await update.message.reply_text(
+            STRINGS['daily_limit_reached'].format(limit=MAX_REPORTS_PER_DAY),
+            reply_markup=NEW_REPORT_KEYBOARD,
+        )
+        return ConversationHandler.END
     
-    get_or_create_user(user.id, user.username)
+    await get_or_create_user(user.id, user.username)
 
     location_keyboard = KeyboardButton(text=STRINGS['share_location_button'], request_location=True)
     custom_keyboard = [[location_keyboard]]
@@ -82,12 +166,27 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 # --- Reporting Flow ---
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'location')
 async def location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Stores the location and asks for a photo using localized text."""
     user_location = update.message.location
+    zone = None
+    if zone_index:
+        zone = zone_index.lookup(user_location.latitude, user_location.longitude)
+        if zone is None and OUT_OF_ZONE_ACTION == 'reject':
+            logger.info("Out-of-zone location from %s: %s", update.message.from_user.first_name, user_location)
+            location_keyboard = KeyboardButton(text=STRINGS['share_location_button'], request_location=True)
+            await update.message.reply_text(
+                STRINGS['location_out_of_zone'].format(service_zones=SERVICE_ZONES_TEXT),
+                reply_markup=ReplyKeyboardMarkup([[location_keyboard]], resize_keyboard=True, one_time_keyboard=True),
+            )
+            return LOCATION
+
     context.user_data['report'] = {
         'location': (user_location.latitude, user_location.longitude),
-        'location_timestamp': datetime.utcnow().isoformat()
+        'location_timestamp': datetime.utcnow().isoformat(),
+        'zone': zone
     }
     logger.info("Location from %s: %s", update.message.from_user.first_name, user_location)
     
@@ -97,11 +196,14 @@ async def location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     )
     return PHOTO
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'photo')
 async def photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Stores the photo and asks for a description using localized text."""
     user_photo = update.message.photo[-1]
     context.user_data['report']['photo'] = user_photo.file_id
     context.user_data['report']['photo_timestamp'] = datetime.utcnow().isoformat()
+    photo_hasher.prefetch(context.bot, user_photo.file_id)
     
     logger.info("Photo received from %s", update.message.from_user.first_name)
     
@@ -112,6 +214,8 @@ async def photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     )
     return DESCRIPTION
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'description')
 async def description(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Stores the description and asks for the time delta using localized text."""
     user_description = update.message.text
@@ -130,6 +234,8 @@ async def description(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     )
     return CRASH_TIME_DELTA
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'description')
 async def description_skip(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Skips the description and asks for the time delta using localized text."""
     context.user_data['report']['description'] = None
@@ -140,6 +246,8 @@ async def description_skip(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     )
     return CRASH_TIME_DELTA
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'crash_time_delta')
 async def crash_time_delta(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Stores the time delta and shows a localized summary."""
     text = update.message.text
@@ -168,6 +276,8 @@ async def crash_time_delta(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     )
     return CONFIRMATION
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'submit')
 async def submit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Submits the report and ends the conversation with localized messages."""
     user = update.message.from_user
@@ -177,14 +287,20 @@ async def submit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.message.reply_text(STRINGS['generic_error'])
         return ConversationHandler.END
 
-    report_id = save_report(user.id, report_data)
+    report_data['photo_hash'] = await photo_hasher.get_hash(context.bot, report_data['photo'])
+    report_id = await save_report(user.id, report_data)
     logger.info("User %s submitted report %s", user.first_name, report_id)
+    saved_report = await get_report_by_id(report_id)
 
-    user_profile = get_or_create_user(user.id, user.username)
+    user_profile = await get_or_create_user(user.id, user.username)
     new_count = user_profile.get('report_count', 0) + 1
-    update_user_profile(user.id, {'report_count': new_count})
+    await update_user_profile(user.id, {'report_count': new_count})
     
-    await notify_admins(context, user, report_id, report_data)
+    # Reply to the courier first; the admin fan-out runs in the background
+    context.application.create_task(
+        notify_admins(context, user, report_id, dict(report_data), saved_report),
+        update=update,
+    )
     
     await update.message.reply_text(STRINGS['report_submitted'])
     return await finish(update, context)
@@ -198,19 +314,11 @@ async def finish(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     )
     return ConversationHandler.END
 
-async def notify_admins(context: ContextTypes.DEFAULT_TYPE, user, report_id, report_data):
-    """Sends a localized notification to admins."""
-    lat, lon = report_data['location']
-    maps_link = f"https://www.google.com/maps/search/?api=1&query={lat},{lon}"
-
-    admin_message = (
-        f"{STRINGS['admin_notification_header']}\n\n"
-        f"📍 Konum (Google Haritalar):\n{maps_link}\n\n"
-        f"{STRINGS['admin_report_id_label']}: {report_id}\n"
-        f"{STRINGS['admin_submitted_by_label']}: @{user.username} (ID: {user.id})\n"
-        f"{STRINGS['admin_description_label']}: {report_data.get('description', 'N/A')}\n"
-        f"{STRINGS['admin_time_delta_label']}: ~{report_data.get('crash_time_delta')} dakika önce"
-    )
+@timed(handler_seconds, handler_errors)
+async def notify_admins(context: ContextTypes.DEFAULT_TYPE, user, report_id, report_data, saved_report=None):
+    """Sends a localized notification (photo + details + buttons) to all admins concurrently."""
+    report = saved_report or dict(report_data, report_id=report_id, telegram_user_id=user.id, location_geo=report_data['location'])
+    admin_message = _admin_caption(report, user.username)
     
     keyboard = [
         [
@@ -220,19 +328,70 @@ async def notify_admins(context: ContextTypes.DEFAULT_TYPE, user, report_id, rep
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    for admin_id in ADMIN_IDS:
-        try:
-            await context.bot.send_photo(chat_id=admin_id, photo=report_data['photo'])
-            await context.bot.send_message(
+    semaphore = asyncio.Semaphore(ADMIN_NOTIFY_CONCURRENCY)
+
+    async def notify(admin_id):
+        # The outbox retries failed sends (RetryAfter is handled by the rate limiter)
+        async with semaphore:
+            message = await outbox.send(
+                context.bot,
+                'send_photo',
+                PRIORITY_BROADCAST,
                 chat_id=admin_id,
-                text=admin_message,
+                photo=report_data['photo'],
+                caption=admin_message,
                 reply_markup=reply_markup,
-                disable_web_page_preview=True
             )
+        if message:
             logger.info(f"Sent notification for report {report_id} to admin {admin_id}")
-        except Exception as e:
-            logger.error(f"Failed to send notification to admin {admin_id}: {e}")
+        return message
+
+    messages = await asyncio.gather(*(notify(admin_id) for admin_id in ADMIN_IDS))
+    # Kept with the report so a decision can update every admin's copy
+    sent = [(message.chat_id, message.message_id) for message in messages if message]
+    if sent:
+        await save_admin_messages(report_id, sent)
+    return messages
+
+def _admin_caption(report, username):
+    """The caption of a report's admin notification, built from the saved report."""
+    lat, lon = report['location_geo']
+    maps_link = f"https://www.google.com/maps/search/?api=1&query={lat},{lon}"
+
+    caption = (
+        f"{STRINGS['admin_notification_header']}\n\n"
+        f"📍 Konum (Google Haritalar):\n{maps_link}\n\n"
+        f"{STRINGS['admin_report_id_label']}: {report['report_id']}\n"
+        f"{STRINGS['admin_submitted_by_label']}: @{username} (ID: {report['telegram_user_id']})\n"
+        f"{STRINGS['admin_description_label']}: {report.get('description', 'N/A')}\n"
+        f"{STRINGS['admin_time_delta_label']}: ~{report.get('crash_time_delta')} dakika önce"
+    )
+    if zone_index:
+        if report.get('zone'):
+            caption += f"\n{STRINGS['admin_zone_label']}: {report['zone']}"
+        else:
+            caption += "\n\n" + STRINGS['admin_out_of_zone_warning']
+    if report.get('duplicate_of'):
+        caption += "\n\n" + STRINGS['admin_duplicate_warning'].format(
+            report_id=report['duplicate_of'], distance=report.get('duplicate_distance')
+        )
+    if report.get('photo_duplicate_of'):
+        caption += "\n\n" + STRINGS['admin_photo_reuse_warning'].format(
+            report_id=report['photo_duplicate_of']
+        )
+    if report.get('status') == 'duplicate':
+        caption += "\n" + STRINGS['admin_auto_duplicate']
+    return caption
+
+def _decision_text(new_status, admin_user):
+    return (
+        f"\n\n{STRINGS['admin_decision_header']}\n"
+        f"{STRINGS['admin_status_label']} {new_status.upper()} "
+        f"{STRINGS['admin_reviewed_by_label']} @{admin_user.username}."
+    )
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'cancel')
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancels the conversation with a localized message."""
     user = update.message.from_user
@@ -244,42 +403,241 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     )
     return ConversationHandler.END
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'review')
 async def review_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handles admin decisions with localized feedback."""
+    """
+    Handles admin decisions with localized feedback. The first decision on a
+    report wins: a redelivered callback, a double tap or a second admin's
+    press is answered without touching the database or the courier again.
+    """
     query = update.callback_query
-    await query.answer()
+    if not processed_callbacks.add(query.id):
+        await query.answer()
+        return
 
     admin_user = query.from_user
+    if admin_user.id not in ADMIN_IDS:
+        await query.answer(STRINGS['payout_unauthorized'], show_alert=True)
+        return
     action, report_id = query.data.split("_")
-
-    report = get_report_by_id(report_id)
     new_status = "onaylandı" if action == "approve" else "reddedildi"
-    update_report_status(report_id, new_status, admin_user.id)
-    
-    final_text = (
-        f"{query.message.text}\n\n{STRINGS['admin_decision_header']}\n"
-        f"{STRINGS['admin_status_label']} {new_status.upper()} "
-        f"{STRINGS['admin_reviewed_by_label']} @{admin_user.username}."
-    )
-    await query.edit_message_text(text=final_text)
+
+    holder = review_claims.claim(report_id, admin_user.id)
+    if holder != admin_user.id:
+        await query.answer(STRINGS['review_claimed'].format(admin_id=holder), show_alert=True)
+        return
+
+    try:
+        decided = await review_reports([report_id], new_status, admin_user.id, REWARD_AMOUNT if action == "approve" else 0)
+    except Exception:
+        review_claims.release(report_id, admin_user.id)
+        raise
+    if not decided:
+        # Decided earlier (by this admin, another one, or before a restart)
+        report = await get_report_by_id(report_id)
+        if not report:
+            await query.answer(STRINGS['review_report_missing'], show_alert=True)
+            return
+        await query.answer(
+            STRINGS['review_already_decided'].format(status=report.get('status', '').upper(), admin_id=report.get('reviewed_by')),
+            show_alert=True,
+        )
+        return
+    await query.answer()
+    report, new_balance = decided[0]
+
+    decision = _decision_text(new_status, admin_user)
+    # Notifications are photos with a caption; older ones were plain text messages
+    if query.message.photo:
+        await query.edit_message_caption(caption=f"{query.message.caption}{decision}")
+        # The other admins got the same caption; their buttons go away with the edit
+        own_message = (query.message.chat.id, query.message.message_id)
+        await asyncio.gather(*(
+            _edit_admin_caption(context, chat_id, message_id, f"{query.message.caption}{decision}")
+            for chat_id, message_id in report.get('admin_messages', [])
+            if (chat_id, message_id) != own_message
+        ))
+    else:
+        await query.edit_message_text(text=f"{query.message.text}{decision}")
 
     original_user_id = report['telegram_user_id']
-    user_notification = STRINGS['user_update_notification'].format(report_id=report['report_id'], status=new_status)
-    
-    if action == 'approve':
-        reward_amount = 100
-        new_balance = update_user_balance(original_user_id, reward_amount)
-        user_notification += STRINGS['user_reward_notification'].format(reward_amount=reward_amount, new_balance=new_balance)
+    user_notification = _status_notification(report['report_id'], new_status, REWARD_AMOUNT, new_balance)
     
+    message = await outbox.send(
+        context.bot,
+        'send_message',
+        PRIORITY_NOTIFICATION,
+        chat_id=original_user_id,
+        text=user_notification,
+        parse_mode='Markdown'
+    )
+    if not message:
+        logger.error(f"Failed to send status update to user {original_user_id}, queued for retry")
+
+async def _edit_admin_caption(context, chat_id, message_id, caption):
     try:
-        await context.bot.send_message(
-            chat_id=original_user_id,
-            text=user_notification,
+        await context.bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=caption)
+    except TelegramError as e:
+        # e.g. the admin deleted the message; the decision itself is already saved
+        logger.warning(f"Could not update the notification {message_id} of admin {chat_id}: {e}")
+
+def _status_notification(report_id, new_status, reward_amount, new_balance=None):
+    """The courier's message about a decision on their report (with the reward if one was credited)."""
+    text = STRINGS['user_update_notification'].format(report_id=report_id, status=new_status)
+    if new_balance is not None:
+        text += STRINGS['user_reward_notification'].format(reward_amount=reward_amount, new_balance=new_balance)
+    return text
+
+# --- Pending review queue ---
+
+PENDING_PAGES_KEPT = 10  # per chat, for the bulk buttons of recently shown pages
+
+async def _render_pending_page(page):
+    """Text and inline keyboard for one page of get_pending_reports()."""
+    reports = page['reports']
+    if not reports:
+        return STRINGS['pending_empty'], None
+
+    lines = [STRINGS['pending_header'].format(total=page['total'])]
+    names = {}
+    for number, report in enumerate(reports, start=1):
+        user_id = report['telegram_user_id']
+        if user_id not in names:
+            user = await get_user_by_id(user_id)
+            names[user_id] = f"@{user['username']}" if user and user.get('username') else str(user_id)
+        description = report.get('description') or '-'
+        lines += ["", STRINGS['pending_row'].format(
+            number=number,
+            submitted_at=(report.get('submitted_at') or '')[:16].replace('T', ' '),
+            name=names[user_id],
+            zone=report.get('zone') or '-',
+            report_id=report['report_id'],
+            description=description if len(description) <= 80 else description[:79] + '…',
+        )]
+        if report.get('duplicate_of'):
+            flag = 'pending_row_auto_duplicate' if report.get('status') == 'duplicate' else 'pending_row_duplicate'
+            lines.append(STRINGS[flag].format(report_id=report['duplicate_of'], distance=report.get('duplicate_distance')))
+        if report.get('photo_duplicate_of'):
+            lines.append(STRINGS['pending_row_photo_reuse'].format(report_id=report['photo_duplicate_of']))
+
+    navigation = []
+    if page['has_previous']:
+        navigation.append(InlineKeyboardButton(STRINGS['pending_previous_button'], callback_data=f"pending_prev_{reports[0]['report_id']}"))
+    if page['has_next']:
+        navigation.append(InlineKeyboardButton(STRINGS['pending_next_button'], callback_data=f"pending_next_{reports[-1]['report_id']}"))
+    keyboard = [
+        [
+            InlineKeyboardButton(STRINGS['pending_approve_all_button'].format(count=len(reports)), callback_data="pending_approve"),
+            InlineKeyboardButton(STRINGS['pending_reject_all_button'].format(count=len(reports)), callback_data="pending_reject"),
+        ]
+    ]
+    if navigation:
+        keyboard.append(navigation)
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+def _remember_pending_page(context, message_id, page):
+    # The bulk buttons act on exactly the reports this message shows
+    pages = context.chat_data.setdefault('pending_pages', {})
+    pages.pop(message_id, None)
+    pages[message_id] = [report['report_id'] for report in page['reports']]
+    while len(pages) > PENDING_PAGES_KEPT:
+        del pages[next(iter(pages))]
+
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'bekleyen')
+async def bekleyen_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin-only list of pending reports, oldest first, a page at a time."""
+    if update.message.from_user.id not in ADMIN_IDS:
+        await update.message.reply_text(STRINGS['payout_unauthorized'])
+        return
+
+    page = await get_pending_reports(limit=PENDING_PAGE_SIZE)
+    text, reply_markup = await _render_pending_page(page)
+    message = await update.message.reply_text(text, reply_markup=reply_markup)
+    _remember_pending_page(context, message.message_id, page)
+
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'pending_review')
+async def pending_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Pages through the /bekleyen list, or approves/rejects every report on the shown page."""
+    query = update.callback_query
+    if not processed_callbacks.add(query.id):
+        await query.answer()
+        return
+    admin_user = query.from_user
+    if admin_user.id not in ADMIN_IDS:
+        await query.answer(STRINGS['payout_unauthorized'], show_alert=True)
+        return
+
+    action, _, report_id = query.data[len('pending_'):].partition('_')
+    notice = None
+    if action in ('next', 'prev'):
+        await query.answer()
+        if action == 'next':
+            page = await get_pending_reports(after_id=report_id, limit=PENDING_PAGE_SIZE)
+        else:
+            page = await get_pending_reports(before_id=report_id, limit=PENDING_PAGE_SIZE)
+    else:
+        report_ids = context.chat_data.get('pending_pages', {}).get(query.message.message_id)
+        if not report_ids:
+            # Page lists are kept in memory only, e.g. gone after a restart
+            await query.answer(STRINGS['pending_page_expired'], show_alert=True)
+            return
+        new_status = "onaylandı" if action == "approve" else "reddedildi"
+        # Reports someone else decided in the meantime are left alone
+        decided = await review_reports(report_ids, new_status, admin_user.id, REWARD_AMOUNT if action == "approve" else 0)
+        notice = STRINGS['pending_bulk_done'].format(count=len(decided), status=new_status.upper())
+        await query.answer(notice)
+        await asyncio.gather(
+            _notify_decisions(context, decided, new_status),
+            _edit_decided_notifications(context, decided, new_status, admin_user),
+        )
+        page = await get_pending_reports(limit=PENDING_PAGE_SIZE)
+
+    if not page['reports'] and page['total']:
+        # The cursor ran past the end (reports were decided meanwhile); start over
+        page = await get_pending_reports(limit=PENDING_PAGE_SIZE)
+    text, reply_markup = await _render_pending_page(page)
+    if notice:
+        text = f"{notice}\n\n{text}"
+    await query.edit_message_text(text=text, reply_markup=reply_markup)
+    _remember_pending_page(context, query.message.message_id, page)
+
+async def _notify_decisions(context, decided, new_status):
+    """Tells each courier about a bulk decision; the sends run concurrently through the outbox."""
+    async def notify(report, new_balance):
+        message = await outbox.send(
+            context.bot,
+            'send_message',
+            PRIORITY_NOTIFICATION,
+            chat_id=report['telegram_user_id'],
+            text=_status_notification(report['report_id'], new_status, REWARD_AMOUNT, new_balance),
             parse_mode='Markdown'
         )
-    except Exception as e:
-        logger.error(f"Failed to send status update to user {original_user_id}: {e}")
+        if not message:
+            logger.error(f"Failed to send status update to user {report['telegram_user_id']}, queued for retry")
+
+    await asyncio.gather(*(notify(report, new_balance) for report, new_balance in decided))
+
+async def _edit_decided_notifications(context, decided, new_status, admin_user):
+    """Adds a bulk decision to every admin's notification of each report, as review_handler does for one."""
+    usernames = {}
+    edits = []
+    for report, _ in decided:
+        user_id = report['telegram_user_id']
+        if user_id not in usernames:
+            user = await get_user_by_id(user_id)
+            usernames[user_id] = user.get('username') if user else None
+        caption = _admin_caption(report, usernames[user_id]) + _decision_text(new_status, admin_user)
+        edits.extend(
+            _edit_admin_caption(context, chat_id, message_id, caption)
+            for chat_id, message_id in report.get('admin_messages', [])
+        )
+    await asyncio.gather(*edits)
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'odeme')
 async def odeme_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Admin-only payout command with localized responses."""
     admin_user_id = update.message.from_user.id
@@ -297,37 +655,163 @@ async def odeme_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             await update.message.reply_text(STRINGS['payout_must_be_positive'])
             return
 
-        user = get_user_by_id(target_user_id)
-        if not user:
-            await update.message.reply_text(STRINGS['payout_user_not_found'].format(user_id=target_user_id))
+        # Check and debit happen atomically; the message ID makes a redelivered update a no-op
+        try:
+            new_balance = await debit_user_balance(
+                target_user_id, amount, 'payout',
+                ref=f"payout:{update.effective_chat.id}:{update.message.message_id}"
+            )
+        except InsufficientBalanceError as e:
+            await update.message.reply_text(STRINGS['payout_insufficient_balance'].format(user_id=target_user_id, current_balance=e.current_balance, amount=amount))
             return
 
-        current_balance = user.get('balance', 0)
-        if current_balance < amount:
-            await update.message.reply_text(STRINGS['payout_insufficient_balance'].format(user_id=target_user_id, current_balance=current_balance, amount=amount))
+        if new_balance is None:
+            await update.message.reply_text(STRINGS['payout_user_not_found'].format(user_id=target_user_id))
             return
 
-        new_balance = update_user_balance(target_user_id, -amount)
         await update.message.reply_text(STRINGS['payout_success_admin'].format(user_id=target_user_id, amount=amount, new_balance=new_balance))
         
-        try:
-            await context.bot.send_message(chat_id=target_user_id, text=STRINGS['payout_success_user'].format(amount=amount, new_balance=new_balance))
-        except Exception as e:
-            logger.error(f"Failed to send payout notification to user {target_user_id}: {e}")
+        message = await outbox.send(
+            context.bot,
+            'send_message',
+            PRIORITY_NOTIFICATION,
+            chat_id=target_user_id,
+            text=STRINGS['payout_success_user'].format(amount=amount, new_balance=new_balance)
+        )
+        if not message:
+            logger.error(f"Failed to send payout notification to user {target_user_id}, queued for retry")
             await update.message.reply_text(STRINGS['payout_notification_failed'].format(user_id=target_user_id))
 
     except (IndexError, ValueError):
         await update.message.reply_text(STRINGS['payout_usage'])
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'istatistik')
+async def istatistik_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin-only overview of reports, approvals, payouts and top reporters."""
+    if update.message.from_user.id not in ADMIN_IDS:
+        await update.message.reply_text(STRINGS['payout_unauthorized'])
+        return
+
+    stats = await get_stats()
+    status = stats['status']
+    approved, rejected = status.get('onaylandı', 0), status.get('reddedildi', 0)
+    decided = approved + rejected
+    credits = stats['ledger'].get('credit', {})
+    payouts = stats['ledger'].get('payout', {})
+
+    lines = [
+        STRINGS['stats_header'],
+        STRINGS['stats_totals'].format(
+            users=stats['users'],
+            reports=stats['reports'],
+            pending=status.get('pending', 0),
+            approved=approved,
+            rejected=rejected,
+            duplicate=status.get('duplicate', 0),
+            approval_rate=f"%{100 * approved / decided:.0f}" if decided else "-",
+            rewards=credits.get('amount', 0),
+            payouts=-payouts.get('amount', 0),
+            payout_count=payouts.get('count', 0),
+        ),
+        "",
+        STRINGS['stats_daily_header'].format(days=len(stats['daily'])),
+    ]
+    for day, reports, day_approved, day_rejected in stats['daily']:
+        lines.append(STRINGS['stats_daily_row'].format(day=day, reports=reports, approved=day_approved, rejected=day_rejected))
+
+    lines += ["", STRINGS['stats_top_header']]
+    for rank, (user_id, user_approved) in enumerate(stats['top'], start=1):
+        user = await get_user_by_id(user_id)
+        name = f"@{user['username']}" if user and user.get('username') else str(user_id)
+        lines.append(STRINGS['stats_top_row'].format(rank=rank, name=name, approved=user_approved))
+    if not stats['top']:
+        lines.append(STRINGS['stats_top_empty'])
+
+    await update.message.reply_text("\n".join(lines))
+
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'disaaktar')
+async def disaaktar_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Admin-only CSV export of the reports submitted since that admin's last
+    export ('/disaaktar tumu' exports everything again).
+    """
+    admin_user_id = update.message.from_user.id
+    if admin_user_id not in ADMIN_IDS:
+        await update.message.reply_text(STRINGS['payout_unauthorized'])
+        return
+
+    full = bool(context.args) and context.args[0].lower() in ('tumu', 'tümü', 'all')
+    since = None if full else (await get_state('export')).get(str(admin_user_id))
+
+    # The export streams to a temporary file, so memory use does not grow with the data
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    os.close(handle)
+    try:
+        count, watermark = await export_reports(path, since)
+        if not count:
+            await update.message.reply_text(STRINGS['export_empty'])
+            return
+        caption = STRINGS['export_caption_since'].format(count=count, since=since) if since else STRINGS['export_caption_all'].format(count=count)
+        with open(path, 'rb') as f:
+            await update.message.reply_document(
+                document=f,
+                filename=f"reports-{watermark[:19].replace(':', '')}.csv",
+                caption=caption,
+                read_timeout=60,
+                write_timeout=60,
+            )
+        await put_state('export', str(admin_user_id), watermark)
+    finally:
+        os.remove(path)
+
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'metrik')
+async def metrik_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin-only summary of handler, database and Telegram API latencies and queue depths."""
+    if update.message.from_user.id not in ADMIN_IDS:
+        await update.message.reply_text(STRINGS['payout_unauthorized'])
+        return
+
+    lines = [STRINGS['metrics_header']]
+    for title, seconds, errors, limit in (
+        (STRINGS['metrics_handlers'], handler_seconds, handler_errors, None),
+        (STRINGS['metrics_database'], db_seconds, db_errors, 8),
+        (STRINGS['metrics_telegram'], telegram_seconds, telegram_errors, None),
+    ):
+        lines += ["", title]
+        rows = busiest(seconds, errors, limit)
+        for name, count, p50, p99, error_count in rows:
+            line = STRINGS['metrics_row'].format(name=name, count=count, p50=f"{p50 * 1000:.1f}", p99=f"{p99 * 1000:.1f}")
+            if error_count:
+                line += STRINGS['metrics_errors'].format(errors=error_count)
+            lines.append(line)
+        if not rows:
+            lines.append(STRINGS['metrics_empty'])
+
+    lines += ["", STRINGS['metrics_queues'].format(
+        write_behind=gauge_value('kazabot_write_behind_pending'),
+        db_writer=gauge_value('kazabot_db_writer_backlog'),
+        outbox=gauge_value('kazabot_outbox_pending'),
+        analytics=gauge_value('kazabot_analytics_buffered'),
+        lag_ms=f"{(gauge_value('kazabot_event_loop_lag_seconds') or 0) * 1000:.0f}",
+    )]
+    await update.message.reply_text("\n".join(lines))
+
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'bakiye')
 async def bakiye_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Shows the user their balance using localized text."""
-    user = get_or_create_user(update.message.from_user.id, update.message.from_user.username)
+    user = await get_or_create_user(update.message.from_user.id, update.message.from_user.username)
     balance = user.get('balance', 0)
     await update.message.reply_text(
         STRINGS['balance_info'].format(balance=balance, payout_threshold=PAYOUT_THRESHOLD),
         reply_markup=NEW_REPORT_KEYBOARD
     )
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'kurallar')
 async def kurallar_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Sends the localized list of rules."""
     rules_text = STRINGS['rules_text'].format(
@@ -341,6 +825,8 @@ async def kurallar_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         parse_mode='Markdown'
     )
 
+@timed(handler_seconds, handler_errors)
+@track(tracker, 'destek')
 async def destek_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Provides the localized support message."""
     await update.message.reply_text(
@@ -0,0 +1,193 @@
+# indexes.py - In-memory lookup indexes kept in front of the storage backend
+import bisect
+import logging
+from geoindex import SpatialTemporalIndex
+from photohash import MultiIndexHash
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+# Reports an admin can still approve or reject (auto-flagged duplicates need a decision too)
+UNDECIDED_STATUSES = ('pending', 'duplicate')
+
+
+def _balance(user):
+    # Older users might not have a balance field
+    return user.get('balance') or 0
+
+
+def _pending_key(report):
+    return (report.get('submitted_at') or '', report['report_id'])
+
+
+class RecordIndex:
+    """
+    Hash indexes for users (by telegram_user_id) and reports (by report_id),
+    users sorted by balance for the payout scan, a sorted list of submitted_at per user for the 24h rate-limit count, the
+    undecided (pending or duplicate) reports sorted by (submitted_at,
+    report_id) for the admin review queue, and a spatial-temporal grid of report locations and a multi-index
+    hash of photo hashes for duplicate detection.
+    database.py updates it on every insert/update so it never goes stale.
+
+    With `max_reports` set, full report documents beyond that many are
+    dropped from memory, oldest finalized (`spill_statuses`) ones first.
+    Their time, location and photo entries stay indexed, so rate limits and
+    duplicate checks are unaffected; database.py reads a spilled report
+    back from storage when it is asked for one.
+    """
+
+    def __init__(self, geo_cell_meters=200, max_reports=0, spill_statuses=('onaylandı', 'reddedildi')):
+        self.users = {}
+        self.balances = []  # (balance, telegram_user_id) of every user, sorted
+        self.reports = {}
+        self.max_reports = max_reports
+        self.spill_statuses = spill_statuses
+        self.spilled = 0
+        self._spill_at = max_reports
+        self.report_times = {}
+        self.pending = []  # (submitted_at, report_id) of every undecided report, sorted
+        self.ledger_refs = set()
+        self.ledger_entries = 0
+        self.geo = SpatialTemporalIndex(geo_cell_meters)
+        self.photo_hashes = MultiIndexHash()
+
+    def load(self, storage):
+        """Builds all indexes from the backend in one pass at startup."""
+        for user in storage.iter_users():
+            self.users[user['telegram_user_id']] = dict(user)
+        self.balances = sorted((_balance(user), user_id) for user_id, user in self.users.items())
+        for report in storage.iter_reports():
+            self.add_report(report)
+        # Archived reports are not kept, but their photos still count for reuse checks
+        for report_id, _, photo_hash in storage.iter_archived():
+            if photo_hash:
+                self.photo_hashes.add(int(photo_hash, 16), report_id)
+        for entry in storage.iter_ledger():
+            self.add_ledger_entry(entry)
+        logger.info(f"Indexed {len(self.users)} users and {len(self.reports) + self.spilled} reports ({self.spilled} not kept in memory)")
+
+    # --- Users ---
+
+    def get_user(self, user_id):
+        user = self.users.get(user_id)
+        return dict(user) if user else None
+
+    def add_user(self, user):
+        self.users[user['telegram_user_id']] = dict(user)
+        bisect.insort(self.balances, (_balance(user), user['telegram_user_id']))
+
+    def update_user(self, user_id, fields):
+        user = self.users.get(user_id)
+        if user is not None:
+            if 'balance' in fields:
+                key = (_balance(user), user_id)
+                i = bisect.bisect_left(self.balances, key)
+                if i < len(self.balances) and self.balances[i] == key:
+                    del self.balances[i]
+                bisect.insort(self.balances, (fields['balance'] or 0, user_id))
+            user.update(fields)
+
+    def users_with_balance_at_least(self, minimum):
+        """(balance, user_id) of every user whose balance is at least `minimum`, lowest first."""
+        return self.balances[bisect.bisect_left(self.balances, (minimum,)):]
+
+    # --- Reports ---
+
+    def get_report(self, report_id):
+        report = self.reports.get(report_id)
+        return dict(report) if report else None
+
+    def add_report(self, report):
+        self.reports[report['report_id']] = dict(report)
+        times = self.report_times.setdefault(report['telegram_user_id'], [])
+        bisect.insort(times, report.get('submitted_at') or '')
+        if report.get('location_geo') and report.get('submitted_at'):
+            lat, lon = report['location_geo']
+            self.geo.add(report['report_id'], lat, lon, report['submitted_at'])
+        if report.get('photo_hash'):
+            self.photo_hashes.add(int(report['photo_hash'], 16), report['report_id'])
+        if report.get('status') in UNDECIDED_STATUSES:
+            bisect.insort(self.pending, _pending_key(report))
+        if self.max_reports and len(self.reports) > self._spill_at:
+            self._spill()
+
+    def _spill(self):
+        # Down to 90% of the ceiling, so this runs once per max_reports/10 new reports
+        excess = len(self.reports) - int(self.max_reports * 0.9)
+        victims = []
+        for report_id, report in self.reports.items():
+            if len(victims) >= excess:
+                break
+            if report.get('status') in self.spill_statuses:
+                victims.append(report_id)
+        for report_id in victims:
+            del self.reports[report_id]
+        self.spilled += len(victims)
+        if len(victims) < excess:
+            logger.warning(f"{len(self.reports)} reports in memory, above the limit of {self.max_reports}: too few are finalized to spill")
+        # Don't rescan on every insert while most reports are still pending
+        self._spill_at = max(self.max_reports, len(self.reports) + self.max_reports // 10)
+
+    def update_report(self, report_id, fields):
+        report = self.reports.get(report_id)
+        if report is not None:
+            if 'status' in fields and (report.get('status') in UNDECIDED_STATUSES) != (fields['status'] in UNDECIDED_STATUSES):
+                if fields['status'] in UNDECIDED_STATUSES:
+                    bisect.insort(self.pending, _pending_key(report))
+                else:
+                    self._drop_pending(report)
+            report.update(fields)
+
+    def _drop_pending(self, report):
+        key = _pending_key(report)
+        i = bisect.bisect_left(self.pending, key)
+        if i < len(self.pending) and self.pending[i] == key:
+            del self.pending[i]
+
+    def remove_report(self, report):
+        """Drops an archived report (the document, which may have been spilled); its photo hash stays indexed."""
+        report_id = report['report_id']
+        if self.reports.pop(report_id, None) is None:
+            self.spilled -= 1
+        if report.get('status') in UNDECIDED_STATUSES:
+            self._drop_pending(report)
+        times = self.report_times.get(report['telegram_user_id'])
+        if times:
+            i = bisect.bisect_left(times, report.get('submitted_at') or '')
+            if i < len(times) and times[i] == (report.get('submitted_at') or ''):
+                del times[i]
+            if not times:
+                del self.report_times[report['telegram_user_id']]
+        if report.get('location_geo') and report.get('submitted_at'):
+            lat, lon = report['location_geo']
+            self.geo.remove(report_id, lat, lon, report['submitted_at'])
+
+    def pending_page(self, after=None, before=None, limit=10):
+        """
+        Up to `limit` undecided reports as (submitted_at, report_id) keys, oldest
+        first: the first page, the page after the key `after`, or the page
+        before the key `before`. Returns (keys, has_previous, has_next).
+        """
+        if before is not None:
+            end = bisect.bisect_left(self.pending, before)
+            start = max(0, end - limit)
+        else:
+            start = bisect.bisect_right(self.pending, after) if after is not None else 0
+            end = start + limit
+        return self.pending[start:end], start > 0, end < len(self.pending)
+
+    def count_user_reports_since(self, user_id, since):
+        times = self.report_times.get(user_id)
+        if not times:
+            return 0
+        return len(times) - bisect.bisect_left(times, since)
+
+    # --- Balance ledger ---
+
+    def add_ledger_entry(self, entry):
+        self.ledger_entries += 1
+        if entry.get('ref') is not None:
+            self.ledger_refs.add(entry['ref'])
+
+    def has_ledger_ref(self, ref):
+        return ref in self.ledger_refs
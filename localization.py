@@ -20,6 +20,7 @@ STRINGS = {
     ),
 
     # --- Reporting Flow ---
+    'location_out_of_zone': "Bu konum hizmet bölgelerimizin ({service_zones}) dışında görünüyor. Lütfen yalnızca bu bölgelerdeki kazaları bildirin ve konumu tekrar paylaşın.",
     'location_received': "Harika! Şimdi, lütfen kazanın net bir fotoğrafını çekip bana gönderin.",
     'photo_received': "Fotoğraf alındı. Şimdi, lütfen kısa bir açıklama ekleyin (ör. 'iki araba, arkadan çarpma'). Bu isteğe bağlıdır. 'Atla' tuşuna basarak da geçebilirsiniz.",
     'description_too_long': "Açıklama çok uzun (en fazla 200 karakter). Lütfen tekrar deneyin.",
@@ -33,6 +34,8 @@ STRINGS = {
     'summary_confirm_prompt': "Her şey doğru mu?",
     'report_submitted': "✅ Başarılı! Raporunuz gönderildi.\n\n",
     'report_canceled': "Rapor iptal edildi. İstediğiniz zaman yenisini başlatabilirsiniz.",
+    'daily_limit_reached': "Bugün için rapor sınırına ({limit} rapor / 24 saat) ulaştınız. Lütfen daha sonra tekrar deneyin.",
+    'flood_warning': "Çok hızlı mesaj gönderiyorsunuz. Lütfen biraz bekleyip tekrar deneyin.",
     'generic_error': "Bir şeyler yanlış gitti. Lütfen /start ile yeniden başlayın.",
     'final_message': "Şimdi yeni bir rapor gönderebilir veya bu sohbeti kapatabilirsiniz.",
 
@@ -59,12 +62,34 @@ STRINGS = {
     'admin_submitted_by_label': "Gönderen",
     'admin_description_label': "Açıklama",
     'admin_time_delta_label': "Geçen Süre",
+    'admin_duplicate_warning': "⚠️ Olası mükerrer rapor: {report_id} (~{distance} m uzaklıkta, yakın zamanda bildirildi)",
+    'admin_photo_reuse_warning': "⚠️ Fotoğraf daha önce kullanılmış olabilir: rapor {report_id} ile neredeyse aynı.",
+    'admin_zone_label': "Bölge",
+    'admin_out_of_zone_warning': "⚠️ Konum hizmet bölgelerinin dışında.",
+    'admin_auto_duplicate': "Bu rapor otomatik olarak mükerrer işaretlendi.",
     'admin_decision_header': "--- Karar ---",
     'admin_status_label': "Durum",
     'admin_reviewed_by_label': "tarafından",
+    'review_claimed': "Bu rapor şu anda başka bir yönetici (ID: {admin_id}) tarafından inceleniyor.",
+    'review_already_decided': "Bu rapor zaten {status} olarak işaretlendi (yönetici ID: {admin_id}).",
+    'review_report_missing': "Rapor bulunamadı.",
     'user_update_notification': "GÜNCELLEME: Raporunuz (ID: {report_id}) *{status}* olarak işaretlendi.",
     'user_reward_notification': "\n\nTebrikler! Hesabınıza {reward_amount} TL eklendi. Yeni bakiyeniz {new_balance} TL.",
 
+    # --- Pending Review Queue (Admin) ---
+    'pending_header': "🕓 Bekleyen raporlar (toplam {total}), en eskisi önce:",
+    'pending_row': "{number}. {submitted_at} — {name} — {zone}\nID: {report_id}\n📝 {description}",
+    'pending_row_duplicate': "⚠️ Olası mükerrer: {report_id} (~{distance} m)",
+    'pending_row_auto_duplicate': "⚠️ Otomatik mükerrer işaretli: {report_id} (~{distance} m)",
+    'pending_row_photo_reuse': "⚠️ Fotoğraf tekrar kullanılmış olabilir: {report_id}",
+    'pending_empty': "Bekleyen rapor yok.",
+    'pending_previous_button': "◀️ Önceki",
+    'pending_next_button': "Sonraki ▶️",
+    'pending_approve_all_button': "✅ Sayfadakileri onayla ({count})",
+    'pending_reject_all_button': "❌ Sayfadakileri reddet ({count})",
+    'pending_bulk_done': "{count} rapor {status} olarak işaretlendi.",
+    'pending_page_expired': "Bu liste artık geçerli değil. Lütfen /bekleyen komutunu tekrar kullanın.",
+
     # --- Payout Command (Admin) ---
     'payout_unauthorized': "Bu komut sadece yöneticiler içindir.",
     'payout_usage': "Kullanım: /odeme <user_id> <amount>",
@@ -74,4 +99,40 @@ STRINGS = {
     'payout_success_admin': "✅ Kullanıcı {user_id} için {amount} ₺ tutarındaki ödeme kaydedildi.\nYeni bakiyesi şimdi {new_balance} ₺.",
     'payout_success_user': "{amount} ₺ tutarındaki ödeme ekibimiz tarafından işlendi! Yeni bakiyeniz {new_balance} ₺.",
     'payout_notification_failed': "⚠️ Kullanıcı {user_id} tarafına bildirim gönderilemedi.",
+    'payout_run_user': "Bakiyeniz ödeme eşiğine ulaştı! {amount} ₺ tutarındaki ödemeniz işleme alındı. Yeni bakiyeniz {new_balance} ₺.",
+    'payout_run_admin_caption': "Ödeme listesi {run_id}: {count} kurye, toplam {total} ₺ ({skipped} kurye atlandı)",
+
+    # --- Admin Statistics ---
+    'stats_header': "📊 İstatistikler",
+    'stats_totals': (
+        "Kullanıcı: {users}\n"
+        "Toplam rapor: {reports}\n"
+        "Bekleyen: {pending} | Onaylanan: {approved} | Reddedilen: {rejected} | Mükerrer: {duplicate}\n"
+        "Onay oranı: {approval_rate}\n"
+        "Verilen ödül: {rewards} ₺\n"
+        "Yapılan ödeme: {payouts} ₺ ({payout_count} ödeme)"
+    ),
+    'stats_daily_header': "Son {days} gün (rapor / onay / ret):",
+    'stats_daily_row': "{day}: {reports} / {approved} / {rejected}",
+    'stats_top_header': "En çok onaylı raporu olanlar:",
+    'stats_top_row': "{rank}. {name} — {approved}",
+    'stats_top_empty': "Henüz onaylanmış rapor yok.",
+
+    # --- Admin Export ---
+    'export_empty': "Son dışa aktarımdan bu yana yeni rapor yok. Tüm raporlar için: /disaaktar tumu",
+    'export_caption_all': "{count} rapor (tümü)",
+    'export_caption_since': "{count} yeni rapor ({since} sonrası)",
+
+    # --- Admin Metrics ---
+    'metrics_header': "📈 Metrikler (bot başladığından beri)",
+    'metrics_handlers': "İşleyiciler (adet, p50 / p99 ms):",
+    'metrics_database': "Veritabanı, en çok zaman alanlar (adet, p50 / p99 ms):",
+    'metrics_telegram': "Telegram API (adet, p50 / p99 ms):",
+    'metrics_row': "{name}: {count}, {p50} / {p99}",
+    'metrics_errors': " ⚠️ {errors} hata",
+    'metrics_empty': "Henüz ölçüm yok.",
+    'metrics_queues': (
+        "Kuyruklar: yazma {write_behind}, veritabanı yazıcı {db_writer}, bildirim {outbox}, analitik {analytics}\n"
+        "Olay döngüsü gecikmesi: {lag_ms} ms"
+    ),
 }
@@ -0,0 +1,317 @@
+# metrics.py - Counters and latency histograms, exported in the Prometheus text format
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+# Seconds; covers in-memory reads (sub-millisecond) up to slow Telegram calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        """The series for these label values. Keep it around on hot paths to skip the lookup."""
+        key = tuple(str(labels[name]) for name in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def series(self):
+        """{label values: child}, for readers (render, admin summary)."""
+        return dict(self._children)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def render(self):
+        for key, child in self.series().items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(child.value)}"
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        """(cumulative counts per bucket incl. +Inf, count, sum), read consistently."""
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative, running = [], 0
+        for value in counts:
+            running += value
+            cumulative.append(running)
+        return cumulative, count, total
+
+    def quantile(self, q):
+        """
+        Estimates the q-quantile by linear interpolation inside its bucket,
+        like Prometheus' histogram_quantile(). None if nothing was observed.
+        """
+        cumulative, count, _ = self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        for i, seen in enumerate(cumulative):
+            if seen >= rank:
+                if i == len(self.buckets):
+                    # Beyond the largest bucket all we know is the bound
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                below = cumulative[i - 1] if i else 0
+                in_bucket = seen - below
+                return lower + (self.buckets[i] - lower) * ((rank - below) / in_bucket if in_bucket else 1)
+        return self.buckets[-1]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value, **labels):
+        self.labels(**labels).observe(value)
+
+    def render(self):
+        bounds = [_format_value(float(bound)) for bound in self.buckets] + ['+Inf']
+        for key, child in self.series().items():
+            cumulative, count, total = child.snapshot()
+            for bound, seen in zip(bounds, cumulative):
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', bound)])} {seen}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {count}"
+
+
+class Gauge(_Metric):
+    """A value read when the metrics are rendered, e.g. a queue's length."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, read):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def value(self):
+        try:
+            return self.read()
+        except Exception as e:
+            logger.error(f"Reading gauge {self.name} failed: {e}")
+            return None
+
+    def render(self):
+        value = self.value()
+        if value is not None:
+            yield f"{self.name} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric, replace=False):
+        if metric.name in self.metrics and not replace:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self.metrics.get(name)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labels=()):
+    return REGISTRY.register(Counter(name, documentation, labels))
+
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labels, buckets))
+
+
+def gauge(name, documentation, read):
+    # Re-registering points the gauge at a new object (e.g. a rebuilt Application)
+    return REGISTRY.register(Gauge(name, documentation, read), replace=True)
+
+
+# --- Instrumentation ---
+
+def timed(seconds, errors=None, **labels):
+    """
+    Decorator recording each call's duration in the `seconds` histogram
+    (and exceptions in the `errors` counter). Works for plain and async
+    functions. A histogram with a single label gets the function's name
+    if no label value is given.
+    """
+    def decorator(func):
+        values = labels or ({seconds.label_names[0]: func.__name__} if seconds.label_names else {})
+        series = seconds.labels(**values)
+        error_series = errors.labels(**values) if errors else None
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    if error_series:
+                        error_series.inc()
+                    raise
+                finally:
+                    series.observe(time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if error_series:
+                    error_series.inc()
+                raise
+            finally:
+                series.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+# --- Reading ---
+
+def busiest(seconds, errors=None, limit=None):
+    """
+    (label, count, p50, p99, errors) for each series of a histogram, the
+    one with the most total time first. Used by the admin summary.
+    """
+    error_series = errors.series() if errors else {}
+    rows = []
+    for key, child in seconds.series().items():
+        _, count, total = child.snapshot()
+        if count:
+            failed = error_series.get(key)
+            rows.append((total, ','.join(key), count, child.quantile(0.5), child.quantile(0.99), failed.value if failed else 0))
+    rows.sort(reverse=True)
+    return [row[1:] for row in rows[:limit]]
+
+
+def gauge_value(name):
+    metric = REGISTRY.get(name)
+    return metric.value() if metric else None
+
+
+# --- Bot metrics ---
+
+handler_seconds = histogram('kazabot_handler_seconds', "Time spent in a Telegram update handler", ('handler',))
+handler_errors = counter('kazabot_handler_errors_total', "Handler calls that raised", ('handler',))
+db_seconds = histogram('kazabot_db_seconds', "Time spent in a database.py function", ('function',))
+db_errors = counter('kazabot_db_errors_total', "database.py calls that raised", ('function',))
+db_queue_seconds = histogram('kazabot_db_queue_seconds', "Time a database call waited for a thread", ('pool',))
+db_commit_seconds = histogram('kazabot_db_commit_seconds', "Duration of one write-behind group commit")
+db_committed_writes = counter('kazabot_db_committed_writes_total', "Storage writes committed by the write-behind queue")
+telegram_seconds = histogram('kazabot_telegram_api_seconds', "Bot API request time, without rate limit waits", ('endpoint',))
+telegram_errors = counter('kazabot_telegram_api_errors_total', "Bot API requests that failed", ('endpoint',))
+updates_dropped = counter('kazabot_updates_dropped_total', "Updates dropped before any handler, by the flood guard or a full per-chat queue", ('reason',))
+
+
+# --- HTTP endpoint ---
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass  # headers are not needed
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', REGISTRY.render().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            status, body, content_type = '404 Not Found', b'Not found\n', 'text/plain'
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1')
+            + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http_server(host, port):
+    """Serves GET /metrics on host:port for a Prometheus scraper. Returns the asyncio server."""
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"Metrics endpoint listening on http://{host}:{server.sockets[0].getsockname()[1]}/metrics")
+    return server
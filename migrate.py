@@ -0,0 +1,68 @@
+# migrate.py - One-shot migration from the legacy TinyDB JSON file to SQLite
+import sys
+import json
+import logging
+from storage import SQLiteStorage
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+
+# Every table TinyDBStorage keeps; a file with anything else was written by
+# code this migration doesn't know about
+TABLES = ('users', 'reports', 'ledger', 'outbox', 'kv', 'archived_reports')
+
+
+def migrate_tinydb_to_sqlite(json_path, storage):
+    """
+    Copies every table of a TinyDB JSON file into a SQLiteStorage: users,
+    reports, the ledger, undelivered outbox messages, bot state (kv) and
+    which reports were archived. Rows that already exist are left alone, so
+    running it twice is harmless. Refuses, before writing anything, a file
+    with non-empty tables it would not copy.
+    """
+    with open(json_path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    unknown = sorted(name for name, rows in data.items() if name not in TABLES and rows)
+    if unknown:
+        raise RuntimeError(f"{json_path} has tables the migration would drop: {', '.join(unknown)}")
+
+    tables = {name: list(data.get(name, {}).values()) for name in TABLES}
+
+    with storage.lock, storage.conn:
+        for user in tables['users']:
+            # Older user rows were created before balances existed
+            user.setdefault('balance', 0)
+            storage._insert_user(user, or_ignore=True)
+        for report in tables['reports']:
+            storage._insert_report(report, or_ignore=True)
+        for entry in tables['ledger']:
+            storage._insert_ledger_entry(entry, or_ignore=True)
+        for entry in tables['outbox']:
+            storage._insert_outbox(entry, or_ignore=True)
+        for item in tables['kv']:
+            storage._put_kv(item['namespace'], item['key'], item['value'], or_ignore=True)
+        for item in tables['archived_reports']:
+            storage._archive_report(item['report_id'], item['partition'], item.get('photo_hash'), or_ignore=True)
+
+    logger.info(
+        f"Migrated from {json_path}: " + ', '.join(f"{len(rows)} {name}" for name, rows in tables.items())
+    )
+    return len(tables['users']), len(tables['reports'])
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: python migrate.py <kazabot_db.json> <kazabot.db>")
+        sys.exit(1)
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    storage = SQLiteStorage(sys.argv[2])
+    try:
+        migrate_tinydb_to_sqlite(sys.argv[1], storage)
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
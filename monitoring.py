@@ -0,0 +1,28 @@
+# monitoring.py - Event loop health checks
+import asyncio
+import logging
+from metrics import gauge
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+# Latest measurements, readable by admin commands or logs
+loop_lag_stats = {'last_ms': 0.0, 'max_ms': 0.0, 'samples': 0}
+gauge('kazabot_event_loop_lag_seconds', "Last measured event loop lag", lambda: loop_lag_stats['last_ms'] / 1000)
+
+
+async def monitor_event_loop_lag(interval=1.0, warn_threshold_ms=100):
+    """
+    Sleeps for `interval` seconds in a loop and measures how late it wakes up.
+    Anything beyond the interval is time the loop spent blocked by other work.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag_ms = max(0.0, (loop.time() - started - interval) * 1000)
+        loop_lag_stats['last_ms'] = lag_ms
+        loop_lag_stats['max_ms'] = max(loop_lag_stats['max_ms'], lag_ms)
+        loop_lag_stats['samples'] += 1
+        if lag_ms > warn_threshold_ms:
+            logger.warning(f"Event loop lag of {lag_ms:.0f} ms detected")
@@ -0,0 +1,115 @@
+# outbox.py - Persistent queue for notifications that must survive failures and restarts
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, TelegramError
+import async_database
+from config import OUTBOX_RETRY_INTERVAL, OUTBOX_MAX_ATTEMPTS
+from ratelimit import PRIORITY_NOTIFICATION
+from metrics import gauge
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    """
+    Every notification is stored before it is sent and removed once Telegram
+    accepts it. Messages that fail for a transient reason stay stored and are
+    retried in the background, including after a restart.
+    """
+
+    def __init__(self, retry_interval=30, max_attempts=10):
+        self.retry_interval = retry_interval
+        self.max_attempts = max_attempts
+        self.pending = {}
+        self.in_flight = set()
+        self.bot = None
+
+    async def start(self, bot):
+        """Loads undelivered messages from the database; call once at startup."""
+        self.bot = bot
+        for entry in await async_database.get_outbox_messages():
+            self.pending[entry['outbox_id']] = entry
+        if self.pending:
+            logger.info(f"Loaded {len(self.pending)} undelivered messages from the outbox")
+
+    async def send(self, bot, method, priority=PRIORITY_NOTIFICATION, **kwargs):
+        """
+        Queues `bot.<method>(**kwargs)` and tries to deliver it right away.
+        Returns the sent Message, or None if delivery was deferred or dropped.
+        """
+        entry = {
+            'outbox_id': uuid.uuid4().hex,
+            'method': method,
+            'kwargs': self._serialize(kwargs),
+            'priority': priority,
+            'attempts': 0,
+            'created_at': datetime.utcnow().isoformat(),
+        }
+        await async_database.save_outbox_message(entry)
+        self.pending[entry['outbox_id']] = entry
+        return await self._deliver(bot, entry)
+
+    async def _deliver(self, bot, entry):
+        outbox_id = entry['outbox_id']
+        if outbox_id in self.in_flight:
+            return None
+        self.in_flight.add(outbox_id)
+        try:
+            return await self._attempt(bot, entry)
+        finally:
+            self.in_flight.discard(outbox_id)
+
+    async def _attempt(self, bot, entry):
+        outbox_id = entry['outbox_id']
+        try:
+            message = await getattr(bot, entry['method'])(
+                **self._deserialize(entry['kwargs'], bot),
+                rate_limit_args=entry['priority'],
+            )
+        except (BadRequest, Forbidden) as e:
+            # The chat is gone or the request is invalid; retrying will not help
+            logger.error(f"Dropping outbox message {outbox_id} to {entry['kwargs'].get('chat_id')}: {e}")
+        except TelegramError as e:
+            entry['attempts'] += 1
+            if entry['attempts'] < self.max_attempts:
+                logger.warning(f"Delivery of outbox message {outbox_id} failed (attempt {entry['attempts']}), will retry: {e}")
+                await async_database.update_outbox_message(outbox_id, {'attempts': entry['attempts']})
+                return None
+            logger.error(f"Giving up on outbox message {outbox_id} after {entry['attempts']} attempts: {e}")
+        else:
+            self.pending.pop(outbox_id, None)
+            await async_database.delete_outbox_message(outbox_id)
+            return message
+        self.pending.pop(outbox_id, None)
+        await async_database.delete_outbox_message(outbox_id)
+        return None
+
+    async def run_retries(self):
+        """Background task: periodically re-sends everything still pending."""
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            for entry in sorted(self.pending.values(), key=lambda e: (e['priority'], e['created_at'])):
+                await self._deliver(self.bot, entry)
+
+    @staticmethod
+    def _serialize(kwargs):
+        data = dict(kwargs)
+        if isinstance(data.get('reply_markup'), InlineKeyboardMarkup):
+            data['reply_markup'] = data['reply_markup'].to_dict()
+        return data
+
+    @staticmethod
+    def _deserialize(data, bot):
+        kwargs = dict(data)
+        if isinstance(kwargs.get('reply_markup'), dict):
+            kwargs['reply_markup'] = InlineKeyboardMarkup.de_json(kwargs['reply_markup'], bot)
+        return kwargs
+
+
+# Shared instance used by the handlers; started from bot.py
+outbox = Outbox(OUTBOX_RETRY_INTERVAL, OUTBOX_MAX_ATTEMPTS)
+gauge('kazabot_outbox_pending', "Notifications stored and not yet delivered", lambda: len(outbox.pending))
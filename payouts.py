@@ -0,0 +1,115 @@
+# payouts.py - Scheduled payout runs for couriers whose balance reached the threshold
+import asyncio
+import csv
+import logging
+import os
+from telegram.error import TelegramError
+import async_database
+from database import PAYOUT_RUNS_NAMESPACE
+from outbox import outbox
+from ratelimit import PRIORITY_BROADCAST
+from localization import STRINGS
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ['telegram_user_id', 'username', 'payment_method', 'amount', 'balance_after']
+
+
+class PayoutRunner:
+    """
+    Each scan starts a run for every courier at or above `threshold`
+    (database.create_payout_run) and takes it through these steps, saving
+    the run's status after each one:
+
+    - debiting: balances are debited `batch_size` users per transaction
+    - debited: every paid courier gets a notification through the outbox
+    - notified: the CSV is written to `directory` and sent to the admins
+    - done: the stored run is reduced to a summary
+
+    A run interrupted by a restart is picked up at its saved step on the
+    next scan. Debits are never repeated; a restart while notifications are
+    being queued can at worst send some of them twice.
+    """
+
+    def __init__(self, threshold, directory, admin_ids, batch_size=500):
+        self.threshold = threshold
+        self.directory = directory
+        self.admin_ids = admin_ids
+        self.batch_size = batch_size
+        self._lock = asyncio.Lock()
+
+    async def run(self, bot):
+        """Finishes interrupted runs, then starts a new one if anyone is eligible."""
+        async with self._lock:
+            runs = await async_database.get_state(PAYOUT_RUNS_NAMESPACE)
+            for run in sorted(runs.values(), key=lambda run: run['created_at']):
+                if run['status'] != 'done':
+                    logger.info(f"Resuming payout run {run['run_id']} at step {run['status']}")
+                    await self._process(bot, run)
+            run = await async_database.create_payout_run(self.threshold)
+            if run:
+                await self._process(bot, run)
+
+    async def _process(self, bot, run):
+        while run['status'] == 'debiting':
+            # One batch per writer call, so queued handler writes get in between batches
+            run = await async_database.apply_payout_run(run, self.batch_size)
+        paid = [item for item in run['items'] if 'balance_after' in item]
+
+        if run['status'] == 'debited':
+            await asyncio.gather(*(self._notify(bot, item) for item in paid))
+            run['status'] = 'notified'
+            await async_database.put_state(PAYOUT_RUNS_NAMESPACE, run['run_id'], run)
+
+        if run['status'] == 'notified':
+            path = await asyncio.to_thread(self._write_csv, run, paid)
+            await self._send_csv(bot, run, paid, path)
+            summary = {
+                'run_id': run['run_id'],
+                'created_at': run['created_at'],
+                'threshold': run['threshold'],
+                'status': 'done',
+                'paid': len(paid),
+                'skipped': len(run['items']) - len(paid),
+                'total': sum(item['amount'] for item in paid),
+                'csv': path,
+            }
+            await async_database.put_state(PAYOUT_RUNS_NAMESPACE, run['run_id'], summary)
+            logger.info(f"Payout run {run['run_id']} done: {summary['paid']} couriers, {summary['total']} TL")
+
+    async def _notify(self, bot, item):
+        message = await outbox.send(
+            bot,
+            'send_message',
+            PRIORITY_BROADCAST,
+            chat_id=item['telegram_user_id'],
+            text=STRINGS['payout_run_user'].format(amount=item['amount'], new_balance=item['balance_after']),
+        )
+        if not message:
+            logger.error(f"Failed to send payout notification to user {item['telegram_user_id']}, queued for retry")
+
+    def _write_csv(self, run, paid):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"payout-{run['run_id']}.csv")
+        with open(path + '.tmp', 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(paid)
+        os.replace(path + '.tmp', path)
+        return path
+
+    async def _send_csv(self, bot, run, paid, path):
+        caption = STRINGS['payout_run_admin_caption'].format(
+            run_id=run['run_id'],
+            count=len(paid),
+            total=sum(item['amount'] for item in paid),
+            skipped=len(run['items']) - len(paid),
+        )
+        for admin_id in self.admin_ids:
+            try:
+                with open(path, 'rb') as f:
+                    await bot.send_document(chat_id=admin_id, document=f, filename=os.path.basename(path), caption=caption)
+            except TelegramError as e:
+                # The file stays in the payout directory either way
+                logger.error(f"Could not send payout list {path} to admin {admin_id}: {e}")
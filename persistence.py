@@ -0,0 +1,101 @@
+# persistence.py - Conversation state and user_data stored in the bot database
+import json
+import logging
+from telegram.ext import BasePersistence, PersistenceInput
+import async_database
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+USER_DATA_NAMESPACE = 'user_data'
+CONVERSATION_NAMESPACE = 'conversation:'
+
+
+class DatabasePersistence(BasePersistence):
+    """
+    Keeps ConversationHandler states and context.user_data in the same
+    storage as database.py, so half-finished reports survive a restart.
+
+    The Application only hands us users touched since the last flush; on top
+    of that, a user's data is written only if it differs from what was last
+    stored, so each flush is proportional to what actually changed.
+    """
+
+    def __init__(self, update_interval=5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._user_data_snapshots = {}
+
+    # --- user_data ---
+
+    async def get_user_data(self):
+        stored = await async_database.get_state(USER_DATA_NAMESPACE)
+        user_data = {}
+        for key, data in stored.items():
+            user_data[int(key)] = data
+            self._user_data_snapshots[int(key)] = json.dumps(data, sort_keys=True, default=str)
+        return user_data
+
+    async def update_user_data(self, user_id, data):
+        serialized = json.dumps(data, sort_keys=True, default=str)
+        if self._user_data_snapshots.get(user_id) == serialized:
+            return
+        self._user_data_snapshots[user_id] = serialized
+        if data:
+            await async_database.put_state(USER_DATA_NAMESPACE, str(user_id), json.loads(serialized))
+        else:
+            await async_database.delete_state(USER_DATA_NAMESPACE, str(user_id))
+
+    async def drop_user_data(self, user_id):
+        self._user_data_snapshots.pop(user_id, None)
+        await async_database.delete_state(USER_DATA_NAMESPACE, str(user_id))
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    # --- Conversations ---
+
+    async def get_conversations(self, name):
+        stored = await async_database.get_state(CONVERSATION_NAMESPACE + name)
+        return {tuple(json.loads(key)): state for key, state in stored.items()}
+
+    async def update_conversation(self, name, key, new_state):
+        if new_state is None:
+            await async_database.delete_state(CONVERSATION_NAMESPACE + name, json.dumps(key))
+        else:
+            await async_database.put_state(CONVERSATION_NAMESPACE + name, json.dumps(key), new_state)
+
+    # --- Not stored ---
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Called on shutdown, after the last updates; commits queued writes."""
+        await async_database.flush()
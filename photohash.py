@@ -0,0 +1,160 @@
+# photohash.py - Perceptual hashing of report photos and near-duplicate search
+import asyncio
+import io
+import itertools
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it photo hashing is disabled
+    Image = None
+    print("Warning: Pillow is not installed. Photo duplicate detection is disabled.")
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+
+def dhash(image_bytes, hash_size=8):
+    """
+    Difference hash: shrink to (hash_size+1) x hash_size grayscale and record
+    whether each pixel is brighter than its right neighbour. Robust to
+    re-encoding, resizing and small crops. Returns a 64-bit int by default.
+    """
+    image = Image.open(io.BytesIO(image_bytes)).convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing for Hamming-distance search over 64-bit hashes.
+    Each hash is split into `chunks` substrings, each with its own hash table.
+    Two hashes within distance d must agree on at least one substring to
+    within d // chunks bits, so a search only probes those few buckets and
+    verifies the candidates found there, instead of scanning every hash.
+    """
+
+    def __init__(self, bits=64, chunks=4):
+        self.chunks = chunks
+        self.chunk_bits = bits // chunks
+        self.mask = (1 << self.chunk_bits) - 1
+        self.tables = [{} for _ in range(chunks)]
+        self.size = 0
+
+    def _parts(self, value):
+        return [(value >> (i * self.chunk_bits)) & self.mask for i in range(self.chunks)]
+
+    def _variants(self, part, radius):
+        # Every substring within `radius` bit flips of `part`
+        for flips in range(radius + 1):
+            for positions in itertools.combinations(range(self.chunk_bits), flips):
+                variant = part
+                for position in positions:
+                    variant ^= 1 << position
+                yield variant
+
+    def add(self, value, item):
+        self.size += 1
+        for table, part in zip(self.tables, self._parts(value)):
+            table.setdefault(part, []).append((value, item))
+
+    def search(self, value, max_distance):
+        """Returns (item, distance) pairs within max_distance, closest first."""
+        radius = max_distance // self.chunks
+        results = {}
+        for table, part in zip(self.tables, self._parts(value)):
+            for variant in self._variants(part, radius):
+                for other, item in table.get(variant, ()):
+                    if item not in results:
+                        distance = hamming(value, other)
+                        if distance <= max_distance:
+                            results[item] = distance
+        return sorted(results.items(), key=lambda result: result[1])
+
+
+async def telegram_downloader(bot, file_id):
+    """Downloads a file from Telegram and returns its bytes."""
+    telegram_file = await bot.get_file(file_id)
+    return bytes(await telegram_file.download_as_bytearray())
+
+
+class PhotoHasher:
+    """
+    Downloads report photos and hashes them in a process pool. prefetch()
+    starts the work as soon as the photo arrives; get_hash() at submit time
+    awaits it (or starts it, e.g. after a restart).
+    """
+
+    # Finished hashes for abandoned reports are dropped once this many are held
+    MAX_TASKS = 1000
+
+    def __init__(self, workers=2, downloader=telegram_downloader):
+        self.workers = workers
+        self.downloader = downloader
+        self.pool = None
+        self.tasks = {}
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    def start(self):
+        """
+        Starts the worker processes. Called by bot.main() before the database
+        is opened or any thread is started: the workers are forked from that
+        state, so they hold nothing but the imported modules and only ever run
+        dhash(). (Spawned workers would re-import bot.py as their main module.)
+        """
+        if self.enabled and self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+            # With fork, the executor starts every worker on its first submit
+            self.pool.submit(hamming, 0, 0).result()
+
+    def _executor(self):
+        if self.pool is None:
+            self.start()
+        return self.pool
+
+    async def _compute(self, bot, file_id):
+        data = await self.downloader(bot, file_id)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), dhash, data)
+
+    def prefetch(self, bot, file_id):
+        if not self.enabled or file_id in self.tasks:
+            return
+        if len(self.tasks) >= self.MAX_TASKS:
+            self.tasks = {key: task for key, task in self.tasks.items() if not task.done()}
+        self.tasks[file_id] = asyncio.create_task(self._compute(bot, file_id))
+
+    async def get_hash(self, bot, file_id, timeout=10):
+        """Returns the photo's hash as a hex string, or None if it could not be computed."""
+        if not self.enabled:
+            return None
+        self.prefetch(bot, file_id)
+        task = self.tasks.pop(file_id)
+        try:
+            value = await asyncio.wait_for(task, timeout)
+        except Exception as e:
+            logger.error(f"Could not hash photo {file_id}: {e}")
+            return None
+        return f"{value:016x}"
+
+    def shutdown(self):
+        for task in self.tasks.values():
+            task.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
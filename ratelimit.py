@@ -0,0 +1,150 @@
+# ratelimit.py - Telegram flood-limit aware scheduling for every outgoing bot request
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from metrics import telegram_seconds, telegram_errors
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+# Priority classes, passed as `rate_limit_args` on bot calls. Lower goes first.
+PRIORITY_REPLY = 0          # direct replies inside a conversation (the default)
+PRIORITY_NOTIFICATION = 1   # status/payout notices to a single user
+PRIORITY_BROADCAST = 2      # admin fan-out
+
+
+class TokenBucket:
+    """
+    A token bucket whose waiters are served by priority, then arrival order.
+    `rate` tokens are added per second up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters = []
+        self._counter = itertools.count()
+        self._dispatcher = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds):
+        """Hands out no tokens for `seconds` (used after a RetryAfter)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+    def is_idle(self):
+        self._refill()
+        return not self._waiters and self.tokens >= self.capacity
+
+    async def acquire(self, priority=PRIORITY_REPLY):
+        self._refill()
+        if not self._waiters and self.tokens >= 1 and time.monotonic() >= self.paused_until:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        while self._waiters:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+
+
+class FloodControlRateLimiter(BaseRateLimiter):
+    """
+    Applies Telegram's flood limits to every request that targets a chat:
+    a global bucket for the bot plus one bucket per chat (groups are slower).
+    Requests wait in priority order, and a RetryAfter pauses the affected
+    bucket and retries the request instead of failing it.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, group_rate=20 / 60, max_retries=3, max_idle_chats=10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_idle_chats = max_idle_chats
+        self.chat_buckets = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.max_idle_chats:
+                # Drop buckets that are full and have nobody waiting; they carry no state
+                self.chat_buckets = {key: b for key, b in self.chat_buckets.items() if not b.is_idle()}
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            # Allow a short burst so a reply followed by a keyboard doesn't stall
+            bucket = TokenBucket(rate, max(1, 3 * rate) if not is_group else 1)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    @staticmethod
+    async def _call(callback, args, kwargs, endpoint):
+        # Timed after the buckets let the request through, so this is Telegram's own latency
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            telegram_errors.inc(endpoint=endpoint)
+            raise
+        finally:
+            telegram_seconds.observe(time.perf_counter() - started, endpoint=endpoint)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # getUpdates, answerCallbackQuery, getFile, ... are not flood limited
+            return await self._call(callback, args, kwargs, endpoint)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        priority = rate_limit_args if isinstance(rate_limit_args, int) else PRIORITY_REPLY
+        chat_bucket = self._chat_bucket(chat_id)
+
+        for attempt in range(self.max_retries + 1):
+            await chat_bucket.acquire(priority)
+            await self.global_bucket.acquire(priority)
+            try:
+                return await self._call(callback, args, kwargs, endpoint)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    logger.error(f"{endpoint} to {chat_id} still rate limited after {attempt} retries")
+                    raise
+                delay = float(e.retry_after) + 0.1
+                logger.warning(f"RetryAfter on {endpoint} to {chat_id}, backing off {delay:.1f}s")
+                # A flood error may be chat-specific or global; pausing both is the safe choice
+                chat_bucket.pause(delay)
+                self.global_bucket.pause(delay)
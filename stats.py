@@ -0,0 +1,251 @@
+# stats.py - Incrementally maintained report/payout aggregates for the admin stats command
+import copy
+import heapq
+import itertools
+import logging
+import os
+import sys
+import threading
+from datetime import timedelta
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+STATS_NAMESPACE = 'stats'
+APPROVED_STATUS = 'onaylandı'
+REJECTED_STATUS = 'reddedildi'
+
+
+def _day(timestamp):
+    return (timestamp or '')[:10] or 'unknown'
+
+
+def _bump(counts, key, amount=1):
+    counts[key] = counts.get(key, 0) + amount
+    if not counts[key]:
+        del counts[key]
+
+
+class ReportStats:
+    """
+    Running totals kept next to the data they summarize:
+
+    - 'totals': users, reports, reports per status, ledger count/amount per kind
+    - 'day:YYYY-MM-DD': the same report and ledger figures for one day
+      (reports by submission day, ledger entries by creation day)
+    - 'user:<id>': reports and approved reports of one courier
+
+    database.py calls report_added / status_changed / ledger_added /
+    user_added on every write. Each returns the key/value writes for the
+    few documents it touched, which are committed in the same batch as the
+    record itself, so the stored aggregates never drift from the data.
+    Reading them (summary()) never scans reports or users.
+    """
+
+    TOP_N = 10
+
+    def __init__(self):
+        self.totals = {'users': 0, 'reports': 0, 'status': {}, 'ledger': {}}
+        self.days = {}
+        self.user_counts = {}
+        self.top = []
+        self._lock = threading.Lock()
+
+    # --- Loading ---
+
+    def load(self, storage):
+        """Reads stored aggregates. Returns False if there are none yet."""
+        found = False
+        for key, doc in storage.iter_kv(STATS_NAMESPACE):
+            found = True
+            if key == 'totals':
+                self.totals = doc
+            elif key.startswith('day:'):
+                self.days[key[4:]] = doc
+            elif key.startswith('user:'):
+                self.user_counts[int(key[5:])] = doc
+        self._rank_top()
+        return found
+
+    def rebuild(self, reports, ledger_entries, user_count):
+        """
+        Recomputes everything from the raw records and returns the writes
+        that replace the stored aggregates.
+        """
+        self.totals = {'users': user_count, 'reports': 0, 'status': {}, 'ledger': {}}
+        self.days = {}
+        self.user_counts = {}
+        for report in reports:
+            self._add_report(report)
+        for entry in ledger_entries:
+            self._add_ledger(entry)
+        self._rank_top()
+        return self.all_ops()
+
+    def all_ops(self):
+        ops = [self._op('totals', self.totals)]
+        ops += [self._op(f"day:{day}", doc) for day, doc in self.days.items()]
+        ops += [self._op(f"user:{user_id}", doc) for user_id, doc in self.user_counts.items()]
+        return ops
+
+    @staticmethod
+    def _op(key, doc):
+        # A copy, since the queued write is serialized later on the writer thread
+        return ('put_kv', (STATS_NAMESPACE, key, copy.deepcopy(doc)))
+
+    def _day_doc(self, day):
+        return self.days.setdefault(day, {'reports': 0, 'status': {}, 'ledger': {}})
+
+    def _user_doc(self, user_id):
+        return self.user_counts.setdefault(user_id, {'reports': 0, 'approved': 0})
+
+    # --- Updates ---
+
+    def _add_report(self, report):
+        status = report.get('status') or 'unknown'
+        day = self._day_doc(_day(report.get('submitted_at')))
+        user = self._user_doc(report['telegram_user_id'])
+        for doc in (self.totals, day):
+            doc['reports'] += 1
+            _bump(doc['status'], status)
+        user['reports'] += 1
+        if status == APPROVED_STATUS:
+            user['approved'] += 1
+
+    def _add_ledger(self, entry):
+        for doc in (self.totals, self._day_doc(_day(entry.get('created_at')))):
+            kind = doc['ledger'].setdefault(entry.get('kind') or 'unknown', {'count': 0, 'amount': 0})
+            kind['count'] += 1
+            kind['amount'] += entry.get('amount', 0)
+
+    def report_added(self, report):
+        with self._lock:
+            self._add_report(report)
+            if report.get('status') == APPROVED_STATUS:
+                self._user_approved_changed(report['telegram_user_id'], +1)
+            return self._report_ops(report)
+
+    def status_changed(self, report, old_status, new_status):
+        """`report` is the report before the change (for its user and day)."""
+        if old_status == new_status:
+            return []
+        with self._lock:
+            day = self._day_doc(_day(report.get('submitted_at')))
+            for doc in (self.totals, day):
+                _bump(doc['status'], old_status or 'unknown', -1)
+                _bump(doc['status'], new_status)
+            user_id = report['telegram_user_id']
+            delta = (new_status == APPROVED_STATUS) - (old_status == APPROVED_STATUS)
+            if delta:
+                self._user_doc(user_id)['approved'] += delta
+                self._user_approved_changed(user_id, delta)
+            return self._report_ops(report)
+
+    def ledger_added(self, entry):
+        with self._lock:
+            self._add_ledger(entry)
+            day = _day(entry.get('created_at'))
+            return [self._op('totals', self.totals), self._op(f"day:{day}", self.days[day])]
+
+    def user_added(self):
+        with self._lock:
+            self.totals['users'] += 1
+            return [self._op('totals', self.totals)]
+
+    def _report_ops(self, report):
+        day = _day(report.get('submitted_at'))
+        user_id = report['telegram_user_id']
+        return [
+            self._op('totals', self.totals),
+            self._op(f"day:{day}", self.days[day]),
+            self._op(f"user:{user_id}", self.user_counts[user_id]),
+        ]
+
+    # --- Top reporters ---
+
+    def _rank_top(self):
+        self.top = heapq.nlargest(
+            self.TOP_N,
+            ((doc['approved'], user_id) for user_id, doc in self.user_counts.items() if doc['approved'] > 0),
+        )
+
+    def _user_approved_changed(self, user_id, delta):
+        approved = self.user_counts[user_id]['approved']
+        in_top = any(entry_user == user_id for _, entry_user in self.top)
+        if delta < 0 and in_top:
+            # Only a top reporter losing an approval can let someone outside the list in
+            self._rank_top()
+            return
+        if in_top or len(self.top) < self.TOP_N or (approved, user_id) > self.top[-1]:
+            self.top = [(count, other) for count, other in self.top if other != user_id]
+            self.top.append((approved, user_id))
+            self.top.sort(reverse=True)
+            del self.top[self.TOP_N:]
+
+    # --- Reading ---
+
+    def summary(self, today, days=7):
+        """
+        Returns a snapshot of the totals, the last `days` daily rollups
+        (`today` is a date) and the top reporters as (user_id, approved).
+        """
+        with self._lock:
+            daily = []
+            for offset in range(days):
+                day = (today - timedelta(days=offset)).isoformat()
+                doc = self.days.get(day, {'reports': 0, 'status': {}, 'ledger': {}})
+                daily.append((day, doc['reports'], doc['status'].get(APPROVED_STATUS, 0), doc['status'].get(REJECTED_STATUS, 0)))
+            totals = self.totals
+            return {
+                'users': totals['users'],
+                'reports': totals['reports'],
+                'status': dict(totals['status']),
+                'ledger': {kind: dict(values) for kind, values in totals['ledger'].items()},
+                'daily': daily,
+                'top': [(user_id, approved) for approved, user_id in self.top],
+            }
+
+    def as_documents(self):
+        """Every aggregate as {key: doc}, for comparing against a rebuild."""
+        return {key: doc for _, (_, key, doc) in self.all_ops()}
+
+
+def main():
+    """Recomputes the aggregates from scratch and compares them with the stored ones."""
+    args = [arg for arg in sys.argv[1:] if arg != '--fix']
+    fix = '--fix' in sys.argv[1:]
+    if len(args) not in (1, 2):
+        print("Usage: python stats.py <kazabot.db | kazabot_db.json> [archive_dir] [--fix]")
+        sys.exit(1)
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    from storage import SQLiteStorage, TinyDBStorage
+    from archive import ReportArchive
+    path = args[0]
+    archive_dir = args[1] if len(args) == 2 else os.path.join(os.path.dirname(os.path.abspath(path)), 'archive')
+    storage = TinyDBStorage(path) if path.endswith('.json') else SQLiteStorage(path)
+    try:
+        stored = ReportStats()
+        stored.load(storage)
+        fresh = ReportStats()
+        hot_ids = set()
+        def hot_reports():
+            for report in storage.iter_reports():
+                hot_ids.add(report['report_id'])
+                yield report
+        archived = (report for report in ReportArchive(archive_dir).iter_reports() if report['report_id'] not in hot_ids)
+        ops = fresh.rebuild(itertools.chain(hot_reports(), archived), storage.iter_ledger(), sum(1 for _ in storage.iter_users()))
+        stored_docs, fresh_docs = stored.as_documents(), fresh.as_documents()
+        mismatched = sorted(key for key in stored_docs.keys() | fresh_docs.keys() if stored_docs.get(key) != fresh_docs.get(key))
+        for key in mismatched:
+            print(f"{key}: stored={stored_docs.get(key)} rebuilt={fresh_docs.get(key)}")
+        print(f"{len(fresh_docs)} aggregates checked, {len(mismatched)} mismatched")
+        if mismatched and fix:
+            stale = [('delete_kv', (STATS_NAMESPACE, key)) for key in stored_docs.keys() - fresh_docs.keys()]
+            storage.apply_batch(stale + ops)
+            print("Stored aggregates replaced with the rebuilt ones. Restart the bot to pick them up.")
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,543 @@
+# storage.py - Storage backends behind database.py
+import json
+import logging
+import sqlite3
+import threading
+from tinydb import TinyDB, Query
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import JSONStorage
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+
+class TinyDBStorage:
+    """
+    Legacy backend: the whole dataset lives in one TinyDB JSON file,
+    which is re-serialized on every commit. Writes go to TinyDB's cache and
+    are written out once per call (or once per batch in apply_batch). A
+    batch that fails part way is undone by dropping the cache, which
+    TinyDB then reads back from the file as of the last commit.
+    """
+    name = 'tinydb'
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = TinyDB(path, storage=CachingMiddleware(JSONStorage), indent=4)
+        # The file is only written at the end of a batch, never half way through one
+        self.db.storage.WRITE_CACHE_SIZE = float('inf')
+        self.reports = self.db.table('reports')
+        self.users = self.db.table('users')
+        self.ledger = self.db.table('ledger')
+        self.outbox = self.db.table('outbox')
+        self.kv = self.db.table('kv')
+        self.archived = self.db.table('archived_reports')
+
+    def apply_batch(self, ops):
+        """Applies a list of (operation, args) pairs with a single file write, all or none of them."""
+        with self.lock:
+            try:
+                for op, args in ops:
+                    getattr(self, '_' + op)(*args)
+                self.db.storage.flush()
+            except Exception:
+                self._rollback()
+                raise
+
+    def _rollback(self):
+        self.db.storage.cache = None
+        self.db.storage._cache_modified_count = 0
+        for table in (self.reports, self.users, self.ledger, self.outbox, self.kv, self.archived):
+            table.clear_cache()
+            table._next_id = None
+
+    def _commit(self, op, *args):
+        self.apply_batch([(op, args)])
+
+    # --- Reports ---
+
+    def insert_report(self, report):
+        self._commit('insert_report', report)
+
+    def _insert_report(self, report):
+        self.reports.insert(report)
+
+    def get_report(self, report_id):
+        Report = Query()
+        return self.reports.get(Report.report_id == report_id)
+
+    def update_report(self, report_id, fields):
+        self._commit('update_report', report_id, fields)
+
+    def _update_report(self, report_id, fields):
+        Report = Query()
+        self.reports.update(fields, Report.report_id == report_id)
+
+    def count_user_reports_since(self, user_id, since):
+        Report = Query()
+        return self.reports.count(
+            (Report.telegram_user_id == user_id) &
+            (Report.submitted_at >= since)
+        )
+
+    def iter_reports(self):
+        yield from self.reports.all()
+
+    def iter_report_chunks(self, since=None, chunk_size=1000):
+        # The JSON file is in memory already; sort it once and hand it out in slices
+        reports = [r for r in self.reports.all() if since is None or (r.get('submitted_at') or '') > since]
+        reports.sort(key=lambda r: (r.get('submitted_at') or '', r.get('report_id') or ''))
+        for i in range(0, len(reports), chunk_size):
+            yield reports[i:i + chunk_size]
+
+    # --- Users ---
+
+    def insert_user(self, user):
+        self._commit('insert_user', user)
+
+    def _insert_user(self, user):
+        self.users.insert(user)
+
+    def get_user(self, user_id):
+        User = Query()
+        return self.users.get(User.telegram_user_id == user_id)
+
+    def update_user(self, user_id, fields):
+        self._commit('update_user', user_id, fields)
+
+    def _update_user(self, user_id, fields):
+        User = Query()
+        self.users.update(fields, User.telegram_user_id == user_id)
+
+    def iter_users(self):
+        yield from self.users.all()
+
+    def iter_user_chunks(self, chunk_size=1000):
+        users = sorted(self.users.all(), key=lambda u: u.get('telegram_user_id') or 0)
+        for i in range(0, len(users), chunk_size):
+            yield users[i:i + chunk_size]
+
+    # --- Archived reports ---
+
+    def iter_archivable_reports(self, statuses, before, limit):
+        Report = Query()
+        reports = self.reports.search(Report.status.one_of(list(statuses)) & (Report.submitted_at < before))
+        reports.sort(key=lambda r: r.get('submitted_at') or '')
+        yield from reports[:limit]
+
+    def _archive_report(self, report_id, partition, photo_hash):
+        Report = Query()
+        self.reports.remove(Report.report_id == report_id)
+        self.archived.upsert(
+            {'report_id': report_id, 'partition': partition, 'photo_hash': photo_hash},
+            Report.report_id == report_id,
+        )
+
+    def get_archived_partition(self, report_id):
+        Report = Query()
+        item = self.archived.get(Report.report_id == report_id)
+        return item['partition'] if item else None
+
+    def iter_archived(self):
+        for item in self.archived.all():
+            yield item['report_id'], item['partition'], item.get('photo_hash')
+
+    # --- Balance ledger ---
+
+    def _insert_ledger_entry(self, entry):
+        self.ledger.insert(entry)
+
+    def iter_ledger(self, user_id=None):
+        if user_id is None:
+            yield from self.ledger.all()
+        else:
+            Entry = Query()
+            yield from self.ledger.search(Entry.telegram_user_id == user_id)
+
+    # --- Outbound message queue ---
+
+    def _insert_outbox(self, entry):
+        self.outbox.insert(entry)
+
+    def _update_outbox(self, outbox_id, fields):
+        Entry = Query()
+        self.outbox.update(fields, Entry.outbox_id == outbox_id)
+
+    def _delete_outbox(self, outbox_id):
+        Entry = Query()
+        self.outbox.remove(Entry.outbox_id == outbox_id)
+
+    def iter_outbox(self):
+        yield from self.outbox.all()
+
+    # --- Key/value namespaces (bot state) ---
+
+    def _put_kv(self, namespace, key, value):
+        Item = Query()
+        self.kv.upsert(
+            {'namespace': namespace, 'key': key, 'value': value},
+            (Item.namespace == namespace) & (Item.key == key),
+        )
+
+    def _delete_kv(self, namespace, key):
+        Item = Query()
+        self.kv.remove((Item.namespace == namespace) & (Item.key == key))
+
+    def iter_kv(self, namespace):
+        Item = Query()
+        for item in self.kv.search(Item.namespace == namespace):
+            yield item['key'], item['value']
+
+    def close(self):
+        self.db.close()
+
+
+class SQLiteStorage:
+    """
+    SQLite backend in WAL mode. Each user/report is a JSON document plus the
+    indexed columns we query on, so a write only touches the affected rows.
+    Every user/report write also stamps the row with a new `rev`, which lets
+    backup.py copy only the rows changed since its previous run.
+    """
+    name = 'sqlite'
+
+    # Tables whose rows carry a rev (see backup.py)
+    REV_TABLES = ('users', 'reports', 'archived_reports')
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            telegram_user_id INTEGER PRIMARY KEY,
+            balance NUMERIC NOT NULL DEFAULT 0,
+            doc TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS reports (
+            report_id TEXT PRIMARY KEY,
+            telegram_user_id INTEGER NOT NULL,
+            submitted_at TEXT NOT NULL,
+            status TEXT NOT NULL,
+            doc TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_reports_user_time ON reports (telegram_user_id, submitted_at);
+        CREATE INDEX IF NOT EXISTS idx_reports_status_time ON reports (status, submitted_at);
+        CREATE INDEX IF NOT EXISTS idx_reports_time ON reports (submitted_at, report_id);
+        CREATE TABLE IF NOT EXISTS ledger (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_user_id INTEGER NOT NULL,
+            amount NUMERIC NOT NULL,
+            kind TEXT NOT NULL,
+            ref TEXT UNIQUE,
+            balance_after NUMERIC NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_ledger_user ON ledger (telegram_user_id, entry_id);
+        CREATE TABLE IF NOT EXISTS outbox (
+            outbox_id TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            doc TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS kv (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            doc TEXT NOT NULL,
+            PRIMARY KEY (namespace, key)
+        );
+        CREATE TABLE IF NOT EXISTS archived_reports (
+            report_id TEXT PRIMARY KEY,
+            partition TEXT NOT NULL,
+            photo_hash TEXT,
+            rev INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_archived_reports_rev ON archived_reports (rev);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # One connection shared by all callers; the lock serializes access to it
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # FULL fsyncs the WAL on every commit, so a committed write survives power loss
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.executescript(self.SCHEMA)
+        self._add_rev_columns()
+        self.conn.commit()
+        self.rev = max(
+            self.conn.execute(f"SELECT COALESCE(MAX(rev), 0) FROM {table}").fetchone()[0]
+            for table in self.REV_TABLES
+        )
+
+    def _add_rev_columns(self):
+        # Databases created before incremental backups existed lack the column
+        for table in ('users', 'reports'):
+            columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+            if 'rev' not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN rev INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_rev ON {table} (rev)")
+
+    def _next_rev(self):
+        self.rev += 1
+        return self.rev
+
+    def is_empty(self):
+        with self.lock:
+            users = self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone()
+            reports = self.conn.execute("SELECT 1 FROM reports LIMIT 1").fetchone()
+        return users is None and reports is None
+
+    def apply_batch(self, ops):
+        """Applies a list of (operation, args) pairs in a single transaction."""
+        with self.lock, self.conn:
+            for op, args in ops:
+                getattr(self, '_' + op)(*args)
+
+    def _commit(self, op, *args):
+        self.apply_batch([(op, args)])
+
+    # --- Reports ---
+
+    def insert_report(self, report):
+        self._commit('insert_report', report)
+
+    def _insert_report(self, report, or_ignore=False, replace=False):
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE" if or_ignore else "INSERT"
+        self.conn.execute(
+            f"{verb} INTO reports (report_id, telegram_user_id, submitted_at, status, doc, rev) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                report['report_id'],
+                report['telegram_user_id'],
+                report.get('submitted_at') or '',
+                report.get('status') or 'pending',
+                json.dumps(report, ensure_ascii=False),
+                self._next_rev(),
+            ),
+        )
+
+    def get_report(self, report_id):
+        with self.lock:
+            row = self.conn.execute("SELECT doc FROM reports WHERE report_id = ?", (report_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_report(self, report_id, fields):
+        self._commit('update_report', report_id, fields)
+
+    def _update_report(self, report_id, fields):
+        row = self.conn.execute("SELECT doc FROM reports WHERE report_id = ?", (report_id,)).fetchone()
+        if not row:
+            return
+        report = json.loads(row[0])
+        report.update(fields)
+        self.conn.execute(
+            "UPDATE reports SET status = ?, doc = ?, rev = ? WHERE report_id = ?",
+            (report.get('status') or 'pending', json.dumps(report, ensure_ascii=False), self._next_rev(), report_id),
+        )
+
+    def count_user_reports_since(self, user_id, since):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM reports WHERE telegram_user_id = ? AND submitted_at >= ?",
+                (user_id, since),
+            ).fetchone()
+        return row[0]
+
+    def iter_reports(self):
+        """Every report, oldest first, read a chunk at a time (see iter_report_chunks)."""
+        for chunk in self.iter_report_chunks():
+            yield from chunk
+
+    def iter_report_chunks(self, since=None, chunk_size=1000):
+        """
+        Yields lists of reports submitted after `since` (all of them if it is
+        None), ordered by (submitted_at, report_id). Each chunk is one keyset
+        query that holds the lock only while it runs, so writers are not
+        blocked for the whole scan and memory stays at one chunk.
+        """
+        if since is None:
+            query = "SELECT submitted_at, report_id, doc FROM reports WHERE (submitted_at, report_id) > ('', '') ORDER BY submitted_at, report_id LIMIT ?"
+            params = (chunk_size,)
+        else:
+            query = "SELECT submitted_at, report_id, doc FROM reports WHERE submitted_at > ? ORDER BY submitted_at, report_id LIMIT ?"
+            params = (since, chunk_size)
+        while True:
+            with self.lock:
+                rows = self.conn.execute(query, params).fetchall()
+            if not rows:
+                return
+            yield [json.loads(doc) for _, _, doc in rows]
+            last_time, last_id, _ = rows[-1]
+            query = "SELECT submitted_at, report_id, doc FROM reports WHERE (submitted_at, report_id) > (?, ?) ORDER BY submitted_at, report_id LIMIT ?"
+            params = (last_time, last_id, chunk_size)
+
+    # --- Users ---
+
+    def insert_user(self, user):
+        self._commit('insert_user', user)
+
+    def _insert_user(self, user, or_ignore=False, replace=False):
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE" if or_ignore else "INSERT"
+        self.conn.execute(
+            f"{verb} INTO users (telegram_user_id, balance, doc, rev) VALUES (?, ?, ?, ?)",
+            (user['telegram_user_id'], user.get('balance', 0), json.dumps(user, ensure_ascii=False), self._next_rev()),
+        )
+
+    def get_user(self, user_id):
+        with self.lock:
+            row = self.conn.execute("SELECT doc FROM users WHERE telegram_user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_user(self, user_id, fields):
+        self._commit('update_user', user_id, fields)
+
+    def _update_user(self, user_id, fields):
+        row = self.conn.execute("SELECT doc FROM users WHERE telegram_user_id = ?", (user_id,)).fetchone()
+        if not row:
+            return
+        user = json.loads(row[0])
+        user.update(fields)
+        self.conn.execute(
+            "UPDATE users SET balance = ?, doc = ?, rev = ? WHERE telegram_user_id = ?",
+            (user.get('balance', 0), json.dumps(user, ensure_ascii=False), self._next_rev(), user_id),
+        )
+
+    def iter_users(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT doc FROM users").fetchall()
+        for (doc,) in rows:
+            yield json.loads(doc)
+
+    def iter_user_chunks(self, chunk_size=1000):
+        """Yields lists of users ordered by telegram_user_id, one keyset query per chunk."""
+        last_id = None
+        while True:
+            with self.lock:
+                if last_id is None:
+                    rows = self.conn.execute(
+                        "SELECT telegram_user_id, doc FROM users ORDER BY telegram_user_id LIMIT ?", (chunk_size,)
+                    ).fetchall()
+                else:
+                    rows = self.conn.execute(
+                        "SELECT telegram_user_id, doc FROM users WHERE telegram_user_id > ? ORDER BY telegram_user_id LIMIT ?",
+                        (last_id, chunk_size),
+                    ).fetchall()
+            if not rows:
+                return
+            yield [json.loads(doc) for _, doc in rows]
+            last_id = rows[-1][0]
+
+    # --- Archived reports ---
+
+    def iter_archivable_reports(self, statuses, before, limit):
+        """Oldest reports in one of `statuses` submitted before `before`, at most `limit`."""
+        placeholders = ', '.join('?' for _ in statuses)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT doc FROM reports WHERE status IN ({placeholders}) AND submitted_at < ? ORDER BY submitted_at LIMIT ?",
+                (*statuses, before, limit),
+            ).fetchall()
+        for (doc,) in rows:
+            yield json.loads(doc)
+
+    def _archive_report(self, report_id, partition, photo_hash, or_ignore=False):
+        self.conn.execute("DELETE FROM reports WHERE report_id = ?", (report_id,))
+        verb = "INSERT OR IGNORE" if or_ignore else "INSERT OR REPLACE"
+        self.conn.execute(
+            f"{verb} INTO archived_reports (report_id, partition, photo_hash, rev) VALUES (?, ?, ?, ?)",
+            (report_id, partition, photo_hash, self._next_rev()),
+        )
+
+    def get_archived_partition(self, report_id):
+        with self.lock:
+            row = self.conn.execute("SELECT partition FROM archived_reports WHERE report_id = ?", (report_id,)).fetchone()
+        return row[0] if row else None
+
+    def iter_archived(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT report_id, partition, photo_hash FROM archived_reports").fetchall()
+        yield from rows
+
+    # --- Balance ledger ---
+
+    LEDGER_COLUMNS = ('telegram_user_id', 'amount', 'kind', 'ref', 'balance_after', 'created_at')
+
+    def _insert_ledger_entry(self, entry, or_ignore=False):
+        verb = "INSERT OR IGNORE" if or_ignore else "INSERT"
+        self.conn.execute(
+            f"{verb} INTO ledger (telegram_user_id, amount, kind, ref, balance_after, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            tuple(entry.get(column) for column in self.LEDGER_COLUMNS),
+        )
+
+    def iter_ledger(self, user_id=None):
+        query = f"SELECT {', '.join(self.LEDGER_COLUMNS)} FROM ledger"
+        params = ()
+        if user_id is not None:
+            query += " WHERE telegram_user_id = ?"
+            params = (user_id,)
+        with self.lock:
+            rows = self.conn.execute(query + " ORDER BY entry_id", params).fetchall()
+        for row in rows:
+            yield dict(zip(self.LEDGER_COLUMNS, row))
+
+    # --- Outbound message queue ---
+
+    def _insert_outbox(self, entry, or_ignore=False):
+        verb = "INSERT OR IGNORE" if or_ignore else "INSERT OR REPLACE"
+        self.conn.execute(
+            f"{verb} INTO outbox (outbox_id, created_at, doc) VALUES (?, ?, ?)",
+            (entry['outbox_id'], entry['created_at'], json.dumps(entry, ensure_ascii=False)),
+        )
+
+    def _update_outbox(self, outbox_id, fields):
+        row = self.conn.execute("SELECT doc FROM outbox WHERE outbox_id = ?", (outbox_id,)).fetchone()
+        if not row:
+            return
+        entry = json.loads(row[0])
+        entry.update(fields)
+        self.conn.execute("UPDATE outbox SET doc = ? WHERE outbox_id = ?", (json.dumps(entry, ensure_ascii=False), outbox_id))
+
+    def _delete_outbox(self, outbox_id):
+        self.conn.execute("DELETE FROM outbox WHERE outbox_id = ?", (outbox_id,))
+
+    def iter_outbox(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT doc FROM outbox ORDER BY created_at").fetchall()
+        for (doc,) in rows:
+            yield json.loads(doc)
+
+    # --- Key/value namespaces (bot state) ---
+
+    def _put_kv(self, namespace, key, value, or_ignore=False):
+        verb = "INSERT OR IGNORE" if or_ignore else "INSERT OR REPLACE"
+        self.conn.execute(
+            f"{verb} INTO kv (namespace, key, doc) VALUES (?, ?, ?)",
+            (namespace, key, json.dumps(value, ensure_ascii=False)),
+        )
+
+    def _delete_kv(self, namespace, key):
+        self.conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def _clear_state(self, keep_namespaces=()):
+        # backup.py restores the kv and outbox tables as a whole
+        placeholders = ', '.join('?' for _ in keep_namespaces)
+        self.conn.execute(f"DELETE FROM kv WHERE namespace NOT IN ({placeholders})", tuple(keep_namespaces))
+        self.conn.execute("DELETE FROM outbox")
+
+    def iter_kv(self, namespace):
+        with self.lock:
+            rows = self.conn.execute("SELECT key, doc FROM kv WHERE namespace = ?", (namespace,)).fetchall()
+        for key, doc in rows:
+            yield key, json.loads(doc)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def open_storage(backend, tinydb_path, sqlite_path):
+    """Opens the configured storage backend ('sqlite' or 'tinydb')."""
+    if backend == 'tinydb':
+        logger.info(f"Using legacy TinyDB storage at {tinydb_path}")
+        return TinyDBStorage(tinydb_path)
+    if backend == 'sqlite':
+        logger.info(f"Using SQLite storage at {sqlite_path}")
+        return SQLiteStorage(sqlite_path)
+    raise ValueError(f"Unknown DATABASE_BACKEND: {backend!r} (expected 'sqlite' or 'tinydb')")
@@ -0,0 +1,27 @@
+# conftest.py - Test environment: config.py reads it at import time, so this runs first
+import os
+import tempfile
+import pytest
+
+os.environ['TELEGRAM_BOT_TOKEN'] = '1000000:test'
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = tempfile.mkdtemp(prefix='kazabot-tests-')
+os.environ['DATABASE_BACKEND'] = 'sqlite'
+os.environ['ADMIN_IDS'] = '90000000,90000001,90000002'
+os.environ['BACKUP_DIR'] = ''
+os.environ['METRICS_PORT'] = '0'
+os.environ['PAYOUT_SCAN_INTERVAL'] = '0'
+os.environ['WELCOME_PHOTO_FILE_ID'] = ''
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """database.py opened on an empty data directory of its own."""
+    import database
+
+    monkeypatch.setattr(database, 'SQLITE_DATABASE_PATH', str(tmp_path / 'kazabot.db'))
+    monkeypatch.setattr(database, 'DATABASE_PATH', str(tmp_path / 'kazabot_db.json'))
+    monkeypatch.setattr(database, 'WRITE_JOURNAL_DIR', str(tmp_path / 'journal'))
+    monkeypatch.setattr(database, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    database.init()
+    yield database
+    database.close_database()
@@ -0,0 +1,130 @@
+# test_async_database.py - Many coroutines submitting, reviewing and paying out at once
+import asyncio
+import random
+from datetime import datetime
+import async_database
+from async_database import InsufficientBalanceError
+from config import REWARD_AMOUNT
+
+COURIERS = 40
+REPORTS_PER_COURIER = 5
+ADMINS = (90000000, 90000001, 90000002)
+INITIAL_GRANT = 99
+PAYOUT_THRESHOLD = INITIAL_GRANT + REWARD_AMOUNT // 2
+PAYOUT_BATCH_SIZE = 4
+
+
+def _check_consistent(db, report_ids, approved, debits, payouts):
+    """Balances, the ledger and the report count agree with what was decided and paid."""
+    expected = {user_id: INITIAL_GRANT for user_id in range(1, COURIERS + 1)}
+    for report_id in approved:
+        expected[db.index.get_report(report_id)['telegram_user_id']] += REWARD_AMOUNT
+    for ref, (user_id, amount) in {**debits, **payouts}.items():
+        expected[user_id] -= amount
+    for user_id in range(1, COURIERS + 1):
+        assert db.get_user_balance(user_id) == expected[user_id]
+        ledger = db.get_user_ledger(user_id)
+        assert sum(entry['amount'] for entry in ledger) == expected[user_id]
+        assert ledger[-1]['balance_after'] == expected[user_id]
+        refs = [entry['ref'] for entry in ledger]
+        assert len(refs) == len(set(refs))
+        # Every debit that went through is in the ledger once, and nothing else was debited
+        paid = {entry['ref']: -entry['amount'] for entry in ledger if entry['kind'] == 'payout'}
+        assert paid == {ref: amount for ref, (owner, amount) in {**debits, **payouts}.items() if owner == user_id}
+    assert db.stats.summary(datetime.utcnow().date())['reports'] == len(report_ids)
+    assert sum(1 for _ in db.storage.iter_reports()) == len(report_ids)
+    assert {report['report_id'] for report in db.storage.iter_reports() if report['status'] == 'onaylandı'} == set(approved)
+
+
+def test_concurrent_submits_reviews_and_payouts(db):
+    rng = random.Random(5)
+    debits = {}  # ref -> (user_id, amount), for /odeme debits that went through
+    payouts = {}  # ref -> (user_id, amount), for payout run items that were debited
+
+    async def odeme(user_id, number):
+        # The same /odeme update delivered twice, as Telegram may after a timeout
+        ref, amount = f"payout:{ADMINS[0]}:{user_id * 100 + number}", rng.randint(5, 40)
+        results = await asyncio.gather(
+            *(async_database.debit_user_balance(user_id, amount, 'payout', ref=ref) for _ in range(2)),
+            return_exceptions=True,
+        )
+        assert all(result is None or isinstance(result, (int, InsufficientBalanceError)) for result in results)
+        if any(isinstance(result, int) for result in results):
+            debits[ref] = (user_id, amount)
+
+    async def courier(user_id, queue):
+        await async_database.get_or_create_user(user_id, f"kurye{user_id}")
+        for number in range(REPORTS_PER_COURIER):
+            location = [38.35 + rng.random() * 0.05, 27.18 + rng.random() * 0.05]
+            report_id = await async_database.save_report(user_id, {'location': location, 'description': 'test'})
+            await queue.put(report_id)
+            if rng.random() < 0.5:
+                await odeme(user_id, number)
+            await asyncio.sleep(0)
+
+    async def admin(admin_id, queue, decisions, started):
+        # Every admin sees every report, as they do in Telegram, and presses a button on it
+        while (report_id := await queue.get()) is not None:
+            approve = rng.random() < 0.7
+            decided = await async_database.review_reports(
+                [report_id], 'onaylandı' if approve else 'reddedildi', admin_id, REWARD_AMOUNT if approve else 0
+            )
+            for report, _ in decided:
+                decisions.append((report['report_id'], approve))
+            if len(decisions) >= COURIERS:
+                started.set()
+
+    async def payout_run(started):
+        # Starts once reviews are under way, then debits in small batches between the other writes
+        await started.wait()
+        run = await async_database.create_payout_run(PAYOUT_THRESHOLD)
+        assert run is not None
+        while run['applied'] < len(run['items']):
+            run = await async_database.apply_payout_run(run, PAYOUT_BATCH_SIZE)
+            await asyncio.sleep(0)
+        for item in run['items']:
+            if not item.get('skipped'):
+                user_id = item['telegram_user_id']
+                payouts[f"payout-run:{run['run_id']}:{user_id}"] = (user_id, item['amount'])
+        return run
+
+    async def main():
+        queues = [asyncio.Queue() for _ in ADMINS]
+        fan_out = asyncio.Queue()
+        decisions = []
+        started = asyncio.Event()
+
+        async def broadcast():
+            while (report_id := await fan_out.get()) is not None:
+                for queue in queues:
+                    await queue.put(report_id)
+            for queue in queues:
+                await queue.put(None)
+
+        admins = [asyncio.create_task(admin(admin_id, queue, decisions, started)) for admin_id, queue in zip(ADMINS, queues)]
+        broadcaster = asyncio.create_task(broadcast())
+        runner = asyncio.create_task(payout_run(started))
+        await asyncio.gather(*(courier(user_id, fan_out) for user_id in range(1, COURIERS + 1)))
+        await fan_out.put(None)
+        await broadcaster
+        await asyncio.gather(*admins)
+        run = await runner
+        await async_database.flush()
+        return decisions, run
+
+    decisions, run = asyncio.run(main())
+    report_ids = [report_id for report_id, _ in decisions]
+    approved = [report_id for report_id, approve in decisions if approve]
+
+    # Each report was decided exactly once, whichever admin got there first
+    assert len(report_ids) == COURIERS * REPORTS_PER_COURIER
+    assert len(set(report_ids)) == len(report_ids)
+    # Enough of each to have raced with the reviews
+    assert len(debits) >= 20 and len(payouts) >= PAYOUT_BATCH_SIZE
+    assert run['status'] == 'debited'
+    _check_consistent(db, report_ids, approved, debits, payouts)
+
+    # The same holds for what was committed, loaded again from storage
+    db.close_database()
+    db.init()
+    _check_consistent(db, report_ids, approved, debits, payouts)
@@ -0,0 +1,98 @@
+# test_backup.py - Backups taken and restored while the bot keeps writing
+import os
+import random
+import threading
+from backup import BackupManager, restore
+from storage import SQLiteStorage
+from archive import ReportArchive
+
+
+def _write_load(db, stop, rng):
+    """Couriers, reports, decisions, payouts, bot state and archival, until `stop` is set."""
+    user_id = 30000000
+    while not stop.is_set():
+        user_id += 1
+        db.get_or_create_user(user_id, f"kurye{user_id}")
+        report_id = db.save_report(user_id, {'location': [38.38 + rng.random() / 100, 27.2], 'description': 'test'})
+        if rng.random() < 0.7:
+            db.review_reports([report_id], 'onaylandı', 90000000, 100)
+        else:
+            db.review_reports([report_id], 'reddedildi', 90000000)
+        if rng.random() < 0.3:
+            db.debit_user_balance(user_id, 50, ref=f"payout:{user_id}")
+        db.put_state('user_data', str(user_id), {'report': {'step': rng.randrange(5)}})
+        if rng.random() < 0.5:
+            db.delete_state('user_data', str(user_id - 1))
+        db.save_outbox_message({'outbox_id': f"m{user_id}", 'method': 'send_message', 'kwargs': {'chat_id': user_id},
+                                'priority': 1, 'attempts': 0, 'created_at': '2024-01-01T00:00:00'})
+        if rng.random() < 0.5:
+            db.delete_outbox_message(f"m{user_id - 1}")
+        if rng.random() < 0.1:
+            db.archive_reports(-1, ('onaylandı', 'reddedildi'))
+        db.writes.flush()
+
+
+def _check_consistent(path):
+    """Every balance in the restored database matches its own ledger."""
+    storage = SQLiteStorage(path)
+    try:
+        ledger = {}
+        for entry in storage.iter_ledger():
+            ledger.setdefault(entry['telegram_user_id'], []).append(entry)
+        users = list(storage.iter_users())
+        for user in users:
+            entries = ledger.get(user['telegram_user_id'], [])
+            assert sum(entry['amount'] for entry in entries) == user['balance']
+            assert entries[-1]['balance_after'] == user['balance']
+        return users
+    finally:
+        storage.close()
+
+
+def _contents(path):
+    storage = SQLiteStorage(path)
+    try:
+        return (
+            sorted((user['telegram_user_id'], user['balance']) for user in storage.iter_users()),
+            sorted((report['report_id'], report['status']) for report in storage.iter_reports()),
+            sorted((entry['ref'], entry['amount']) for entry in storage.iter_ledger()),
+            sorted(storage.iter_kv('user_data')),
+            sorted(report_id for report_id, _, _ in storage.iter_archived()),
+            sorted(entry['outbox_id'] for entry in storage.iter_outbox()),
+        )
+    finally:
+        storage.close()
+
+
+def test_restore_while_writing(db, tmp_path):
+    backup_dir = str(tmp_path / 'backups')
+    backups = BackupManager(db.SQLITE_DATABASE_PATH, backup_dir, archive_dir=db.ARCHIVE_DIR)
+    stop = threading.Event()
+    writer = threading.Thread(target=_write_load, args=(db, stop, random.Random(3)))
+    writer.start()
+    try:
+        backups.snapshot()
+        restored = []
+        for i in range(6):
+            backups.delta()
+            # Restoring the latest backup while the next writes are going on
+            target = str(tmp_path / f"restored-{i}.db")
+            restore(backup_dir, target, archive_dir=str(tmp_path / f"archive-{i}"))
+            restored.append(len(_check_consistent(target)))
+        assert restored == sorted(restored) and restored[0] < restored[-1]
+    finally:
+        stop.set()
+        writer.join()
+
+    db.writes.flush()
+    backups.delta()
+    target = str(tmp_path / 'restored-final.db')
+    archive_dir = str(tmp_path / 'archive-final')
+    restore(backup_dir, target, archive_dir=archive_dir)
+    _check_consistent(target)
+    assert _contents(target) == _contents(db.SQLITE_DATABASE_PATH)
+    # Every archived report can be read back from the restored archive
+    archived = _contents(target)[4]
+    assert archived
+    assert {report['report_id'] for report in ReportArchive(archive_dir).iter_reports()} >= set(archived)
+    assert sorted(os.listdir(archive_dir)) == sorted(os.listdir(db.ARCHIVE_DIR))
@@ -0,0 +1,36 @@
+# test_export.py - A full export includes archived reports, once each
+import csv
+
+COURIER_ID = 20000601
+
+
+def _exported(db, path, since=None):
+    count, watermark = db.export_reports(str(path), since)
+    with open(path, encoding='utf-8') as f:
+        report_ids = [row['report_id'] for row in csv.DictReader(f)]
+    assert len(report_ids) == count
+    return report_ids, watermark
+
+
+def test_full_export_includes_archive(db, tmp_path):
+    db.get_or_create_user(COURIER_ID, 'kurye')
+    report_ids = [db.save_report(COURIER_ID, {'location': [38.38 + i / 100, 27.2]}) for i in range(6)]
+    for report_id in report_ids[:4]:
+        db.review_reports([report_id], 'onaylandı', 90000000, 100)
+    # Everything decided goes to the cold store; the two pending reports stay hot
+    assert db.archive_reports(-1, ('onaylandı',)) == 4
+    assert db.storage.get_archived_partition(report_ids[0])
+
+    exported, watermark = _exported(db, tmp_path / 'all.csv')
+    assert sorted(exported) == sorted(report_ids)
+    assert watermark == max(db.get_report_by_id(report_id)['submitted_at'] for report_id in report_ids)
+
+    # An incremental export after it has only what came since
+    assert _exported(db, tmp_path / 'none.csv', watermark)[0] == []
+    new_id = db.save_report(COURIER_ID, {'location': [38.5, 27.2]})
+    assert _exported(db, tmp_path / 'new.csv', watermark)[0] == [new_id]
+
+    # An archival run that wrote the file but never committed leaves a copy of a hot report behind
+    db.archive.append([db.get_report_by_id(new_id)])
+    exported, _ = _exported(db, tmp_path / 'again.csv')
+    assert sorted(exported) == sorted(report_ids + [new_id])
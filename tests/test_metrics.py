@@ -0,0 +1,146 @@
+# test_metrics.py - /metrics agrees with what one report through the real handlers did
+import asyncio
+import random
+import re
+from telegram import Update
+from telegram.ext import TypeHandler
+import photohash
+from benchmark import FakeTelegram, LoadDriver, plan_courier, courier_flow, admin_review
+from config import ADMIN_IDS
+from localization import STRINGS
+
+COURIER_ID = 20000401
+
+# Handler functions behind each courier/admin step (metrics label them by function name)
+STEP_HANDLERS = {
+    'start': ('start',),
+    'location': ('location',),
+    'photo': ('photo',),
+    'description': ('description', 'description_skip'),
+    'crash_time': ('crash_time_delta',),
+    'submit': ('submit',),
+    'review': ('review_handler',),
+}
+
+QUEUE_GAUGES = ('kazabot_write_behind_pending', 'kazabot_db_writer_backlog', 'kazabot_outbox_pending', 'kazabot_update_queue')
+
+METRIC_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL_PAIR = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text):
+    """Prometheus text format -> {(name, ((label, value), ...)): value}."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = METRIC_LINE.match(line)
+        assert match, f"Malformed metrics line: {line!r}"
+        name, labels, value = match.groups()
+        samples[(name, tuple(LABEL_PAIR.findall(labels or '')))] = float(value)
+    return samples
+
+
+async def http_get(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), body.decode('utf-8')
+
+
+async def scrape():
+    """GETs /metrics from the real endpoint; also checks that other paths are a 404."""
+    from metrics import start_http_server
+
+    server = await start_http_server('127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        status, text = await http_get(port, '/metrics')
+        missing_status, _ = await http_get(port, '/other')
+    finally:
+        server.close()
+        await server.wait_closed()
+    assert (status, missing_status) == (200, 404)
+    return parse_metrics(text)
+
+
+async def one_report(db):
+    """Sends one courier's report and one admin decision through the application."""
+    import bot
+    from handlers import zone_index
+
+    fake = FakeTelegram(ADMIN_IDS)
+    application = bot.build_application(request=fake)
+    driver = LoadDriver(application, timeout=10)
+    application.add_handler(TypeHandler(Update, driver.processed), group=1000)
+    await application.initialize()
+    await application.start()
+    try:
+        before = await scrape()
+        steps, content = plan_courier(COURIER_ID, random.Random(1), STRINGS, zone_index, 0, [])
+        fake.add_photo(content)
+        assert await courier_flow(driver, COURIER_ID, steps, 0)
+        # The admin fan-out runs in the background after the courier's reply
+        while len(fake.notifications) < len(ADMIN_IDS):
+            await asyncio.sleep(0.01)
+        admin_id, report_id, message = fake.notifications[0]
+        assert await admin_review(driver, admin_id, report_id, message, approve=True)
+        await asyncio.to_thread(db.writes.flush)
+        after = await scrape()
+    finally:
+        await application.stop()
+        await application.shutdown()
+    return before, after, driver, fake
+
+
+def test_metrics_after_one_report(db, monkeypatch):
+    import bot
+
+    # No photo hashing: its worker processes would be forked from the test run
+    monkeypatch.setattr(photohash, 'Image', None)
+    # Telegram's per-chat limit would hold each reply to the courier for a second
+    monkeypatch.setattr(bot, 'TELEGRAM_CHAT_RATE', 1000000)
+    before, after, driver, fake = asyncio.run(one_report(db))
+
+    def delta(name, **labels):
+        key = (name, tuple(labels.items()))
+        return after.get(key, 0) - before.get(key, 0)
+
+    # Every update the driver saw processed was timed by exactly one handler
+    for step, handlers in STEP_HANDLERS.items():
+        assert driver.processed_total[step] == 1
+        assert sum(delta('kazabot_handler_seconds_count', handler=handler) for handler in handlers) == 1, step
+        assert sum(delta('kazabot_handler_errors_total', handler=handler) for handler in handlers) == 0, step
+
+    # Database calls, and the group commit that wrote them
+    assert delta('kazabot_db_seconds_count', function='save_report') == 1
+    assert delta('kazabot_db_seconds_count', function='review_reports') == 1
+    assert delta('kazabot_db_seconds_count', function='save_admin_messages') == 1
+    assert delta('kazabot_db_commit_seconds_count') >= 1
+    assert delta('kazabot_db_committed_writes_total') > 0
+    for (name, labels), value in after.items():
+        if name.endswith('_errors_total') and name != 'kazabot_telegram_api_errors_total':
+            assert value == before.get((name, labels), 0), (name, labels)
+
+    # Bot API calls as the fake answered them
+    for endpoint in ('sendMessage', 'sendPhoto', 'answerCallbackQuery', 'editMessageCaption'):
+        assert delta('kazabot_telegram_api_seconds_count', endpoint=endpoint) == fake.calls[endpoint], endpoint
+
+    # Histogram buckets are cumulative and end at the count
+    for (name, labels), count in after.items():
+        if not name.endswith('_count') or (name[:-len('_count')] + '_bucket', labels + (('le', '+Inf'),)) not in after:
+            continue
+        buckets = sorted(
+            (float(dict(other_labels)['le']), seen) for (other, other_labels), seen in after.items()
+            if other == name[:-len('_count')] + '_bucket' and other_labels[:-1] == labels
+        )
+        assert all(earlier <= later for (_, earlier), (_, later) in zip(buckets, buckets[1:])), (name, labels)
+        assert buckets[-1][1] == count, (name, labels)
+
+    # Everything was delivered and committed, so nothing is left waiting
+    for name in QUEUE_GAUGES:
+        assert after[(name, ())] == 0, name
+    assert after[('kazabot_write_behind_stalled', ())] == 0
@@ -0,0 +1,55 @@
+# test_migrate.py - Moving from TinyDB to SQLite keeps every table, or refuses
+import json
+import pytest
+from migrate import migrate_tinydb_to_sqlite
+from storage import SQLiteStorage, TinyDBStorage
+
+
+def _legacy_file(path):
+    legacy = TinyDBStorage(str(path))
+    legacy.apply_batch([
+        ('insert_user', ({'telegram_user_id': 1, 'balance': 40},)),
+        ('insert_report', ({'report_id': 'hot', 'telegram_user_id': 1, 'submitted_at': '2024-05-01T10:00:00', 'status': 'pending'},)),
+        ('insert_report', ({'report_id': 'old', 'telegram_user_id': 1, 'submitted_at': '2024-01-01T10:00:00', 'status': 'onaylandı'},)),
+        ('archive_report', ('old', '2024-01', 'ab12')),
+        ('insert_ledger_entry', ({'telegram_user_id': 1, 'amount': 40, 'kind': 'credit', 'ref': 'report:old',
+                                  'balance_after': 40, 'created_at': '2024-01-02T10:00:00'},)),
+        ('insert_outbox', ({'outbox_id': 'm1', 'method': 'send_message', 'kwargs': {'chat_id': 1},
+                            'priority': 1, 'attempts': 2, 'created_at': '2024-05-01T10:00:00'},)),
+        ('put_kv', ('conversations', 'report_conversation', {'[1, 1]': 2})),
+        ('put_kv', ('export', '90000000', '2024-04-30T00:00:00')),
+    ])
+    legacy.close()
+
+
+def test_every_table_is_migrated(tmp_path):
+    _legacy_file(tmp_path / 'kazabot_db.json')
+    storage = SQLiteStorage(str(tmp_path / 'kazabot.db'))
+    for _ in range(2):
+        # The second run finds everything there already and changes nothing
+        assert migrate_tinydb_to_sqlite(str(tmp_path / 'kazabot_db.json'), storage) == (1, 1)
+
+    assert [user['balance'] for user in storage.iter_users()] == [40]
+    assert [report['report_id'] for report in storage.iter_reports()] == ['hot']
+    assert [entry['ref'] for entry in storage.iter_ledger()] == ['report:old']
+    assert [(entry['outbox_id'], entry['attempts']) for entry in storage.iter_outbox()] == [('m1', 2)]
+    assert dict(storage.iter_kv('conversations')) == {'report_conversation': {'[1, 1]': 2}}
+    assert dict(storage.iter_kv('export')) == {'90000000': '2024-04-30T00:00:00'}
+    assert list(storage.iter_archived()) == [('old', '2024-01', 'ab12')]
+    storage.close()
+
+
+def test_unknown_table_is_refused(tmp_path):
+    _legacy_file(tmp_path / 'kazabot_db.json')
+    with open(tmp_path / 'kazabot_db.json', encoding='utf-8') as f:
+        data = json.load(f)
+    data['payout_runs'] = {'1': {'run_id': 'x'}}
+    with open(tmp_path / 'kazabot_db.json', 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+    storage = SQLiteStorage(str(tmp_path / 'kazabot.db'))
+    with pytest.raises(RuntimeError, match='payout_runs'):
+        migrate_tinydb_to_sqlite(str(tmp_path / 'kazabot_db.json'), storage)
+    # Nothing was half copied
+    assert storage.is_empty()
+    storage.close()
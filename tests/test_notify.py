@@ -0,0 +1,65 @@
+# test_notify.py - The courier's reply doesn't wait for the admin notifications
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+import handlers
+
+COURIER_ID = 20000301
+SEND_DELAY = 0.5
+
+
+class SlowBot:
+    """A Bot whose send_photo takes SEND_DELAY seconds, like a slow Telegram API."""
+
+    def __init__(self):
+        self.sent = []  # (admin_id, time the photo was delivered)
+
+    async def send_photo(self, chat_id, rate_limit_args=None, **kwargs):
+        await asyncio.sleep(SEND_DELAY)
+        self.sent.append((chat_id, time.monotonic()))
+        return SimpleNamespace(chat_id=chat_id, message_id=len(self.sent))
+
+
+async def _submit():
+    """Runs submit for one report; returns (its latency, reply times, photo delivery times, admins notified)."""
+    bot = SlowBot()
+    tasks = []
+    replies = []
+    courier = SimpleNamespace(id=COURIER_ID, first_name='Kurye', username='kurye')
+
+    async def reply_text(text, **kwargs):
+        replies.append(time.monotonic())
+
+    update = SimpleNamespace(message=SimpleNamespace(from_user=courier, reply_text=reply_text), effective_user=courier)
+    context = SimpleNamespace(
+        bot=bot,
+        user_data={'report': {'location': [38.38, 27.2], 'photo': 'photo-file', 'description': 'test', 'crash_time_delta': 5}},
+        application=SimpleNamespace(create_task=lambda coroutine, update=None: tasks.append(asyncio.create_task(coroutine))),
+    )
+
+    started = time.monotonic()
+    await handlers.submit(update, context)
+    latency = time.monotonic() - started
+    await asyncio.gather(*tasks)
+    return latency, replies, [sent_at for _, sent_at in bot.sent], {admin_id for admin_id, _ in bot.sent}
+
+
+def test_courier_reply_comes_before_fan_out(db, monkeypatch):
+    monkeypatch.setattr(handlers.photo_hasher, 'get_hash', AsyncMock(return_value=None))
+    db.get_or_create_user(COURIER_ID, 'kurye')
+
+    latencies = {}
+    for admin_count in (1, 20):
+        admin_ids = [90000000 + i for i in range(admin_count)]
+        monkeypatch.setattr(handlers, 'ADMIN_IDS', admin_ids)
+        latencies[admin_count], replies, deliveries, notified = asyncio.run(_submit())
+
+        assert notified == set(admin_ids)
+        # Both replies (report_submitted and final_message) are out before any admin got the photo
+        assert len(replies) == 2 and max(replies) < min(deliveries)
+
+    # One send_photo takes SEND_DELAY; if the reply waited for the fan-out,
+    # 20 admins would add at least another SEND_DELAY to it
+    assert latencies[1] < SEND_DELAY / 2
+    assert latencies[20] < latencies[1] + SEND_DELAY / 2
@@ -0,0 +1,21 @@
+# test_payouts.py - A payout run batch applied twice debits once and keeps every result
+COURIER_IDS = (20000101, 20000102)
+
+
+def test_reapplied_batch_keeps_balance_after(db):
+    for user_id in COURIER_IDS:
+        db.get_or_create_user(user_id, f"kurye{user_id}")
+        db.update_user_balance(user_id, 300)
+    run = db.create_payout_run(200)
+
+    applied = db.apply_payout_run(run)
+    # e.g. a restart that resumes from a copy of the run saved before this batch committed
+    reapplied = db.apply_payout_run(run)
+
+    assert reapplied['status'] == 'debited'
+    for first, second in zip(applied['items'], reapplied['items']):
+        assert first['balance_after'] == second['balance_after'] == 0
+        assert 'skipped' not in second
+    for user_id in COURIER_IDS:
+        assert db.get_user_balance(user_id) == 0
+        assert [entry['kind'] for entry in db.get_user_ledger(user_id)].count('payout') == 1
@@ -0,0 +1,51 @@
+# test_photohash.py - A re-sent photo is flagged even after re-encoding or resizing; other photos are not
+import asyncio
+import random
+import pytest
+from PIL import Image
+from photohash import PhotoHasher
+
+COURIER_ID = 20000501
+
+
+def _photo(seed):
+    """A 640x480 photo-like image: coarse random blocks, smoothly upscaled."""
+    rng = random.Random(seed)
+    image = Image.new('L', (16, 12))
+    image.putdata([rng.randrange(256) for _ in range(16 * 12)])
+    return image.resize((640, 480), Image.BICUBIC).convert('RGB')
+
+
+@pytest.fixture
+def hasher():
+    # Started before the db fixture opens the database, as bot.main() does
+    photo_hasher = PhotoHasher(workers=1, downloader=None)
+    photo_hasher.start()
+    yield photo_hasher
+    photo_hasher.shutdown()
+
+
+def test_reused_photo_is_flagged(hasher, db, tmp_path):
+    original = _photo('kaza')
+    original.save(tmp_path / 'original.jpg', quality=90)
+    original.save(tmp_path / 'reencoded.jpg', quality=35)
+    original.resize((320, 240)).save(tmp_path / 'resized.png')
+    _photo('baska').save(tmp_path / 'unrelated.jpg', quality=90)
+
+    async def from_disk(bot, file_id):
+        return (tmp_path / file_id).read_bytes()
+
+    hasher.downloader = from_disk
+    db.get_or_create_user(COURIER_ID, 'kurye')
+
+    def submit(file_id):
+        photo_hash = asyncio.run(hasher.get_hash(None, file_id))
+        assert photo_hash is not None
+        report_id = db.save_report(COURIER_ID, {'location': [38.38, 27.2], 'photo': file_id, 'photo_hash': photo_hash})
+        return db.get_report_by_id(report_id)
+
+    first = submit('original.jpg')
+    assert 'photo_duplicate_of' not in first
+    for file_id in ('reencoded.jpg', 'resized.png'):
+        assert submit(file_id)['photo_duplicate_of'] == first['report_id'], file_id
+    assert 'photo_duplicate_of' not in submit('unrelated.jpg')
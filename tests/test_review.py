@@ -0,0 +1,111 @@
+# test_review.py - Only the first admin decision on a report is applied and paid
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+import handlers
+from config import ADMIN_IDS, REWARD_AMOUNT
+
+COURIER_ID = 20000001
+
+
+def _report(db):
+    db.get_or_create_user(COURIER_ID, 'kurye')
+    report_id = db.save_report(COURIER_ID, {'location': [38.38, 27.2], 'description': 'test'})
+    db.save_admin_messages(report_id, [(admin_id, 100 + i) for i, admin_id in enumerate(ADMIN_IDS)])
+    return report_id
+
+
+def _press(query_id, admin_id, data):
+    """An admin's button press on their own copy of the report notification."""
+    admin = SimpleNamespace(id=admin_id, username=f"admin{admin_id}")
+    query = SimpleNamespace(
+        id=query_id,
+        data=data,
+        from_user=admin,
+        message=SimpleNamespace(photo=[object()], caption='Yeni rapor', chat=SimpleNamespace(id=admin_id),
+                                message_id=100 + ADMIN_IDS.index(admin_id)),
+        answer=AsyncMock(),
+        edit_message_caption=AsyncMock(),
+    )
+    return SimpleNamespace(callback_query=query, effective_user=admin)
+
+
+def _context():
+    bot = MagicMock()
+    bot.send_message = AsyncMock(return_value=SimpleNamespace(chat_id=COURIER_ID, message_id=1))
+    bot.edit_message_caption = AsyncMock()
+    return SimpleNamespace(bot=bot, chat_data={})
+
+
+def _courier_messages(context):
+    return [call.kwargs['text'] for call in context.bot.send_message.call_args_list if call.kwargs['chat_id'] == COURIER_ID]
+
+
+def _credits(db, report_id):
+    return [entry for entry in db.get_user_ledger(COURIER_ID) if entry['ref'] == f"report:{report_id}"]
+
+
+def test_two_admins_pressing_at_once(db):
+    report_id = _report(db)
+    context = _context()
+    first, second = ADMIN_IDS[0], ADMIN_IDS[1]
+    presses = [_press(f"at-once-{first}", first, f"approve_{report_id}"), _press(f"at-once-{second}", second, f"reject_{report_id}")]
+
+    async def both():
+        await asyncio.gather(*(handlers.review_handler(press, context) for press in presses))
+    asyncio.run(both())
+
+    report = db.get_report_by_id(report_id)
+    assert report['status'] == 'onaylandı' and report['reviewed_by'] == first
+    assert len(_credits(db, report_id)) == 1
+    assert db.get_user_balance(COURIER_ID) == 99 + REWARD_AMOUNT
+    assert len(_courier_messages(context)) == 1
+    # The second admin is told someone else is on it, and changes nothing
+    assert presses[1].callback_query.answer.call_args.kwargs.get('show_alert')
+    presses[1].callback_query.edit_message_caption.assert_not_called()
+    # The deciding admin's copy is edited directly, the other admins' through the bot
+    presses[0].callback_query.edit_message_caption.assert_called_once()
+    assert {call.kwargs['chat_id'] for call in context.bot.edit_message_caption.call_args_list} == set(ADMIN_IDS[1:])
+
+
+def test_redelivered_callback(db, monkeypatch):
+    report_id = _report(db)
+    context = _context()
+    admin_id = ADMIN_IDS[0]
+
+    async def deliver(times):
+        for _ in range(times):
+            await handlers.review_handler(_press('redelivered-1', admin_id, f"approve_{report_id}"), context)
+    asyncio.run(deliver(3))
+    assert len(_credits(db, report_id)) == 1
+    assert len(_courier_messages(context)) == 1
+
+    # After a restart the callback and claim memory is gone; the database still refuses a second decision
+    monkeypatch.setattr(handlers, 'processed_callbacks', type(handlers.processed_callbacks)(60))
+    monkeypatch.setattr(handlers, 'review_claims', type(handlers.review_claims)(60))
+    press = _press('redelivered-1', ADMIN_IDS[2], f"reject_{report_id}")
+    asyncio.run(handlers.review_handler(press, context))
+    assert db.get_report_by_id(report_id)['status'] == 'onaylandı'
+    assert len(_credits(db, report_id)) == 1
+    assert db.get_user_balance(COURIER_ID) == 99 + REWARD_AMOUNT
+    assert len(_courier_messages(context)) == 1
+    assert press.callback_query.answer.call_args.kwargs.get('show_alert')
+
+
+def test_bulk_decision_updates_every_admin(db):
+    report_ids = [_report(db) for _ in range(3)]
+    context = _context()
+    admin_id = ADMIN_IDS[0]
+    context.chat_data['pending_pages'] = {500: report_ids}
+    press = _press('bulk-1', admin_id, 'pending_approve')
+    press.callback_query.message = SimpleNamespace(chat=SimpleNamespace(id=admin_id), message_id=500)
+    press.callback_query.edit_message_text = AsyncMock()
+
+    asyncio.run(handlers.pending_handler(press, context))
+    assert all(len(_credits(db, report_id)) == 1 for report_id in report_ids)
+    assert len(_courier_messages(context)) == len(report_ids)
+    # Every admin's notification of every report now shows the decision, and loses its buttons
+    edited = {(call.kwargs['chat_id'], call.kwargs['message_id']) for call in context.bot.edit_message_caption.call_args_list}
+    assert edited == {(chat_id, message_id) for report_id in report_ids for chat_id, message_id in db.get_report_by_id(report_id)['admin_messages']}
+    for call in context.bot.edit_message_caption.call_args_list:
+        assert 'ONAYLANDI' in call.kwargs['caption'] and f"@admin{admin_id}" in call.kwargs['caption']
@@ -0,0 +1,52 @@
+# test_update_processor.py - One chat flooding updates cannot hold up the others
+import asyncio
+from datetime import datetime
+from telegram import Chat, Message, Update
+from update_processor import PerChatUpdateProcessor
+
+
+def _update(update_id, chat_id):
+    chat = Chat(chat_id, Chat.PRIVATE)
+    return Update(update_id, message=Message(update_id, datetime.now(), chat, text='x'))
+
+
+def test_flooding_chat_is_capped():
+    async def scenario():
+        processor = PerChatUpdateProcessor(max_concurrent_updates=2, max_waiting_per_chat=3)
+        release = asyncio.Event()
+        handled = []
+
+        async def handle(chat_id):
+            await release.wait()
+            handled.append(chat_id)
+
+        async def quiet(chat_id):
+            handled.append(chat_id)
+
+        # 8 queue slots in total; without the cap this chat alone would take all of them
+        flood = [asyncio.create_task(processor.process_update(_update(i, 1), handle(1))) for i in range(30)]
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(processor.process_update(_update(100, 2), quiet(2)), 1)
+        release.set()
+        await asyncio.gather(*flood)
+        return handled
+
+    handled = asyncio.run(scenario())
+    assert handled[0] == 2
+    # The running update plus the 3 allowed to wait
+    assert handled.count(1) == 4
+
+
+def test_exempt_chat_is_not_capped():
+    async def scenario():
+        processor = PerChatUpdateProcessor(max_concurrent_updates=2, max_waiting_per_chat=3, exempt_ids=[1])
+        handled = []
+
+        async def handle(chat_id):
+            await asyncio.sleep(0)
+            handled.append(chat_id)
+
+        await asyncio.gather(*(processor.process_update(_update(i, 1), handle(1)) for i in range(6)))
+        return handled
+
+    assert asyncio.run(scenario()) == [1] * 6
@@ -0,0 +1,79 @@
+# test_writebehind.py - A failed commit loses nothing, and no write is shown that storage doesn't get
+import pytest
+from storage import SQLiteStorage, TinyDBStorage
+from writebehind import WriteBehindQueue, WritesStalledError
+
+
+def _user(user_id, balance=0):
+    return {'telegram_user_id': user_id, 'balance': balance}
+
+
+@pytest.mark.parametrize('mode', ['group', 'journal'])
+def test_failed_commit_stalls_until_retry_succeeds(tmp_path, mode):
+    storage = SQLiteStorage(str(tmp_path / 'kazabot.db'))
+    writes = WriteBehindQueue(storage, mode, interval=3600, journal_dir=str(tmp_path / 'journal'))
+    apply_batch, failures = storage.apply_batch, []
+
+    def failing(ops):
+        if not failures:
+            failures.append(ops)
+            raise OSError("disk full")
+        apply_batch(ops)
+
+    storage.apply_batch = failing
+    writes.submit('insert_user', _user(1))
+    writes.submit('update_user', 1, {'balance': 5})
+    with pytest.raises(OSError):
+        writes.flush()
+    with pytest.raises(WritesStalledError):
+        writes.check()
+    assert writes.pending_count() == 2
+
+    writes.flush()
+    writes.check()
+    assert [user['balance'] for user in storage.iter_users()] == [5]
+    writes.stop()
+    storage.close()
+
+
+def test_tinydb_batch_is_all_or_nothing(tmp_path):
+    storage = TinyDBStorage(str(tmp_path / 'kazabot_db.json'))
+    storage.apply_batch([('insert_user', (_user(1, 5),))])
+    with pytest.raises(AttributeError):
+        storage.apply_batch([
+            ('update_user', (1, {'balance': 9})),
+            ('insert_ledger_entry', ({'telegram_user_id': 1, 'amount': 4},)),
+            ('no_such_op', ()),
+        ])
+    assert [user['balance'] for user in storage.iter_users()] == [5]
+    assert list(storage.iter_ledger()) == []
+
+    # Retried on its own, the good part of the batch is applied once
+    storage.apply_batch([('update_user', (1, {'balance': 9})), ('insert_ledger_entry', ({'telegram_user_id': 1, 'amount': 4},))])
+    storage.close()
+    reopened = TinyDBStorage(str(tmp_path / 'kazabot_db.json'))
+    assert [user['balance'] for user in reopened.iter_users()] == [9]
+    assert len(list(reopened.iter_ledger())) == 1
+    reopened.close()
+
+
+def test_database_refuses_writes_while_stalled(db, monkeypatch):
+    db.get_or_create_user(20000201, 'kurye')
+    db.writes.flush()
+    apply_batch = db.storage.apply_batch
+
+    def failing(ops):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(db.storage, 'apply_batch', failing)
+    db.update_user_balance(20000201, 10)
+    with pytest.raises(OSError):
+        db.writes.flush()
+    with pytest.raises(WritesStalledError):
+        db.update_user_balance(20000201, 10)
+    # The refused write changed nothing in memory either
+    assert db.get_user_balance(20000201) == 109
+    assert db.get_stats()['ledger']['credit']['count'] == 1
+    monkeypatch.setattr(db.storage, 'apply_batch', apply_batch)
+    db.writes.flush()
+    assert db.update_user_balance(20000201, 10) == 119
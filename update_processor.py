@@ -0,0 +1,83 @@
+# update_processor.py - Concurrent update processing that keeps each chat in order
+import asyncio
+import logging
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from metrics import updates_dropped
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates from different chats concurrently, but updates from the
+    same chat strictly one after another, so a ConversationHandler never sees
+    a courier's PHOTO step before their LOCATION step has finished.
+
+    At most `max_concurrent_updates` handlers run at once. Updates that are
+    only waiting for their chat's turn do not count against that limit, so a
+    single busy chat cannot starve everyone else. Each chat may have at most
+    `max_waiting_per_chat` updates waiting behind its running one; anything
+    beyond that is dropped, so one chat sending a flood of updates (the
+    flood guard only runs once an update gets its turn) cannot take all
+    the queue slots the other chats need. Admins (`exempt_ids`) are never
+    dropped: they review reports in quick bursts of button presses.
+    """
+
+    # Updates waiting for their chat (beyond the running ones) before new ones queue up
+    QUEUE_FACTOR = 4
+
+    def __init__(self, max_concurrent_updates, max_waiting_per_chat=8, exempt_ids=()):
+        super().__init__(max_concurrent_updates * self.QUEUE_FACTOR)
+        self.running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.max_waiting_per_chat = max_waiting_per_chat
+        self.exempt_ids = set(exempt_ids)
+        self.chat_locks = {}
+        self.chat_waiters = {}  # chat -> its running update plus those waiting behind it
+        self._overflowing = set()
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return update.effective_user.id
+        # Anything we cannot attribute to a chat is processed on its own
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            async with self.running:
+                await coroutine
+            return
+
+        if self.chat_waiters.get(key, 0) > self.max_waiting_per_chat and key not in self.exempt_ids:
+            coroutine.close()
+            updates_dropped.inc(reason='chat_queue')
+            if key not in self._overflowing:
+                self._overflowing.add(key)
+                logger.warning(f"Dropping updates from chat {key}: {self.max_waiting_per_chat} already waiting")
+            return
+
+        lock = self.chat_locks.setdefault(key, asyncio.Lock())
+        self.chat_waiters[key] = self.chat_waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                async with self.running:
+                    await coroutine
+        finally:
+            self.chat_waiters[key] -= 1
+            if not self.chat_waiters[key]:
+                # Nobody else is queued for this chat; don't keep a lock per user forever
+                del self.chat_waiters[key]
+                del self.chat_locks[key]
+                self._overflowing.discard(key)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,102 @@
+# webhook.py - Minimal ASGI app and runner for receiving updates via webhook
+import json
+import logging
+from telegram import Update
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+
+def create_webhook_app(application, path, secret_token=None):
+    """
+    Returns a bare ASGI app that accepts Telegram updates on POST `path` and
+    puts them on the application's update queue. GET /healthz returns 200.
+    """
+
+    async def respond(send, status, body=b''):
+        await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            # Startup/shutdown of the bot is handled by run_webhook, not the server
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        if scope['path'] == '/healthz' and scope['method'] == 'GET':
+            await respond(send, 200, b'ok')
+            return
+        if scope['path'] != path or scope['method'] != 'POST':
+            await respond(send, 404)
+            return
+
+        headers = dict(scope['headers'])
+        if secret_token and headers.get(b'x-telegram-bot-api-secret-token', b'').decode() != secret_token:
+            logger.warning("Rejected webhook request with a wrong secret token")
+            await respond(send, 403)
+            return
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        try:
+            update = Update.de_json(json.loads(body), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.error(f"Could not parse webhook update: {e}")
+            await respond(send, 400)
+            return
+
+        await application.update_queue.put(update)
+        await respond(send, 200)
+
+    return app
+
+
+async def run_webhook(application, port, path, webhook_url=None, secret_token=None, drop_pending_updates=False):
+    """
+    Runs the application behind uvicorn until the server stops.
+    With `webhook_url` set, registers the webhook with Telegram first; without
+    it ("local" mode) the server just accepts whatever is POSTed to `path`.
+    """
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(
+        create_webhook_app(application, path, secret_token),
+        host='0.0.0.0',
+        port=port,
+        log_level='warning',
+    ))
+
+    try:
+        async with application:
+            # post_init/post_shutdown only run automatically under run_polling/run_webhook
+            if application.post_init:
+                await application.post_init(application)
+            if webhook_url:
+                await application.bot.set_webhook(
+                    url=webhook_url.rstrip('/') + path,
+                    secret_token=secret_token,
+                    allowed_updates=Update.ALL_TYPES,
+                    drop_pending_updates=drop_pending_updates,
+                )
+                logger.info(f"Webhook registered at {webhook_url.rstrip('/')}{path}")
+            await application.start()
+            logger.info(f"Webhook server listening on port {port}")
+            try:
+                await server.serve()
+            finally:
+                await application.stop()
+    finally:
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,281 @@
+# writebehind.py - Write-behind queue with group commit for the storage backend
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from metrics import db_commit_seconds, db_committed_writes
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+JOURNAL_NAMESPACE = 'journal'
+
+
+class WritesStalledError(RuntimeError):
+    """Raised for new writes while queued ones cannot be committed."""
+
+
+def commit_batches(storage, batches, final_ops=(), quarantine_dir=None):
+    """
+    Used when replaying the journal at start-up, before anything is loaded
+    into memory. Commits the `batches` (each a list of ops that must commit
+    together) and `final_ops` in one transaction. If that fails, each batch
+    is retried in a transaction of its own. Once the storage has shown it
+    works (another batch, or `final_ops` alone, committed), the batches that
+    still failed are bad writes: they are set aside in `quarantine_dir`
+    instead of keeping the bot from starting. Otherwise the storage itself
+    is failing and the error is raised.
+    """
+    try:
+        storage.apply_batch([op for batch in batches for op in batch] + list(final_ops))
+        return
+    except Exception as e:
+        logger.error(f"Commit of {len(batches)} write batches failed ({e}), retrying them one by one")
+    failed = []
+    for batch in batches:
+        try:
+            storage.apply_batch(batch)
+        except Exception as e:
+            failed.append((batch, e))
+    if final_ops:
+        storage.apply_batch(list(final_ops))
+    elif len(failed) == len(batches):
+        raise failed[0][1]
+    for batch, error in failed:
+        _quarantine(quarantine_dir, batch, error)
+
+
+def _quarantine(directory, batch, error):
+    logger.error(f"Dropping a write batch that cannot be committed ({error}): {batch}")
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    record = {'failed_at': datetime.utcnow().isoformat(), 'error': repr(error), 'ops': batch}
+    with open(os.path.join(directory, 'quarantine.jsonl'), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+
+class WriteJournal:
+    """
+    Append-only log in front of the write-behind queue. Each submitted batch
+    is appended to the current segment file and fdatasync'ed before submit
+    returns, which is one sequential write instead of a database commit.
+
+    When the queue commits, it rotates to a new segment and stores the
+    number of the last segment it covers in the same transaction
+    (kv 'journal'/'committed'); those segment files are then deleted.
+    After a crash, replay() applies the segments the database never got.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segment = 1
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+        # Two processes appending to (and discarding) the same segments would lose writes
+        self._lock = open(os.path.join(directory, 'lock'), 'w')
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock.close()
+            raise RuntimeError(f"The write journal in {directory} is in use by another process")
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:012d}.jsonl")
+
+    def _segments(self):
+        return sorted(
+            int(name[len('segment-'):-len('.jsonl')])
+            for name in os.listdir(self.directory)
+            if name.startswith('segment-') and name.endswith('.jsonl')
+        )
+
+    def replay(self, storage):
+        """Applies segments newer than the last commit. Call once, before any append. Returns batches replayed."""
+        committed = dict(storage.iter_kv(JOURNAL_NAMESPACE)).get('committed', {}).get('segment', 0)
+        segments = [segment for segment in self._segments() if segment > committed]
+        batches = []
+        for segment in segments:
+            with open(self._path(segment), 'rb') as f:
+                for line in f:
+                    try:
+                        batch = json.loads(line)
+                    except ValueError:
+                        # A torn last line: that submit never returned, so nobody relied on the write
+                        logger.warning(f"Ignoring an incomplete record at the end of journal segment {segment}")
+                        break
+                    batches.append([(op, args) for op, args in batch])
+        if segments:
+            self.replay_commit(storage, batches, segments[-1])
+            writes = sum(len(batch) for batch in batches)
+            logger.warning(f"Replayed {len(batches)} journaled write batches ({writes} writes) not committed before the last shutdown")
+        last = max([committed] + segments)
+        self.discard(last)
+        self.segment = last + 1
+        return len(batches)
+
+    def append(self, ops):
+        if self._file is None:
+            self._file = open(self._path(self.segment), 'ab')
+        self._file.write((json.dumps(ops, ensure_ascii=False) + '\n').encode('utf-8'))
+        self._file.flush()
+        os.fdatasync(self._file.fileno())
+
+    def rotate(self):
+        """Closes the current segment and returns its number; later appends start a new one."""
+        segment = self.segment
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.segment += 1
+        return segment
+
+    def replay_commit(self, storage, batches, segment):
+        """Commits replayed `batches` and the marker for `segment`, setting aside any that cannot commit."""
+        commit_batches(storage, batches, [self.marker(segment)], self.directory)
+
+    @staticmethod
+    def marker(segment):
+        """The write saying everything journaled up to `segment` is in the database."""
+        return ('put_kv', (JOURNAL_NAMESPACE, 'committed', {'segment': segment}))
+
+    def discard(self, upto):
+        for segment in self._segments():
+            if segment <= upto:
+                os.remove(self._path(segment))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._lock.close()
+
+
+class WriteBehindQueue:
+    """
+    Queues storage writes and commits them in batches.
+
+    In 'group' mode writes are collected for up to `interval` seconds (or until
+    `max_batch` writes are waiting) and committed in one transaction. Reads are
+    served from the in-memory indexes, so queued writes are already visible.
+    'journal' mode commits the same way, but first appends every write to a
+    WriteJournal in `journal_dir`, so a crash loses nothing that was
+    submitted. In 'fsync' mode every write is committed before submit() returns.
+
+    The in-memory indexes and statistics already show every queued write,
+    so a write is never dropped. If a group commit fails, its batches stay
+    queued in order and are retried on every flush, and until one succeeds
+    the queue is stalled: check() raises WritesStalledError, so database.py
+    refuses new writes instead of showing changes that may never be stored.
+    A write that can never commit keeps the bot read-only until it is
+    restarted; in 'journal' mode the restart sets it aside in
+    `journal_dir`/quarantine.jsonl (see commit_batches).
+    """
+
+    MODES = ('journal', 'group', 'fsync')
+
+    def __init__(self, storage, mode='group', interval=0.5, max_batch=500, journal_dir=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown DB_DURABILITY: {mode!r} (expected one of {', '.join(self.MODES)})")
+        self.storage = storage
+        self.mode = mode
+        self.interval = interval
+        self.max_batch = max_batch
+        self.journal_dir = journal_dir
+        self.journal = None
+        self._pending = []  # submitted batches, oldest first
+        self._pending_ops = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self.stalled = None  # the error of the last failed commit, until a commit succeeds
+        self._stopped = False
+        self._thread = None
+        if mode == 'journal':
+            self.journal = WriteJournal(journal_dir)
+            self.journal.replay(storage)
+        if mode != 'fsync':
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def check(self):
+        """Raises WritesStalledError if queued writes are failing to commit."""
+        if self.stalled is not None:
+            raise WritesStalledError(f"{self._pending_ops} writes cannot be committed: {self.stalled}")
+
+    def submit(self, op, *args):
+        """Queues a storage operation, e.g. submit('update_user', user_id, fields)."""
+        self.submit_batch([(op, args)])
+
+    def submit_batch(self, ops):
+        """Queues several (operation, args) pairs that must commit together."""
+        if self.mode == 'fsync' or self._stopped:
+            self.storage.apply_batch(ops)
+            return
+        with self._cond:
+            if self.journal:
+                self.journal.append(ops)
+            self._pending.append(list(ops))
+            self._pending_ops += len(ops)
+            if self._pending_ops >= self.max_batch:
+                self._cond.notify()
+
+    def flush(self):
+        """Commits everything queued so far. Safe to call from any thread."""
+        with self._flush_lock:
+            with self._cond:
+                batches, count = self._pending, self._pending_ops
+                self._pending, self._pending_ops = [], 0
+                # Everything taken here was journaled in this segment or an earlier one
+                segment = self.journal.rotate() if self.journal and batches else None
+            if not batches:
+                return
+            started = time.perf_counter()
+            ops = [op for batch in batches for op in batch]
+            try:
+                self.storage.apply_batch(ops if segment is None else ops + [self.journal.marker(segment)])
+            except Exception as e:
+                # Nothing was committed: put the batches back in front so the next flush retries them in order
+                with self._cond:
+                    self._pending[:0] = batches
+                    self._pending_ops += count
+                    if self.stalled is None:
+                        logger.error(f"Commit of {count} writes failed, refusing new writes until it succeeds: {e}")
+                    self.stalled = e
+                raise
+            if self.stalled is not None:
+                logger.warning("Queued writes committed again, accepting new writes")
+                self.stalled = None
+            if segment is not None:
+                self.journal.discard(segment)
+            db_commit_seconds.observe(time.perf_counter() - started)
+            db_committed_writes.inc(count)
+            logger.debug(f"Group commit of {count} writes")
+
+    def pending_count(self):
+        """Writes queued but not committed yet."""
+        return self._pending_ops
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                self._cond.wait(timeout=self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed, will retry: {e}")
+
+    def stop(self):
+        """Flushes pending writes and stops the background thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+        if self.journal:
+            self.journal.close()
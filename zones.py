@@ -0,0 +1,124 @@
+# zones.py - Service-zone geofencing with a precomputed grid over district polygons
+import json
+import logging
+import math
+import os
+
+# Enable logging
+logger = logging.getLogger(__name__)
+
+
+def point_in_ring(lat, lon, ring):
+    """Ray casting test against one ring of [lon, lat] points (GeoJSON order)."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class Zone:
+    """One district: a polygon (outer ring plus holes) or a multipolygon."""
+
+    def __init__(self, name, polygons):
+        self.name = name
+        self.polygons = polygons
+        points = [point for polygon in polygons for point in polygon[0]]
+        self.min_lon = min(p[0] for p in points)
+        self.max_lon = max(p[0] for p in points)
+        self.min_lat = min(p[1] for p in points)
+        self.max_lat = max(p[1] for p in points)
+
+    def contains(self, lat, lon):
+        for outer, *holes in self.polygons:
+            if point_in_ring(lat, lon, outer) and not any(point_in_ring(lat, lon, hole) for hole in holes):
+                return True
+        return False
+
+    def edges(self):
+        for polygon in self.polygons:
+            for ring in polygon:
+                for a, b in zip(ring, ring[1:] + ring[:1]):
+                    yield a, b
+
+
+class ZoneIndex:
+    """
+    Splits the map into `cell_degrees` cells once at load time. A cell that no
+    district boundary passes through is either entirely inside one district or
+    outside all of them, so most lookups are a single dict access; only cells
+    on a boundary fall back to point-in-polygon tests for the few districts
+    crossing that cell.
+    """
+
+    def __init__(self, zones, cell_degrees=0.005):
+        self.zones = zones
+        self.cell = cell_degrees
+        self.inside = {}
+        self.boundary = {}
+        for zone in zones:
+            self._index_zone(zone)
+        logger.info(f"Indexed {len(zones)} service zones into {len(self.inside) + len(self.boundary)} cells")
+
+    def _cell_of(self, lat, lon):
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
+
+    def _index_zone(self, zone):
+        # Conservatively mark every cell touched by an edge's bounding box as boundary
+        edge_cells = set()
+        for (lon1, lat1), (lon2, lat2) in zone.edges():
+            r1, c1 = self._cell_of(min(lat1, lat2), min(lon1, lon2))
+            r2, c2 = self._cell_of(max(lat1, lat2), max(lon1, lon2))
+            for r in range(r1, r2 + 1):
+                for c in range(c1, c2 + 1):
+                    edge_cells.add((r, c))
+        for cell in edge_cells:
+            self.boundary.setdefault(cell, []).append(zone)
+
+        r1, c1 = self._cell_of(zone.min_lat, zone.min_lon)
+        r2, c2 = self._cell_of(zone.max_lat, zone.max_lon)
+        for r in range(r1, r2 + 1):
+            for c in range(c1, c2 + 1):
+                if (r, c) in edge_cells:
+                    continue
+                center_lat, center_lon = (r + 0.5) * self.cell, (c + 0.5) * self.cell
+                if zone.contains(center_lat, center_lon):
+                    self.inside[(r, c)] = zone
+
+    def lookup(self, lat, lon):
+        """Returns the name of the zone containing the point, or None."""
+        cell = self._cell_of(lat, lon)
+        zone = self.inside.get(cell)
+        if zone is not None:
+            return zone.name
+        for zone in self.boundary.get(cell, ()):
+            if zone.contains(lat, lon):
+                return zone.name
+        return None
+
+
+def load_zones(path, name_property='name'):
+    """Reads Polygon/MultiPolygon features from a GeoJSON file into Zones."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    zones = []
+    for feature in data.get('features', []):
+        geometry = feature.get('geometry') or {}
+        name = (feature.get('properties') or {}).get(name_property, 'unknown')
+        if geometry.get('type') == 'Polygon':
+            zones.append(Zone(name, [geometry['coordinates']]))
+        elif geometry.get('type') == 'MultiPolygon':
+            zones.append(Zone(name, geometry['coordinates']))
+    return zones
+
+
+def load_zone_index(path):
+    """Builds a ZoneIndex from a GeoJSON file, or returns None if the file is missing."""
+    if not path or not os.path.exists(path):
+        print(f"Warning: Service zone file {path!r} not found. Locations will not be checked against zones.")
+        return None
+    return ZoneIndex(load_zones(path))